@@ -0,0 +1,205 @@
+# auth.py
+# Sessiya tokenlari: login’da beriladi, WebSocket ulanishi va REST so‘rovlarida DB’ga murojaatsiz
+# tekshiriladi. Token: base64url(JSON {sub, exp, jti}) + "." + base64url(HMAC-SHA256(secret, payload)).
+# Tekshirilgan tokenlar LRU keshida (AUTH_CACHE_SIZE) - qayta kelganda HMAC ham hisoblanmaydi,
+# faqat muddat va bekor qilinganlar ro‘yxati (jarayon xotirasida) tekshiriladi.
+#
+# Bekor qilish (logout): jti Redis hash’iga yoziladi va kanal orqali barcha workerlarga tarqatiladi,
+# har bir worker uni o‘z xotirasidagi ro‘yxatga qo‘shadi. Ishga tushganda hash’dan yuklanadi.
+# AUTH_SECRET berilmasa, tasodifiy kalit Redis’da bir marta yaratiladi va barcha workerlar
+# uni ishlatadi. Kalit o‘zgarsa, avvalgi tokenlarning hammasi yaroqsiz bo‘ladi.
+#
+# AUTH_REQUIRED=0 (standart): tokensiz WebSocket ulanishlari va eski klientlar ishlatadigan REST
+# route’lar (/upload, /messages, ... - current_user + ensure_user) qabul qilinadi, token berilsa
+# tekshiriladi. AUTH_REQUIRED=1: token majburiy. Egasi tekshiriladigan yangi route’lar (xona a’zolari,
+# /uploads sessiyalari - require_user) har doim token talab qiladi.
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import HTTPException, Request
+from config import AUTH_SECRET, AUTH_TOKEN_TTL, AUTH_REQUIRED, AUTH_CACHE_SIZE
+from database import get_redis
+from metrics import auth_checks
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = "auth:secret"
+REVOKED_KEY = "auth:revoked"  # hash: jti -> exp
+REVOKED_CHANNEL = "auth:revoked"
+
+
+class TokenError(Exception):
+    pass
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TokenService:
+    def __init__(self):
+        self.secret = AUTH_SECRET.encode() if AUTH_SECRET else None
+        self.cache = OrderedDict()  # {token: (username, exp, jti)} - imzosi tekshirilganlar
+        self.revoked = {}  # {jti: exp}
+        self.redis = None
+        self.pubsub = None
+        self._task = None
+
+    async def start(self):
+        self.redis = get_redis()
+        if self.secret is None:
+            await self.redis.set(SECRET_KEY, secrets.token_hex(32), nx=True)
+            self.secret = await self.redis.get(SECRET_KEY)
+            logger.warning("AUTH_SECRET berilmagan: Redis’dagi umumiy tasodifiy kalit ishlatiladi")
+        now = time.time()
+        expired = []
+        for jti, exp in (await self.redis.hgetall(REVOKED_KEY)).items():
+            if float(exp) > now:
+                self.revoked[jti.decode()] = float(exp)
+            else:
+                expired.append(jti)
+        if expired:
+            await self.redis.hdel(REVOKED_KEY, *expired)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(REVOKED_CHANNEL)
+        self._task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.pubsub is not None:
+            await self.pubsub.close()
+            self.pubsub = None
+
+    def issue(self, username: str):
+        # Qaytadi: (token, exp - unix vaqt)
+        exp = int(time.time()) + AUTH_TOKEN_TTL
+        payload = _b64(json.dumps({"sub": username, "exp": exp, "jti": secrets.token_hex(8)}).encode())
+        signature = hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()
+        return f"{payload}.{_b64(signature)}", exp
+
+    def _decode(self, token: str):
+        payload, _, signature = token.partition(".")
+        try:
+            expected = hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()
+            if not hmac.compare_digest(_unb64(signature), expected):
+                raise TokenError("Token imzosi noto‘g‘ri")
+            claims = json.loads(_unb64(payload))
+            return claims["sub"], claims["exp"], claims["jti"]
+        except (ValueError, KeyError, TypeError):
+            raise TokenError("Token noto‘g‘ri")
+
+    def verify(self, token: str) -> str:
+        # Qaytadi: username; yaroqsiz bo‘lsa TokenError
+        entry = self.cache.get(token)
+        if entry is not None:
+            self.cache.move_to_end(token)
+            auth_checks.inc("cache_hit")
+        else:
+            try:
+                entry = self._decode(token)
+            except TokenError:
+                auth_checks.inc("invalid")
+                raise
+            self.cache[token] = entry
+            if len(self.cache) > AUTH_CACHE_SIZE:
+                self.cache.popitem(last=False)
+            auth_checks.inc("verified")
+        username, exp, jti = entry
+        if exp <= time.time():
+            auth_checks.inc("expired")
+            raise TokenError("Token muddati tugagan")
+        if jti in self.revoked:
+            auth_checks.inc("revoked")
+            raise TokenError("Token bekor qilingan")
+        return username
+
+    def _revoke_local(self, jti: str, exp: float):
+        self.revoked[jti] = exp
+        if len(self.revoked) > AUTH_CACHE_SIZE:
+            now = time.time()
+            self.revoked = {j: e for j, e in self.revoked.items() if e > now}
+
+    async def revoke(self, token: str):
+        _, exp, jti = self._decode(token)
+        self._revoke_local(jti, exp)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(REVOKED_KEY, jti, exp)
+        pipe.publish(REVOKED_CHANNEL, f"{jti}:{exp}")
+        await pipe.execute()
+
+    async def _listen_loop(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                jti, _, exp = message["data"].decode().partition(":")
+                self._revoke_local(jti, float(exp))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token bekor qilish kanali xatosi: {str(e)}")
+                await asyncio.sleep(1)
+
+
+tokens = TokenService()
+
+
+def token_from(connection) -> Optional[str]:
+    # Request yoki WebSocket: "Authorization: Bearer <token>" yoki ?token= (brauzer WebSocket’i uchun)
+    header = connection.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:].strip()
+    return connection.query_params.get("token")
+
+
+def socket_allowed(websocket, username: str) -> bool:
+    # WebSocket ulanishi yo‘lidagi username nomidan ochilishi mumkinmi
+    token = token_from(websocket)
+    if token is None:
+        return not AUTH_REQUIRED
+    try:
+        return tokens.verify(token) == username
+    except TokenError:
+        return False
+
+
+async def current_user(request: Request) -> Optional[str]:
+    # FastAPI dependency: token egasi; token yo‘q va AUTH_REQUIRED=0 bo‘lsa None
+    token = token_from(request)
+    if token is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Token talab qilinadi")
+        return None
+    try:
+        return tokens.verify(token)
+    except TokenError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+
+async def require_user(request: Request) -> str:
+    # FastAPI dependency: kim so‘rov yuborayotgani aniq bo‘lishi shart bo‘lgan route’lar uchun
+    # (AUTH_REQUIRED=0 bo‘lsa ham tokensiz so‘rov 401)
+    user = await current_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Token talab qilinadi")
+    return user
+
+
+def ensure_user(user: Optional[str], username: str):
+    # So‘rov boshqa foydalanuvchi nomidan bo‘lsa 403
+    if user is not None and user != username:
+        raise HTTPException(status_code=403, detail="Boshqa foydalanuvchi nomidan so‘rov")
@@ -0,0 +1,85 @@
+# benchmarks/cache_memory.py
+# Redis xotirasini solishtirish: eski format (har bir yo‘nalish uchun alohida JSON satr,
+# messages:A:B va messages:B:A) va kanonik suhbat keshi (bitta sorted set + hash).
+#
+#   REDIS_URL=redis://localhost:6379/15 python benchmarks/cache_memory.py --conversations 2000 --messages 200
+#
+# Diqqat: tanlangan Redis bazasi FLUSHDB bilan tozalanadi - alohida DB raqamini bering.
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from redis.asyncio import Redis  # noqa: E402
+
+import cache  # noqa: E402
+import conversation  # noqa: E402
+from models import Message  # noqa: E402
+from database import REDIS_URL  # noqa: E402
+
+
+def make_conversation(index: int, count: int):
+    a, b = f"user{index}a", f"user{index}b"
+    start = datetime(2025, 1, 1)
+    messages = [
+        {
+            "msg_id": index * count + i + 1,
+            "sender": a if i % 2 else b,
+            "content": f"Xabar {i}: bugun uchrashamizmi?",
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            "edited": False,
+            "deleted": False,
+            "reaction": None,
+            "reply_to_id": None,
+            "type": "text",
+        }
+        for i in range(count)
+    ]
+    return a, b, messages
+
+
+async def used_memory(redis: Redis) -> int:
+    return (await redis.info("memory"))["used_memory"]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    redis = Redis.from_url(REDIS_URL)
+    dataset = [make_conversation(i, args.messages) for i in range(args.conversations)]
+    results = {}
+    try:
+        await redis.flushdb()
+        base = await used_memory(redis)
+        pipe = redis.pipeline(transaction=False)
+        for a, b, messages in dataset:
+            blob = json.dumps(messages)
+            for key in conversation.legacy_cache_keys(a, b):
+                pipe.set(key, blob, ex=3600)
+        await pipe.execute()
+        results["legacy (2 x JSON)"] = await used_memory(redis) - base
+
+        await redis.flushdb()
+        base = await used_memory(redis)
+        for a, b, messages in dataset:
+            await cache.fill(redis, conversation.cache_key(a, b), [Message.from_wire(m) for m in messages], has_more=False)
+        results["canonical zset+hash"] = await used_memory(redis) - base
+        await redis.flushdb()
+    finally:
+        await redis.close()
+
+    total = args.conversations * args.messages
+    print(f"{args.conversations} suhbat x {args.messages} xabar = {total} xabar")
+    for name, size in results.items():
+        print(f"{name:<22}{size / 1024 / 1024:>10.1f} MB{size / total:>10.0f} B/xabar")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
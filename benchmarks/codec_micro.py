@@ -0,0 +1,92 @@
+# benchmarks/codec_micro.py
+# Bitta xabarni encode/decode qilish narxi (mikrosekund) va 50 ta xabarlik "history"
+# freymini yig‘ish: keshdagi JSON’larni decode+encode qilish va codec.history_frame bilan
+# tayyor baytlarni ulash.
+#
+#   pip install orjson msgpack   # ixtiyoriy, o‘rnatilmaganlari o‘tkazib yuboriladi
+#   python benchmarks/codec_micro.py --number 100000
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import codec  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MESSAGE = {
+    "conversation_id": "dm:alice:bob",
+    "msg_id": 123456789012345,
+    "sender": "alice",
+    "content": "Salom! Bugun uchrashuvimiz soat nechada bo‘ladi? 🙂",
+    "timestamp": "2025-06-01T12:00:00.123456",
+    "edited": False,
+    "deleted": False,
+    "reaction": None,
+    "reply_to_id": None,
+    "type": "text",
+}
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def backends():
+    yield "json", stdlib_dumps, json.loads
+    if orjson is not None:
+        yield "orjson", orjson.dumps, orjson.loads
+    if msgpack is not None:
+        yield "msgpack", msgpack.packb, msgpack.unpackb
+
+
+def per_call_us(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'codec':<10}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, dumps, loads in backends():
+        data = dumps(MESSAGE)
+        enc = per_call_us(lambda: dumps(MESSAGE), args.number)
+        dec = per_call_us(lambda: loads(data), args.number)
+        print(f"{name:<10}{len(data):>8}{enc:>12.2f}{dec:>12.2f}")
+
+    # History sahifasi: keshdan kelgan baytlar
+    bodies = [codec.dumps({**MESSAGE, "msg_id": MESSAGE["msg_id"] + i}) for i in range(args.page)]
+
+    def reencode():
+        messages = [codec.loads(body) for body in bodies]
+        return codec.dumps({
+            "action": "history", "conversation_id": "dm:alice:bob", "messages": messages,
+            "before_id": messages[0]["msg_id"], "has_more": True,
+        })
+
+    def splice():
+        return codec.history_frame("dm:alice:bob", bodies, MESSAGE["msg_id"], True).json
+
+    assert json.loads(reencode()) == json.loads(splice())
+    number = max(1, args.number // args.page)
+    print(f"\nhistory freymi ({args.page} xabar, backend={'orjson' if codec.orjson else 'json'})")
+    print(f"{'decode+encode':<16}{per_call_us(reencode, number):>10.1f} us")
+    print(f"{'history_frame':<16}{per_call_us(splice, number):>10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
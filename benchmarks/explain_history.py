@@ -0,0 +1,91 @@
+# benchmarks/explain_history.py
+# Regressiya tekshiruvi: suhbat tarixi so‘rovlari katta jadvalda ham indeks bo‘yicha
+# bajarilishi (Seq Scan va Sort yo‘qligi) EXPLAIN orqali tekshiriladi.
+#
+#   python benchmarks/explain_history.py --rows 10000000
+#
+# Alohida explain_check sxemasida public.messages nusxasi (indekslari bilan) yaratiladi,
+# generate_series bilan to‘ldiriladi va crud.HISTORY_*_SQL so‘rovlari tekshiriladi.
+# Plan yomonlashsa 1 kodi bilan chiqadi. Avval server migratsiyalari bajarilgan bo‘lishi kerak.
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+
+SCHEMA = "explain_check"
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def check_plan(name: str, plan) -> bool:
+    nodes = list(walk(plan))
+    types = [node["Node Type"] for node in nodes]
+    # LIKE ... INCLUDING ALL indeks nomlarini o‘zgartiradi, shuning uchun shart bo‘yicha tekshiriladi
+    indexed = [node for node in nodes if "conversation_id" in node.get("Index Cond", "")]
+    ok = "Seq Scan" not in types and "Sort" not in types and bool(indexed)
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {' -> '.join(types)} {[n['Index Name'] for n in indexed]}")
+    return ok
+
+
+async def seed(conn, rows: int, conversations: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"CREATE TABLE {SCHEMA}.messages (LIKE public.messages INCLUDING ALL)")
+    await conn.execute(f"""
+        INSERT INTO {SCHEMA}.messages (id, sender_username, receiver_username, conversation_id, content, timestamp)
+        SELECT g,
+               'u' || (g % $2),
+               'v' || (g % $2),
+               'dm:u' || (g % $2) || ':v' || (g % $2),
+               'xabar ' || g,
+               now() - make_interval(secs => $1 - g)
+        FROM generate_series(1, $1) AS g
+    """, rows, conversations)
+    await conn.execute(f"ANALYZE {SCHEMA}.messages")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--keep", action="store_true", help="explain_check sxemasini o‘chirmaslik")
+    args = parser.parse_args()
+
+    await database.init_pool()
+    ok = True
+    try:
+        async with database.acquire() as conn:
+            print(f"{args.rows} qator yozilmoqda...")
+            await seed(conn, args.rows, args.conversations)
+            await conn.execute(f"SET search_path TO {SCHEMA}")
+            # Prepared statement generic plani ham indeksdan foydalanishi kerak
+            await conn.execute("SET plan_cache_mode = force_generic_plan")
+            conv_id = "dm:u42:v42"
+            checks = (
+                ("latest page", crud.HISTORY_LATEST_SQL, (conv_id, 51)),
+                ("before_id page", crud.HISTORY_BEFORE_SQL, (conv_id, args.rows // 2, 51)),
+            )
+            for name, sql, params in checks:
+                plan = json.loads(await conn.fetchval("EXPLAIN (FORMAT JSON) " + sql, *params))
+                ok = check_plan(name, plan[0]["Plan"]) and ok
+            await conn.execute("RESET plan_cache_mode")
+            await conn.execute("RESET search_path")
+            if not args.keep:
+                await conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    finally:
+        await database.close_pool()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# benchmarks/history_frames.py
+# Tarixni yuborish: har bir xabar alohida freym (eski usul) va "history" freymlari
+# (sahifa bitta massivda) solishtiriladi. Haqiqiy WebSocket ulanishi (websockets,
+# localhost) orqali freym/soniya va simdan o‘tgan baytlar o‘lchanadi, permessage-deflate
+# bilan va usiz.
+#
+#   python benchmarks/history_frames.py --sizes 1000 10000 100000 --page 50
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import websockets
+from websockets.asyncio.client import ClientConnection
+
+
+def make_messages(n: int):
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "msg_id": i,
+            "sender": "alice" if i % 2 else "bob",
+            "content": f"Salom, bu {i}-xabar. Qalaysan, ishlar yaxshimi?",
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            "edited": False,
+            "deleted": False,
+            "reaction": None,
+            "reply_to_id": None,
+            "type": "text",
+        }
+        for i in range(n)
+    ]
+
+
+# JSON encode vaqti ham o‘lchovga kiradi: freymlar server handler ichida yaratiladi
+def per_message_frames(messages):
+    for msg in messages:
+        yield json.dumps(msg)
+
+
+def history_frames(messages, page: int):
+    for i in range(0, len(messages), page):
+        chunk = messages[i:i + page]
+        yield json.dumps({"action": "history", "messages": chunk, "before_id": chunk[0]["msg_id"], "has_more": i > 0})
+
+
+class CountingProtocol(ClientConnection):
+    # Transport darajasida qabul qilingan baytlarni sanash (siqilgandan keyingi hajm)
+    bytes_received = 0
+
+    def data_received(self, data):
+        CountingProtocol.bytes_received += len(data)
+        super().data_received(data)
+
+
+async def transfer(make_frames, compression):
+    async def handler(ws):
+        for frame in make_frames():
+            await ws.send(frame)
+        await ws.close()
+
+    async with websockets.serve(handler, "127.0.0.1", 0, compression=compression) as server:
+        port = server.sockets[0].getsockname()[1]
+        CountingProtocol.bytes_received = 0
+        start = time.perf_counter()
+        async with websockets.connect(
+            f"ws://127.0.0.1:{port}", compression=compression, create_connection=CountingProtocol, max_size=None
+        ) as ws:
+            received = 0
+            async for _ in ws:
+                received += 1
+        elapsed = time.perf_counter() - start
+    return received, elapsed, CountingProtocol.bytes_received
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--page", type=int, default=50, help="history freymidagi xabarlar soni")
+    args = parser.parse_args()
+
+    print(f"{'messages':>9} {'mode':<20}{'frames':>9}{'seconds':>10}{'frames/s':>12}{'msgs/s':>12}{'wire KB':>11}")
+    for n in args.sizes:
+        messages = make_messages(n)
+        modes = (
+            ("per-message", lambda: per_message_frames(messages)),
+            ("history", lambda: history_frames(messages, args.page)),
+        )
+        for name, make_frames in modes:
+            for compression in (None, "deflate"):
+                received, elapsed, wire = await transfer(make_frames, compression)
+                mode = name + ("+deflate" if compression else "")
+                print(f"{n:>9} {mode:<20}{received:>9}{elapsed:>10.3f}{received / elapsed:>12.0f}"
+                      f"{n / elapsed:>12.0f}{wire / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
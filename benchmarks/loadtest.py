@@ -0,0 +1,422 @@
+# benchmarks/loadtest.py
+# Serverning yuklama testi: main.py’dagi FastAPI ilovasi lokal Postgres/Redis bilan ishga
+# tushiriladi, N ta foydalanuvchi /ws/{username}/{receiver} orqali juft-juft ulanadi va berilgan
+# tezlikda send/edit/react yuboradi. Keyin REST endpointlar (/register, /login, /users) o‘lchanadi.
+#
+#   docker compose -f benchmarks/docker-compose.yml up -d
+#   pip install -r requirements.txt -r benchmarks/requirements.txt
+#   python benchmarks/loadtest.py --users 500 --duration 30 --rate 2 --json result.json
+#   python benchmarks/loadtest.py --users 500 --duration 30 --rate 2 --compare result.json
+#
+# Natija: ulanish kechikishi (handshake + birinchi history freymi), yetkazish kechikishi
+# p50/p95/p99 (jo‘natuvchi yuborgandan qabul qiluvchi olguncha), xabar/soniya, server RSS
+# (barcha uvicorn workerlar yig‘indisi) va REST so‘rovlar kechikishi.
+# --compare: oldingi --json natijasiga nisbatan --tolerance dan ko‘p yomonlashsa 1 kodi bilan chiqadi.
+# --url bilan allaqachon ishlab turgan serverga ulanadi (server ishga tushirilmaydi, RSS o‘lchanmaydi).
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import websockets
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# benchmarks/docker-compose.yml bilan bir xil
+SERVER_ENV = {
+    "NEONDB_HOST": "127.0.0.1",
+    "NEONDB_PORT": "55432",
+    "NEONDB_USER": "chat",
+    "NEONDB_PASSWORD": "chat",
+    "NEONDB_DBNAME": "chat",
+    "NEONDB_SSLMODE": "disable",
+    "REDIS_URL": "redis://127.0.0.1:56379/0",
+    "SMTP_HOST": "127.0.0.1",
+    "SMTP_PORT": "51025",
+    "SMTP_STARTTLS": "0",
+    "SMTP_USER": "",
+    "MAIL_FROM": "chat@bench.local",
+}
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+
+    return {"count": len(values), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+
+# --- server va RSS ---
+
+def process_tree(pid: int):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def rss_bytes(pid: int) -> int:
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+def to_mb(value: int) -> float:
+    return round(value / 1024 / 1024, 1)
+
+
+async def sample_rss(pid: int, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        samples.append(rss_bytes(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_server(port: int, workers: int, log_path: str, extra_env: dict = None):
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **SERVER_ENV, **(extra_env or {})}, stdout=log, stderr=log,
+    )
+
+
+async def wait_ready(base: str, timeout: float = 60):
+    end = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.monotonic() < end:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError("Server ishga tushmadi")
+
+
+# --- WebSocket yuklamasi ---
+
+class WsStats:
+    def __init__(self):
+        self.connect = []
+        self.delivery = {"send": [], "edit": [], "react": []}
+        self.sent = {"send": 0, "edit": 0, "react": 0}
+        self.errors = 0
+        self.failed_connects = 0
+
+
+def stamp() -> str:
+    # Yuklama generatori bitta jarayon: perf_counter jo‘natuvchi va qabul qiluvchi uchun umumiy
+    return f"lt:{time.perf_counter():.6f}"
+
+
+def elapsed_since(value) -> float:
+    if isinstance(value, str) and value.startswith("lt:"):
+        return time.perf_counter() - float(value[3:])
+    return None
+
+
+async def read_loop(ws, name: str, stats: WsStats, own: list, own_set: set, peer: list, peer_set: set):
+    async for raw in ws:
+        msg = json.loads(raw)
+        action = msg.get("action")
+        if "error" in msg:
+            stats.errors += 1
+        elif action is None and "sender" in msg:
+            if msg["sender"] == name:
+                own.append(msg["msg_id"])
+                own_set.add(msg["msg_id"])
+            else:
+                peer.append(msg["msg_id"])
+                peer_set.add(msg["msg_id"])
+                latency = elapsed_since(msg.get("content"))
+                if latency is not None:
+                    stats.delivery["send"].append(latency)
+        elif action == "edit" and msg.get("msg_id") in peer_set:
+            latency = elapsed_since(msg.get("content"))
+            if latency is not None:
+                stats.delivery["edit"].append(latency)
+        elif action == "react" and msg.get("msg_id") in own_set:
+            latency = elapsed_since(msg.get("reaction"))
+            if latency is not None:
+                stats.delivery["react"].append(latency)
+
+
+class Phase:
+    # Hamma foydalanuvchi ulanib bo‘lgach yuklama bir vaqtda boshlanadi
+    def __init__(self, total: int, duration: float):
+        self.pending = total
+        self.duration = duration
+        self.started = asyncio.Event()
+        self.stop_at = None
+
+    def arrived(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self.stop_at = time.perf_counter() + self.duration
+            self.started.set()
+
+
+async def ws_user(base: str, name: str, peer_name: str, args, stats: WsStats, connect_gate: asyncio.Semaphore,
+                  phase: Phase):
+    async with connect_gate:
+        t0 = time.perf_counter()
+        try:
+            ws = await websockets.connect(f"{base}/ws/{name}/{peer_name}", max_size=None)
+            await ws.recv()  # ulanishdagi history freymi
+        except Exception:
+            stats.failed_connects += 1
+            phase.arrived()
+            return
+        stats.connect.append(time.perf_counter() - t0)
+    phase.arrived()
+
+    own, own_set, peer, peer_set = [], set(), [], set()
+    reader = asyncio.create_task(read_loop(ws, name, stats, own, own_set, peer, peer_set))
+    try:
+        # Boshlanish vaqtlari tasodifiy siljitiladi, aks holda hamma bir millisekundda yuboradi
+        await phase.started.wait()
+        await asyncio.sleep(random.random() / args.rate)
+        interval = 1.0 / args.rate
+        next_at = time.perf_counter()
+        while time.perf_counter() < phase.stop_at:
+            r = random.random()
+            if r < args.edit_ratio and own:
+                frame, kind = {"action": "edit", "msg_id": own[-1], "content": stamp()}, "edit"
+            elif r < args.edit_ratio + args.react_ratio and peer:
+                frame, kind = {"action": "react", "msg_id": random.choice(peer[-20:]), "reaction": stamp()}, "react"
+            else:
+                frame, kind = {"action": "send", "content": stamp()}, "send"
+            await ws.send(json.dumps(frame))
+            stats.sent[kind] += 1
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        # Yo‘ldagi xabarlar yetib kelishi uchun
+        await asyncio.sleep(args.drain)
+    finally:
+        reader.cancel()
+        await ws.close()
+
+
+async def run_ws(base: str, args) -> dict:
+    stats = WsStats()
+    run = uuid.uuid4().hex[:6]
+    pairs = max(1, args.users // 2)
+    gate = asyncio.Semaphore(args.connect_concurrency)
+    phase = Phase(pairs * 2, args.duration)
+    tasks = []
+    for i in range(pairs):
+        a, b = f"lt{run}-{i}a", f"lt{run}-{i}b"
+        tasks.append(ws_user(base, a, b, args, stats, gate, phase))
+        tasks.append(ws_user(base, b, a, args, stats, gate, phase))
+    await asyncio.gather(*tasks)
+
+    delivered = sum(len(v) for v in stats.delivery.values())
+    sent = sum(stats.sent.values())
+    return {
+        "users": pairs * 2,
+        "connect_ms": percentiles(stats.connect),
+        "failed_connects": stats.failed_connects,
+        "delivery_ms": {kind: percentiles(values) for kind, values in stats.delivery.items()},
+        "sent_per_sec": round(sent / args.duration, 1),
+        "delivered_per_sec": round(delivered / args.duration, 1),
+        "delivery_ratio": round(delivered / sent, 4) if sent else None,
+        "errors": stats.errors,
+    }
+
+
+# --- REST yuklamasi ---
+
+async def timed_requests(client: httpx.AsyncClient, make_request, count: int, concurrency: int) -> dict:
+    latencies, failures = [], 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal failures
+        async with gate:
+            t0 = time.perf_counter()
+            try:
+                response = await make_request(i)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - t0)
+            failures += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    wall = time.perf_counter() - start
+    return {**percentiles(latencies), "req_per_sec": round(count / wall, 1), "failures": failures}
+
+
+async def run_rest(base: str, args) -> dict:
+    run = uuid.uuid4().hex[:6]
+    users = [f"rest{run}-{i}" for i in range(max(1, args.rest_requests // 4))]
+    password = "parol123"
+    limits = httpx.Limits(max_connections=args.rest_concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+        register = await timed_requests(
+            client,
+            lambda i: client.post("/register", json={"username": users[i], "email": f"{users[i]}@bench.local",
+                                                     "password": password}),
+            len(users), args.rest_concurrency,
+        )
+        login = await timed_requests(
+            client,
+            lambda i: client.post("/login", json={"username": random.choice(users), "password": password}),
+            args.rest_requests, args.rest_concurrency,
+        )
+        search = await timed_requests(
+            client,
+            lambda i: client.get("/users", params={"query": f"rest{run}-{random.randint(0, 99)}"}),
+            args.rest_requests, args.rest_concurrency,
+        )
+    return {"register_ms": register, "login_ms": login, "users_ms": search}
+
+
+# --- natija ---
+
+def print_report(result: dict):
+    ws = result.get("ws")
+    if ws:
+        print(f"\nWebSocket: {ws['users']} foydalanuvchi, ulanmadi: {ws['failed_connects']}, xatolar: {ws['errors']}")
+        print(f"{'':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = [("connect", ws["connect_ms"])] + [(f"deliver {k}", v) for k, v in ws["delivery_ms"].items()]
+        for name, p in rows:
+            print(f"{name:<16}{p['count']:>8}{p['p50'] or '-':>10}{p['p95'] or '-':>10}{p['p99'] or '-':>10}")
+        print(f"yuborildi/s {ws['sent_per_sec']}, yetkazildi/s {ws['delivered_per_sec']}, "
+              f"yetkazilish ulushi {ws['delivery_ratio']}")
+    rest = result.get("rest")
+    if rest:
+        print("\nREST")
+        print(f"{'':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'fail':>7}")
+        for name, p in rest.items():
+            print(f"{name.replace('_ms', ''):<16}{p['count']:>8}{p['p50'] or '-':>10}{p['p95'] or '-':>10}"
+                  f"{p['p99'] or '-':>10}{p['req_per_sec']:>10}{p['failures']:>7}")
+    rss = result.get("rss")
+    if rss:
+        print(f"\nServer RSS: boshida {rss['start_mb']} MB, eng yuqori {rss['peak_mb']} MB, oxirida {rss['end_mb']} MB")
+
+
+def compare(result: dict, baseline: dict, tolerance: float):
+    # Kechikish (p95) va RSS oshishi, o‘tkazuvchanlik kamayishi tolerance dan katta bo‘lsa - regressiya
+    regressions = []
+
+    def check(path, new, old, higher_is_worse=True):
+        if new is None or old is None or old == 0:
+            return
+        change = (new - old) / old
+        if (change > tolerance) if higher_is_worse else (change < -tolerance):
+            regressions.append(f"{path}: {old} -> {new} ({change:+.0%})")
+
+    ws, old_ws = result.get("ws"), baseline.get("ws")
+    if ws and old_ws:
+        check("ws.connect.p95", ws["connect_ms"]["p95"], old_ws["connect_ms"]["p95"])
+        for kind in ws["delivery_ms"]:
+            check(f"ws.deliver.{kind}.p95", ws["delivery_ms"][kind]["p95"], old_ws["delivery_ms"][kind]["p95"])
+        check("ws.delivered_per_sec", ws["delivered_per_sec"], old_ws["delivered_per_sec"], higher_is_worse=False)
+    rest, old_rest = result.get("rest"), baseline.get("rest")
+    if rest and old_rest:
+        for name in rest:
+            check(f"rest.{name}.p95", rest[name]["p95"], old_rest[name]["p95"])
+            check(f"rest.{name}.req_per_sec", rest[name]["req_per_sec"], old_rest[name]["req_per_sec"],
+                  higher_is_worse=False)
+    if result.get("rss") and baseline.get("rss"):
+        check("rss.peak_mb", result["rss"]["peak_mb"], baseline["rss"]["peak_mb"])
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200, help="WebSocket foydalanuvchilar soni (juft-juft)")
+    parser.add_argument("--duration", type=float, default=30, help="yuklama davomiyligi (soniya)")
+    parser.add_argument("--rate", type=float, default=1.0, help="har bir foydalanuvchi uchun action/soniya")
+    parser.add_argument("--edit-ratio", type=float, default=0.1)
+    parser.add_argument("--react-ratio", type=float, default=0.1)
+    parser.add_argument("--drain", type=float, default=2.0, help="oxirida yetkazishni kutish (soniya)")
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--rest-requests", type=int, default=2000)
+    parser.add_argument("--rest-concurrency", type=int, default=50)
+    parser.add_argument("--skip-ws", action="store_true")
+    parser.add_argument("--skip-rest", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="ishlab turgan server, masalan http://127.0.0.1:8000")
+    parser.add_argument("--server-log", help="server chiqishini shu faylga yozish")
+    parser.add_argument("--json", help="natijani JSON faylga yozish")
+    parser.add_argument("--compare", help="oldingi --json natijasi bilan solishtirish")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    base = args.url or f"http://127.0.0.1:{args.port}"
+    server = None if args.url else start_server(args.port, args.workers, args.server_log)
+    rss_samples, stop_sampling = [], asyncio.Event()
+    result = {"config": {k: v for k, v in vars(args).items() if k not in ("json", "compare")}}
+    try:
+        await wait_ready(base)
+        sampler = None
+        if server is not None:
+            sampler = asyncio.create_task(sample_rss(server.pid, rss_samples, stop_sampling))
+        if not args.skip_ws:
+            result["ws"] = await run_ws(base.replace("http", "ws", 1), args)
+        if not args.skip_rest:
+            result["rest"] = await run_rest(base, args)
+        if sampler is not None:
+            stop_sampling.set()
+            await sampler
+            result["rss"] = {"start_mb": to_mb(rss_samples[0]), "peak_mb": to_mb(max(rss_samples)),
+                             "end_mb": to_mb(rss_samples[-1])}
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=15)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressiyalar:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nRegressiya yo‘q (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# benchmarks/login_throughput.py
+# Login o‘tkazuvchanligi (scrypt xeshi passwords.py pool’ida) va uning WebSocket yetkazishiga ta’siri:
+# foydalanuvchilar ro‘yxatdan o‘tkaziladi, keyin --target login/soniya tezlikda ochiq sikl bilan
+# login yuboriladi; shu vaqtda juft-juft socketlar yetkazish kechikishini o‘lchaydi.
+#
+#   docker compose -f benchmarks/docker-compose.yml up -d
+#   python benchmarks/login_throughput.py --target 50 --duration 20
+#   PASSWORD_HASH_EXECUTOR=process python benchmarks/login_throughput.py --target 100
+#
+# Erishilgan tezlik --target * 0.95 dan past bo‘lsa yoki yetkazish p99 yuklamasiz p99 * (1 + --tolerance)
+# + --slack-ms dan oshsa 1 kodi bilan chiqadi. Server muhitidagi PASSWORD_* o‘zgaruvchilari uzatiladi.
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import time
+import uuid
+
+import httpx
+
+from loadtest import percentiles, start_server, wait_ready
+from upload_isolation import measure
+
+PASSWORD = "parol123"
+
+
+def scrypt_cost_ms(n: int, r: int, p: int) -> float:
+    start = time.perf_counter()
+    hashlib.scrypt(PASSWORD.encode(), salt=os.urandom(16), n=n, r=r, p=p, dklen=32, maxmem=256 * n * r * p + 2**20)
+    return (time.perf_counter() - start) * 1000
+
+
+async def drive_logins(client: httpx.AsyncClient, users: list, target: float, duration: float):
+    latencies, failures, tasks = [], 0, []
+
+    async def one():
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            response = await client.post("/login", json={"username": random.choice(users), "password": PASSWORD})
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        failures += not ok
+
+    # Ochiq sikl: javobni kutmasdan jadval bo‘yicha yuboriladi (server sekinlashsa navbat o‘sadi)
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < duration:
+        tasks.append(asyncio.create_task(one()))
+        sent += 1
+        await asyncio.sleep(max(0.0, start + sent / target - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+    return {**percentiles(latencies), "per_sec": round((sent - failures) / wall, 1), "failures": failures}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", type=float, default=50, help="login/soniya")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--pairs", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=5.0, help="har bir juft uchun xabar/soniya")
+    parser.add_argument("--idle-seconds", type=float, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--slack-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--url", help="ishlab turgan server")
+    parser.add_argument("--server-log")
+    args = parser.parse_args()
+
+    n = int(os.getenv("PASSWORD_SCRYPT_N", "16384"))
+    r, p = int(os.getenv("PASSWORD_SCRYPT_R", "8")), int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+    print(f"scrypt n={n} r={r} p={p}: {scrypt_cost_ms(n, r, p):.1f} ms/xesh (bitta yadro)")
+
+    base = args.url or f"http://127.0.0.1:{args.port}"
+    extra_env = {k: v for k, v in os.environ.items() if k.startswith("PASSWORD_")}
+    server = None if args.url else start_server(args.port, 1, args.server_log, extra_env)
+    run = uuid.uuid4().hex[:6]
+    users = [f"login{run}-{i}" for i in range(args.users)]
+    try:
+        await wait_ready(base)
+        ws_base = base.replace("http", "ws", 1)
+        async with httpx.AsyncClient(base_url=base, timeout=60, limits=httpx.Limits(max_connections=500)) as client:
+            gate = asyncio.Semaphore(20)
+
+            async def register(username):
+                async with gate:
+                    await client.post("/register", json={
+                        "username": username, "email": f"{username}@bench.local", "password": PASSWORD
+                    })
+
+            await asyncio.gather(*(register(u) for u in users))
+
+            idle = []
+            await measure(ws_base, args, idle, duration=args.idle_seconds)
+
+            loaded = []
+            logins = asyncio.ensure_future(drive_logins(client, users, args.target, args.duration))
+            await measure(ws_base, args, loaded, until=logins)
+            result = logins.result()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=15)
+
+    print(f"\nlogin: maqsad {args.target}/s, erishildi {result['per_sec']}/s, xato {result['failures']}, "
+          f"p50 {result['p50']} ms, p95 {result['p95']} ms, p99 {result['p99']} ms")
+    print(f"\n{'':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    idle_p, loaded_p = percentiles(idle), percentiles(loaded)
+    for name, row in (("login’siz", idle_p), ("login paytida", loaded_p)):
+        print(f"{name:<16}{row['count']:>8}{row['p50'] or '-':>10}{row['p95'] or '-':>10}{row['p99'] or '-':>10}")
+
+    failed = False
+    if result["per_sec"] < args.target * 0.95:
+        print(f"\nMaqsadga erishilmadi: {result['per_sec']} < {args.target}")
+        failed = True
+    if not idle_p["count"] or not loaded_p["count"]:
+        print("\nXabarlar yetkazilmadi")
+        sys.exit(1)
+    limit = idle_p["p99"] * (1 + args.tolerance) + args.slack_ms
+    if loaded_p["p99"] > limit:
+        print(f"\nRegressiya: login paytida yetkazish p99 {loaded_p['p99']} ms > {limit:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
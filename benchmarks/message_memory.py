@@ -0,0 +1,81 @@
+# benchmarks/message_memory.py
+# 1M xabarni xotirada ushlab turish narxi: oldingi dict ko‘rinishi va models.Message (slots).
+# tracemalloc bilan o‘lchanadi, matnlar (content, timestamp) ikkala holatda ham bir xil.
+#
+#   python benchmarks/message_memory.py --messages 1000000
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from models import Message  # noqa: E402
+
+START = datetime(2025, 1, 1)
+
+
+def rows(count: int):
+    # asyncpg qatoriga o‘xshash kirish ma’lumotlari
+    for i in range(count):
+        yield {
+            "id": 10_000_000 + i,
+            "sender_username": "alice" if i % 2 else "bob",
+            "content": f"Xabar {i}: bugun uchrashamizmi?",
+            "timestamp": START + timedelta(seconds=i),
+            "edited": False,
+            "deleted": False,
+            "reaction": None,
+            "reply_to_id": None,
+            "type": "text",
+        }
+
+
+def as_dict(row) -> dict:
+    # user-015 gacha crud.message_row_to_dict qaytargan ko‘rinish
+    return {
+        "msg_id": row["id"],
+        "sender": row["sender_username"],
+        "content": row["content"] if not row["deleted"] else "This message was deleted",
+        "timestamp": row["timestamp"].isoformat(),
+        "edited": row["edited"],
+        "deleted": row["deleted"],
+        "reaction": row["reaction"] if row["reaction"] else None,
+        "reply_to_id": row["reply_to_id"] if row["reply_to_id"] else None,
+        "type": row["type"] or "text",
+    }
+
+
+def measure(name: str, build, count: int):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = [build(row) for row in rows(count)]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10}{size / 1024 / 1024:>10.1f} MB{size / count:>10.0f} B/xabar{elapsed:>10.2f} s")
+    return held
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{args.messages} xabar")
+    print(f"{'model':<10}{'memory':>13}{'per msg':>17}{'build':>12}")
+    held = measure("dict", as_dict, args.messages)
+    del held
+    held = measure("Message", Message.from_row, args.messages)
+    start = time.perf_counter()
+    for message in held:
+        message.to_wire()
+    print(f"Message.to_wire: {(time.perf_counter() - start) / args.messages * 1e9:.0f} ns/xabar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/multiworker_throughput.py
+# Worker soni oshganda yetkazish o‘tkazuvchanligi (xabar/soniya) qanday o‘sishini o‘lchaydi.
+# Har bir worker soni uchun uvicorn alohida ishga tushiriladi, juftliklar ulanadi va
+# jo‘natuvchilar xabar yuboradi; qabul qiluvchiga yetgan xabarlar sanaladi.
+#
+#   BROKER_BACKEND=redis python benchmarks/multiworker_throughput.py --workers 1 2 4 --pairs 200
+#
+# Postgres va Redis server bilan bir xil muhit o‘zgaruvchilaridan olinadi.
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import websockets
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+async def wait_ready(url: str, timeout: float = 30):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            async with websockets.connect(url):
+                return
+        except OSError:
+            await asyncio.sleep(0.3)
+    raise RuntimeError("Server ishga tushmadi")
+
+
+async def receiver_task(base: str, name: str, peer: str, tag: str, expected: int, done: asyncio.Event, counter: list):
+    async with websockets.connect(f"{base}/ws/{name}/{peer}") as ws:
+        done.set()
+        got = 0
+        while got < expected:
+            msg = json.loads(await ws.recv())
+            if str(msg.get("content", "")).startswith(tag):
+                got += 1
+        counter[0] += got
+
+
+async def sender_task(base: str, name: str, peer: str, tag: str, count: int):
+    async with websockets.connect(f"{base}/ws/{name}/{peer}") as ws:
+        for i in range(count):
+            await ws.send(json.dumps({"action": "send", "content": f"{tag}{i}"}))
+        # Echo’larni kutib olish (server yozishni tugatishi uchun)
+        await asyncio.sleep(0.5)
+
+
+async def run_once(port: int, pairs: int, messages: int):
+    base = f"ws://127.0.0.1:{port}"
+    tag = f"bench-{uuid.uuid4().hex[:8]}-"
+    counter = [0]
+    ready = [asyncio.Event() for _ in range(pairs)]
+    receivers = [
+        asyncio.create_task(receiver_task(base, f"r{i}", f"s{i}", tag, messages, ready[i], counter))
+        for i in range(pairs)
+    ]
+    await asyncio.gather(*(e.wait() for e in ready))
+    start = time.perf_counter()
+    await asyncio.gather(*(sender_task(base, f"s{i}", f"r{i}", tag, messages) for i in range(pairs)))
+    await asyncio.wait_for(asyncio.gather(*receivers), timeout=120)
+    elapsed = time.perf_counter() - start
+    return counter[0], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pairs", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=50, help="har bir jo‘natuvchi uchun")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8}{'delivered':>12}{'seconds':>10}{'msg/s':>12}")
+    baseline = None
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=ROOT,
+        )
+        try:
+            asyncio.run(wait_ready(f"ws://127.0.0.1:{args.port}/ws/probe/probe"))
+            delivered, elapsed = asyncio.run(run_once(args.port, args.pairs, args.messages))
+            rate = delivered / elapsed
+            baseline = baseline or rate
+            print(f"{workers:>8}{delivered:>12}{elapsed:>10.2f}{rate:>12.0f}  (x{rate / baseline:.2f})")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/room_fanout.py
+# Xonaga fan-out kechikishi xona hajmiga qarab: xabar publish qilingandan oxirgi a’zo
+# socketiga yozilguncha bo‘lgan vaqt (p50/p99).
+#
+#   python benchmarks/room_fanout.py --sizes 10,100,1000,5000 --messages 200
+#
+# "per-member" - har bir a’zo uchun alohida send_json (har safar JSON encode),
+# "encode-once" - broker.deliver_room: bitta codec.Frame (bir marta encode) barcha navbatlarga.
+# Socketlar soxta (tarmoqsiz), shuning uchun natija serverning o‘z CPU xarajatini ko‘rsatadi.
+# DB/Redis kerak emas: LocalBroker ishlatiladi.
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from broker import LocalBroker  # noqa: E402
+from codec import Frame  # noqa: E402
+from connection import ChatConnection  # noqa: E402
+
+CONV_ID = "room:1"
+
+
+class FakeWebSocket:
+    def __init__(self, done):
+        self.done = done
+
+    async def send_text(self, payload: str):
+        self.done()
+
+    async def close(self, code=1000):
+        pass
+
+
+def sample_message(i: int) -> dict:
+    return {
+        "conversation_id": CONV_ID,
+        "msg_id": 1_000_000 + i,
+        "sender": "alice",
+        "content": "Salom hammaga! " * 4,
+        "timestamp": "2025-06-01T12:00:00",
+        "edited": False,
+        "deleted": False,
+        "reaction": None,
+        "reply_to_id": None,
+        "type": "text",
+    }
+
+
+async def run(size: int, messages: int, mode: str):
+    broker = LocalBroker()
+    pending = {"left": 0}
+    finished = asyncio.Event()
+
+    def done():
+        pending["left"] -= 1
+        if pending["left"] == 0:
+            finished.set()
+
+    conns = []
+    for n in range(size):
+        conn = ChatConnection(FakeWebSocket(done), f"user{n}", queue_size=messages + 1)
+        conn.subscriptions.add(CONV_ID)
+        conn.start()
+        await broker.join_room(conn, CONV_ID)
+        conns.append(conn)
+
+    latencies = []
+    try:
+        for i in range(messages):
+            msg = sample_message(i)
+            pending["left"] = size
+            finished.clear()
+            start = time.perf_counter()
+            if mode == "per-member":
+                for conn in conns:
+                    await conn.send_json(msg)
+            else:
+                await broker.deliver_room(CONV_ID, Frame(msg))
+            await finished.wait()
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        for conn in conns:
+            await conn.stop()
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000,5000")
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'members':>8} {'mode':<12}{'p50 ms':>10}{'p99 ms':>10}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for mode in ("per-member", "encode-once"):
+            p50, p99 = await run(size, args.messages, mode)
+            print(f"{size:>8} {mode:<12}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+# benchmarks/slow_query_fanout.py
+# Bitta sessiya sekin so‘rov bajarayotganda boshqa foydalanuvchilarga xabar yetkazish
+# kechikishi (p50/p99) o‘zgarmasligini tekshiradi.
+#
+#   python benchmarks/slow_query_fanout.py --sleep 2 --rate 500
+#
+# Ikki rejim solishtiriladi:
+#   blocking - eski usul: psycopg2 so‘rovi async funksiya ichida (event loop to‘xtaydi)
+#   async    - crud/asyncpg orqali (event loop ishlashda davom etadi)
+# NEONDB_* / DB_* muhit o‘zgaruvchilari server bilan bir xil o‘qiladi.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import database  # noqa: E402
+from config import NEONDB_PARAMS  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def fanout_probe(duration: float, rate: int, latencies: list):
+    # Har bir "xabar" navbatga qo‘yiladi va alohida yetkazuvchi task uni oladi;
+    # qo‘yilgan va olingan vaqt orasidagi farq - fan-out kechikishi.
+    queue = asyncio.Queue()
+
+    async def deliver():
+        while True:
+            sent_at = await queue.get()
+            latencies.append(time.perf_counter() - sent_at)
+
+    consumer = asyncio.create_task(deliver())
+    interval = 1 / rate
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        queue.put_nowait(time.perf_counter())
+        await asyncio.sleep(interval)
+    await asyncio.sleep(0.05)
+    consumer.cancel()
+
+
+async def blocking_slow_query(seconds: float):
+    import psycopg2
+    conn = psycopg2.connect(**NEONDB_PARAMS)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", (seconds,))
+    finally:
+        conn.close()
+
+
+async def async_slow_query(seconds: float):
+    async with database.acquire() as conn:
+        await conn.execute("SELECT pg_sleep($1)", seconds)
+
+
+async def run(mode: str, sleep: float, rate: int):
+    latencies = []
+    probe = asyncio.create_task(fanout_probe(sleep + 1.0, rate, latencies))
+    await asyncio.sleep(0.5)
+    slow = blocking_slow_query if mode == "blocking" else async_slow_query
+    await slow(sleep)
+    await probe
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sleep", type=float, default=2.0, help="sekin so‘rov davomiyligi (soniya)")
+    parser.add_argument("--rate", type=int, default=500, help="soniyasiga yetkaziladigan xabarlar")
+    parser.add_argument("--mode", choices=["blocking", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    await database.init_pool()
+    try:
+        modes = ["blocking", "async"] if args.mode == "both" else [args.mode]
+        print(f"{'mode':<10}{'n':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for mode in modes:
+            lat = await run(mode, args.sleep, args.rate)
+            print(f"{mode:<10}{len(lat):>8}{percentile(lat, 50) * 1000:>10.2f}"
+                  f"{percentile(lat, 99) * 1000:>10.2f}{max(lat, default=0) * 1000:>10.2f}")
+    finally:
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+# benchmarks/upload_isolation.py
+# Katta fayl yuklashlar chat yetkazishini sekinlashtirmasligini tekshirish: juft-juft socketlar
+# bir-biriga xabar yuboradi, avval yuklamasiz, keyin bir vaqtda bir nechta 100 MB yuklash
+# (davom ettiriladigan /uploads va bitta so‘rovli /upload) davomida yetkazish kechikishi o‘lchanadi.
+# Server STORAGE_BACKEND=local bilan ishga tushiriladi (Cloudinary kerak emas).
+#
+#   docker compose -f benchmarks/docker-compose.yml up -d
+#   python benchmarks/upload_isolation.py --uploads 4 --legacy-uploads 1 --size-mb 100
+#
+# Yuklash davomidagi p99 yuklamasiz p99 * (1 + --tolerance) + --slack-ms dan oshsa 1 kodi bilan chiqadi.
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import websockets
+
+from loadtest import percentiles, start_server, wait_ready, stamp, elapsed_since
+
+PIECE = bytes(range(256)) * 4096  # 1 MB, har safar qayta ishlatiladi
+
+
+async def body(size: int):
+    sent = 0
+    while sent < size:
+        piece = PIECE[:min(len(PIECE), size - sent)]
+        sent += len(piece)
+        yield piece
+
+
+async def ping_pair(base: str, name: str, rate: float, latencies: list, stop: asyncio.Event):
+    a, b = f"{name}a", f"{name}b"
+    sender = await websockets.connect(f"{base}/ws/{a}/{b}", max_size=None)
+    receiver = await websockets.connect(f"{base}/ws/{b}/{a}", max_size=None)
+    await sender.recv()
+    await receiver.recv()
+
+    async def read():
+        async for raw in receiver:
+            msg = json.loads(raw)
+            latency = elapsed_since(msg.get("content")) if msg.get("sender") == a else None
+            if latency is not None:
+                latencies.append(latency)
+
+    reader = asyncio.create_task(read())
+    await asyncio.sleep(random.random() / rate)
+    try:
+        while not stop.is_set():
+            await sender.send(json.dumps({"action": "send", "content": stamp()}))
+            try:
+                await asyncio.wait_for(stop.wait(), 1.0 / rate)
+            except asyncio.TimeoutError:
+                pass
+        await asyncio.sleep(0.5)
+    finally:
+        reader.cancel()
+        await sender.close()
+        await receiver.close()
+
+
+async def measure(base: str, args, latencies: list, duration: float = None, until=None):
+    stop = asyncio.Event()
+    pairs = [
+        asyncio.create_task(ping_pair(base, f"up{uuid.uuid4().hex[:6]}-{i}", args.rate, latencies, stop))
+        for i in range(args.pairs)
+    ]
+    if until is not None:
+        await until
+    else:
+        await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*pairs)
+
+
+async def login_uploader(client: httpx.AsyncClient) -> str:
+    # /upload va /uploads token talab qiladi: vaqtinchalik foydalanuvchi, token client sarlavhasiga
+    username, password = f"upl{uuid.uuid4().hex[:8]}", "parol123"
+    await client.post("/register", json={"username": username, "email": f"{username}@bench.local", "password": password})
+    response = await client.post("/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+    return username
+
+
+async def resumable_upload(client: httpx.AsyncClient, user: str, size: int) -> float:
+    start = time.perf_counter()
+    session = (await client.post("/uploads", json={
+        "filename": "video.mp4", "size": size, "sender": user, "receiver": user
+    })).json()
+    offset, chunk = 0, session["chunk_size"]
+    while offset < size:
+        length = min(chunk, size - offset)
+        response = await client.put(
+            f"/uploads/{session['upload_id']}", params={"offset": offset}, content=body(length)
+        )
+        response.raise_for_status()
+        offset = response.json()["offset"]
+    return time.perf_counter() - start
+
+
+def fill_file(f, size: int):
+    for _ in range(size // len(PIECE)):
+        f.write(PIECE)
+    f.seek(0)
+
+
+async def legacy_upload(client: httpx.AsyncClient, user: str, size: int) -> float:
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as f:
+        # Klientning o‘z event loop’i ham bloklanmasin - aks holda o‘lchov buziladi
+        await asyncio.to_thread(fill_file, f, size)
+        response = await client.post(
+            "/upload", files={"file": ("video.mp4", f, "video/mp4")}, data={"sender": user, "receiver": user}
+        )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=5.0, help="har bir juft uchun xabar/soniya")
+    parser.add_argument("--idle-seconds", type=float, default=10)
+    parser.add_argument("--uploads", type=int, default=4, help="bir vaqtdagi davom ettiriladigan yuklashlar")
+    parser.add_argument("--legacy-uploads", type=int, default=1, help="bir vaqtdagi /upload so‘rovlari")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--slack-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--url", help="ishlab turgan server (STORAGE_BACKEND=local bilan)")
+    parser.add_argument("--server-log")
+    args = parser.parse_args()
+
+    base = args.url or f"http://127.0.0.1:{args.port}"
+    media = tempfile.mkdtemp(prefix="chat-media-")
+    server = None if args.url else start_server(args.port, 1, args.server_log, {
+        "STORAGE_BACKEND": "local", "LOCAL_STORAGE_DIR": media, "UPLOAD_TMP_DIR": media + "/tmp",
+    })
+    size = args.size_mb * 1024 * 1024
+    try:
+        await wait_ready(base)
+        ws_base = base.replace("http", "ws", 1)
+
+        idle = []
+        await measure(ws_base, args, idle, duration=args.idle_seconds)
+
+        loaded = []
+        async with httpx.AsyncClient(base_url=base, timeout=600) as client:
+            user = await login_uploader(client)
+            jobs = [resumable_upload(client, user, size) for _ in range(args.uploads)]
+            jobs += [legacy_upload(client, user, size) for _ in range(args.legacy_uploads)]
+            uploads = asyncio.ensure_future(asyncio.gather(*jobs))
+            start = time.perf_counter()
+            await measure(ws_base, args, loaded, until=uploads)
+            wall = time.perf_counter() - start
+            times = uploads.result()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=15)
+
+    total_mb = args.size_mb * len(times)
+    print(f"{len(times)} x {args.size_mb} MB yuklandi: {wall:.1f} s, {total_mb / wall:.1f} MB/s "
+          f"(eng sekini {max(times):.1f} s)")
+    print(f"\n{'':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    idle_p, loaded_p = percentiles(idle), percentiles(loaded)
+    for name, p in (("yuklamasiz", idle_p), ("yuklash paytida", loaded_p)):
+        print(f"{name:<16}{p['count']:>8}{p['p50'] or '-':>10}{p['p95'] or '-':>10}{p['p99'] or '-':>10}")
+
+    if not idle_p["count"] or not loaded_p["count"]:
+        print("\nXabarlar yetkazilmadi")
+        sys.exit(1)
+    limit = idle_p["p99"] * (1 + args.tolerance) + args.slack_ms
+    if loaded_p["p99"] > limit:
+        print(f"\nRegressiya: yuklash paytida p99 {loaded_p['p99']} ms > {limit:.1f} ms")
+        sys.exit(1)
+    print(f"\nYetkazish yuklashlardan ta’sirlanmadi (p99 limiti {limit:.1f} ms)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
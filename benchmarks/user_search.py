@@ -0,0 +1,149 @@
+# benchmarks/user_search.py
+# GET /users qidiruvi katta jadvalda: eski "username ILIKE '%q%'" (LIMIT’siz) va
+# crud.search_users (prefiks + trigram indekslar, LIMIT, kursor) solishtiriladi.
+#
+#   python benchmarks/user_search.py --users 1000000
+#
+# Alohida user_search_bench sxemasida public.users nusxasi (migratsiya 6 indekslari bilan)
+# yaratiladi va generate_series bilan to‘ldiriladi. crud.search_users o‘zgarishsiz chaqiriladi:
+# database.pool vaqtincha search_path shu sxemaga qaratilgan pool bilan almashtiriladi.
+# Yangi so‘rovlarning generic planida (plan_cache_mode = force_generic_plan) Seq Scan bo‘lsa yoki
+# prefiks chegaralari Index Cond’da bo‘lmasa 1 kodi bilan chiqadi. Avval server migratsiyalari
+# bajarilgan bo‘lishi kerak.
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+from config import NEONDB_PARAMS  # noqa: E402
+
+SCHEMA = "user_search_bench"
+NAMES = [
+    "ali", "alisher", "aziz", "azamat", "bobur", "botir", "dilshod", "doniyor", "elyor", "farhod",
+    "gulnora", "hasan", "husan", "ibrohim", "jasur", "kamola", "laylo", "malika", "madina", "nodir",
+    "nigora", "otabek", "oybek", "rustam", "sardor", "sevara", "shahzod", "sherzod", "temur", "umid",
+    "vali", "xurshid", "yusuf", "zafar", "zarina", "anvar", "bekzod", "dilnoza", "feruza", "javohir",
+]
+QUERIES = ["", "a", "al", "ali", "alisher_", "sher", "zod_", "_3f", "qqqq"]
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+async def seed(conn, users: int):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"CREATE TABLE {SCHEMA}.users (LIKE public.users INCLUDING ALL)")
+    await conn.execute(f"""
+        INSERT INTO {SCHEMA}.users (username, email, password)
+        SELECT ($2::text[])[1 + g % array_length($2::text[], 1)] || '_' || substr(md5(g::text), 1, 6) || g,
+               'u' || g || '@bench.local',
+               'x'
+        FROM generate_series(1, $1) AS g
+    """, users, NAMES)
+    await conn.execute(f"ANALYZE {SCHEMA}.users")
+
+
+async def timed(repeat: int, func):
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+async def plan_nodes(conn, sql: str, params) -> list:
+    plan = json.loads(await conn.fetchval("EXPLAIN (FORMAT JSON) " + sql, *params))
+    return list(walk(plan[0]["Plan"]))
+
+
+def prefix_indexed(nodes: list, bounds: tuple) -> bool:
+    # Prefiks chegaralari Filter emas, Index Cond bo‘lishi kerak (aks holda butun indeks o‘qiladi)
+    return any(all(bound in node.get("Index Cond", "") for bound in bounds) for node in nodes)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="user_search_bench sxemasini o‘chirmaslik")
+    args = parser.parse_args()
+
+    await database.init_pool()
+    main_pool = database.pool
+    bench_pool = await asyncpg.create_pool(
+        host=NEONDB_PARAMS["host"],
+        port=int(NEONDB_PARAMS["port"]),
+        user=NEONDB_PARAMS["user"],
+        password=NEONDB_PARAMS["password"],
+        database=NEONDB_PARAMS["dbname"],
+        ssl=NEONDB_PARAMS["sslmode"],
+        min_size=1,
+        max_size=2,
+        server_settings={"search_path": f"{SCHEMA}, public"},
+    )
+    ok = True
+    try:
+        async with database.acquire() as conn:
+            print(f"{args.users} foydalanuvchi yozilmoqda...")
+            start = time.perf_counter()
+            await seed(conn, args.users)
+            print(f"tayyor: {time.perf_counter() - start:.1f} s\n")
+
+        database.pool = bench_pool
+        print(f"{'query':<12}{'ILIKE rows':>12}{'ILIKE ms':>11}{'search rows':>13}{'search ms':>11}  plan")
+        for query in QUERIES:
+            async def old():
+                async with database.acquire() as conn:
+                    return await conn.fetch("SELECT username FROM users WHERE username ILIKE $1", f"%{query}%")
+
+            old_ms, old_rows = await timed(args.repeat, old)
+            new_ms, (usernames, _) = await timed(args.repeat, lambda: crud.search_users(query, args.limit))
+
+            prefix = query.lower()
+            pattern = crud.like_escape(prefix)
+            upper = crud.prefix_upper_bound(prefix)
+            async with database.acquire() as conn:
+                # Statement cache bir necha bajarilishdan keyin generic planga o‘tadi - shu plan tekshiriladi
+                await conn.execute("SET plan_cache_mode = force_generic_plan")
+                if upper is None:
+                    nodes = await plan_nodes(conn, crud.SEARCH_PREFIX_OPEN_SQL, (prefix, "", "", args.limit + 1))
+                    indexed = prefix_indexed(nodes, ("$1",))
+                else:
+                    nodes = await plan_nodes(conn, crud.SEARCH_PREFIX_SQL, (prefix, upper, "", "", args.limit + 1))
+                    indexed = prefix_indexed(nodes, ("$1", "$2"))
+                if len(query) >= crud.USER_SEARCH_MIN_SUBSTRING:
+                    nodes += [{"Node Type": "|"}] + await plan_nodes(
+                        conn, crud.SEARCH_SUBSTRING_SQL, (f"%{pattern}%", pattern + "%", "", "", args.limit + 1)
+                    )
+                await conn.execute("RESET plan_cache_mode")
+            types = [node["Node Type"] for node in nodes]
+            ok = ok and indexed and "Seq Scan" not in types
+            print(f"{query!r:<12}{len(old_rows):>12}{old_ms:>11.1f}{len(usernames):>13}{new_ms:>11.1f}  "
+                  f"{' -> '.join(types)}{'' if indexed else '  (prefiks Index Cond’da emas)'}")
+    finally:
+        database.pool = main_pool
+        await bench_pool.close()
+        if not args.keep:
+            async with database.acquire() as conn:
+                await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await database.close_pool()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
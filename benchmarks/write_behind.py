@@ -0,0 +1,79 @@
+# benchmarks/write_behind.py
+# Xabar/soniya: har bir xabar uchun alohida INSERT + commit (oddiy rejim) va
+# write-behind (Redis stream + paketli INSERT) solishtiriladi.
+#
+#   WRITE_BEHIND_BATCH_SIZE=500 WRITE_BEHIND_FLUSH_INTERVAL=0.05 \
+#   python benchmarks/write_behind.py --messages 20000 --concurrency 50
+#
+# "accepted" - xabar yetkazishga tayyor bo‘lgan tezlik (klient kutadigan kechikish),
+# "durable"  - xabarlarning hammasi Postgres’ga yozilguncha bo‘lgan tezlik.
+# Benchmark xabarlari alohida suhbatga yoziladi va oxirida o‘chiriladi.
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import database  # noqa: E402
+from conversation import conversation_id  # noqa: E402
+from writebehind import MessageWriter  # noqa: E402
+
+
+async def produce(writer: MessageWriter, sender: str, receiver: str, count: int, concurrency: int):
+    per_task = count // concurrency
+
+    async def task(n):
+        for i in range(per_task):
+            await writer.save_message(sender, receiver, f"bench {n}:{i}")
+
+    await asyncio.gather(*(task(n) for n in range(concurrency)))
+    return per_task * concurrency
+
+
+async def count_rows(conv_id: str) -> int:
+    async with database.acquire() as conn:
+        return await conn.fetchval("SELECT count(*) FROM messages WHERE conversation_id = $1", conv_id)
+
+
+async def run(enabled: bool, count: int, concurrency: int):
+    writer = MessageWriter(enabled=enabled)
+    await writer.start()
+    sender, receiver = f"bench-{uuid.uuid4().hex[:6]}", "bench-peer"
+    conv_id = conversation_id(sender, receiver)
+    try:
+        start = time.perf_counter()
+        sent = await produce(writer, sender, receiver, count, concurrency)
+        accepted = time.perf_counter() - start
+        while await count_rows(conv_id) < sent:
+            await asyncio.sleep(0.05)
+        durable = time.perf_counter() - start
+    finally:
+        await writer.stop()
+        async with database.acquire() as conn:
+            await conn.execute("DELETE FROM messages WHERE conversation_id = $1", conv_id)
+    return sent, accepted, durable
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50, help="parallel jo‘natuvchilar (socketlar)")
+    args = parser.parse_args()
+
+    await database.init_pool()
+    await database.init_redis()
+    try:
+        print(f"{'mode':<14}{'messages':>10}{'accepted/s':>14}{'durable/s':>12}")
+        for name, enabled in (("per-message", False), ("write-behind", True)):
+            sent, accepted, durable = await run(enabled, args.messages, args.concurrency)
+            print(f"{name:<14}{sent:>10}{sent / accepted:>14.0f}{sent / durable:>12.0f}")
+    finally:
+        await database.close_redis()
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,230 @@
+# broker.py
+# Onlayn foydalanuvchilar reestri va xabar yetkazish shinasi.
+# LocalBroker - bitta jarayon uchun (eski active_connections lug‘ati o‘rniga),
+# RedisBroker - Redis pub/sub orqali istalgan worker/node’dagi socketga yetkazadi.
+#
+# Xonalar: har bir worker faqat o‘zida a’zosi ulangan xonalar kanaliga obuna bo‘ladi; xabar
+# xonaga bitta PUBLISH bilan ketadi va har bir workerda bitta codec.Frame barcha a’zo
+# socketlar navbatiga qo‘yiladi. Pub/sub orqali freymning tayyor JSON baytlari yuboriladi.
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from config import BROKER_BACKEND, PRESENCE_TTL
+from codec import Frame
+from connection import outbound_counters
+from conversation import room_id
+from database import get_redis
+from metrics import fanout_latency
+
+logger = logging.getLogger(__name__)
+
+# A’zolikdan chiqarilgan foydalanuvchiga yuboriladi: freymni olgan socketlar xonadan ham chiqariladi
+ROOM_REMOVED = "room_removed"
+
+
+class LocalBroker:
+    def __init__(self):
+        # {username: set(ChatConnection)} - shu jarayondagi socketlar; bitta foydalanuvchining
+        # bir nechta socketi (qurilmalar, eski suhbat-socketlar) bo‘lishi mumkin
+        self.connections = {}
+        self.rooms = {}  # {"room:<id>": set(ChatConnection)} - xonaga obuna bo‘lgan socketlar
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.connections.clear()
+        self.rooms.clear()
+
+    async def register(self, conn):
+        self.connections.setdefault(conn.username, set()).add(conn)
+
+    async def unregister(self, conn):
+        for conv_id in [c for c in conn.subscriptions if room_id(c) is not None]:
+            await self.leave_room(conn, conv_id)
+        conns = self.connections.get(conn.username)
+        if conns is None:
+            return
+        conns.discard(conn)
+        if not conns:
+            del self.connections[conn.username]
+
+    async def join_room(self, conn, conv_id: str):
+        self.rooms.setdefault(conv_id, set()).add(conn)
+
+    async def leave_room(self, conn, conv_id: str):
+        conns = self.rooms.get(conv_id)
+        if conns is None:
+            return
+        conns.discard(conn)
+        if not conns:
+            del self.rooms[conv_id]
+
+    async def is_online(self, username: str) -> bool:
+        return username in self.connections
+
+    def outbound_stats(self) -> dict:
+        # Chiquvchi navbatlar: chuqurlik va tashlangan/birlashtirilgan/uzilganlar soni
+        depths = [len(conn.queue) for conns in self.connections.values() for conn in conns]
+        return {
+            "connections": len(depths),
+            "queued": sum(depths),
+            "max_depth": max(depths, default=0),
+            **outbound_counters,
+        }
+
+    async def publish(self, username: str, frame: Frame, pipe=None):
+        await self.deliver_local(username, frame)
+
+    async def publish_room(self, conv_id: str, frame: Frame, pipe=None):
+        await self.deliver_room(conv_id, frame)
+
+    async def deliver_local(self, username: str, frame: Frame):
+        # Faqat shu suhbatga obuna bo‘lgan socketlarning navbatiga (kutmaydi)
+        conns = self.connections.get(username)
+        if not conns:
+            return
+        start = time.perf_counter()
+        conv_id = frame.msg.get("conversation_id")
+        removed = frame.msg.get("action") == ROOM_REMOVED
+        for conn in list(conns):
+            if conn.wants(conv_id):
+                await conn.send_frame(frame)
+                if removed:
+                    conn.subscriptions.discard(conv_id)
+                    await self.leave_room(conn, conv_id)
+        fanout_latency.observe(time.perf_counter() - start, "dm")
+
+    async def deliver_room(self, conv_id: str, frame: Frame):
+        # Bitta freym (bir marta encode) har bir a’zo socket navbatiga
+        start = time.perf_counter()
+        for conn in list(self.rooms.get(conv_id, ())):
+            await conn.send_frame(frame)
+        fanout_latency.observe(time.perf_counter() - start, "room")
+
+
+class RedisBroker(LocalBroker):
+    CHANNEL_PREFIX = "deliver:"
+    ROOM_CHANNEL_PREFIX = "deliver-room:"
+    PRESENCE_PREFIX = "presence:"
+
+    def __init__(self):
+        super().__init__()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.redis = None
+        self.pubsub = None
+        self._tasks = []
+
+    async def start(self):
+        # Buyruqlar umumiy klient orqali; pub/sub pooldan bitta doimiy ulanish oladi
+        self.redis = get_redis()
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._tasks = [
+            asyncio.create_task(self._reader_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+        logger.info(f"Redis broker ishga tushdi (worker={self.worker_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self.connections:
+            pipe = self.redis.pipeline(transaction=False)
+            for username in self.connections:
+                pipe.hdel(self.PRESENCE_PREFIX + username, self.worker_id)
+            await pipe.execute()
+        await super().stop()
+        await self.pubsub.close()
+
+    async def register(self, conn):
+        username = conn.username
+        first = username not in self.connections
+        await super().register(conn)
+        if not first:
+            return
+        await self.pubsub.subscribe(self.CHANNEL_PREFIX + username)
+        key = self.PRESENCE_PREFIX + username
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, self.worker_id, 1)
+        pipe.expire(key, PRESENCE_TTL)
+        await pipe.execute()
+
+    async def unregister(self, conn):
+        username = conn.username
+        await super().unregister(conn)
+        if username not in self.connections:
+            await self.pubsub.unsubscribe(self.CHANNEL_PREFIX + username)
+            await self.redis.hdel(self.PRESENCE_PREFIX + username, self.worker_id)
+
+    async def join_room(self, conn, conv_id: str):
+        first = conv_id not in self.rooms
+        await super().join_room(conn, conv_id)
+        if first:
+            await self.pubsub.subscribe(self.ROOM_CHANNEL_PREFIX + conv_id)
+
+    async def leave_room(self, conn, conv_id: str):
+        await super().leave_room(conn, conv_id)
+        if conv_id not in self.rooms:
+            await self.pubsub.unsubscribe(self.ROOM_CHANNEL_PREFIX + conv_id)
+
+    async def is_online(self, username: str) -> bool:
+        return username in self.connections or bool(await self.redis.exists(self.PRESENCE_PREFIX + username))
+
+    async def publish(self, username: str, frame: Frame, pipe=None):
+        # pipe berilsa, publish shu action’ning boshqa Redis buyruqlari bilan bitta pipeline’da ketadi
+        await (pipe or self.redis).publish(self.CHANNEL_PREFIX + username, frame.json)
+
+    async def publish_room(self, conv_id: str, frame: Frame, pipe=None):
+        # A’zolar soniga bog‘liq emas: bitta PUBLISH, a’zolari ulangan har bir worker bir marta oladi
+        await (pipe or self.redis).publish(self.ROOM_CHANNEL_PREFIX + conv_id, frame.json)
+
+    async def _reader_loop(self):
+        while True:
+            try:
+                if not self.pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self.pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                channel = message["channel"].decode()
+                # Kelgan JSON baytlar qayta encode qilinmaydi, o‘zi socketlarga yuboriladi
+                frame = Frame(json_bytes=message["data"])
+                if channel.startswith(self.ROOM_CHANNEL_PREFIX):
+                    await self.deliver_room(channel[len(self.ROOM_CHANNEL_PREFIX):], frame)
+                else:
+                    await self.deliver_local(channel[len(self.CHANNEL_PREFIX):], frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broker o‘qish xatosi: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _heartbeat_loop(self):
+        # Shu workerdagi onlayn foydalanuvchilar presence kalitining TTL’ini yangilash
+        while True:
+            await asyncio.sleep(PRESENCE_TTL / 2)
+            if not self.connections:
+                continue
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for username in list(self.connections):
+                    key = self.PRESENCE_PREFIX + username
+                    pipe.hset(key, self.worker_id, 1)
+                    pipe.expire(key, PRESENCE_TTL)
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Presence heartbeat xatosi: {str(e)}")
+
+
+def create_broker():
+    if BROKER_BACKEND == "local":
+        return LocalBroker()
+    return RedisBroker()
+
+
+broker = create_broker()
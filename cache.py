@@ -0,0 +1,212 @@
+# cache.py
+# Suhbat keshi: bitta JSON satr o‘rniga har bir suhbat uchun ikki Redis kaliti:
+#   {key}:ids  - sorted set, score = msg_id (tartib va sahifalash uchun)
+#   {key}:msgs - hash, msg_id -> xabar JSON (xabar bo‘yicha to‘g‘ridan-to‘g‘ri murojaat)
+# Qo‘shish O(log n), tahrirlash O(1); butun ro‘yxatni o‘qib-yozish kerak emas.
+# append/remove skript bo‘lgani uchun `redis` o‘rniga pipeline ham berish mumkin.
+# Xabar tanasi - codec.dumps natijasi: socketga yuborilgan baytlarning o‘zi saqlanadi.
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError, WatchError
+from config import CACHE_TTL, CACHE_MAX_MESSAGES, USER_SEARCH_CACHE_TTL
+from codec import dumps, loads
+from models import Message
+
+MORE_FIELD = "__more__"  # keshdan eskiroq xabarlar DB’da bormi (1/0)
+
+# Har doim yoziladi: kesh yo‘q bo‘lsa (yoki shu payt fill bilan to‘ldirilayotgan bo‘lsa) xabar
+# yo‘qolmasligi uchun kalit yaratiladi va __more__=1 - eskiroq xabarlar DB’dan olinadi.
+# CACHE_MAX_MESSAGES dan oshsa eng eskilari chiqariladi
+APPEND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSETNX', KEYS[2], '__more__', '1')
+end
+redis.call('ZREM', KEYS[1], '0')
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+local overflow = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[3])
+if overflow > 0 then
+    local old = redis.call('ZRANGE', KEYS[1], 0, overflow - 1)
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, overflow - 1)
+    redis.call('HDEL', KEYS[2], unpack(old))
+    redis.call('HSET', KEYS[2], '__more__', '1')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+# DB’dan olingan sahifani keshga qo‘shish (o‘chirib qayta yozmasdan): keshda bor xabarlar
+# o‘zgartirilmaydi (HSETNX) - parallel append va update natijasi ustiga eski nusxa yozilmaydi.
+# ARGV: has_more, CACHE_MAX_MESSAGES, TTL, keyin juft-juft msg_id, JSON
+FILL_SCRIPT = """
+for i = 4, #ARGV, 2 do
+    if redis.call('HSETNX', KEYS[2], ARGV[i], ARGV[i + 1]) == 1 then
+        redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i])
+    end
+end
+if #ARGV > 3 then
+    redis.call('ZREM', KEYS[1], '0')
+end
+redis.call('HSET', KEYS[2], '__more__', ARGV[1])
+local total = redis.call('ZCARD', KEYS[1])
+if total == 0 then
+    -- Bo‘sh suhbat ham keshlanadi: sorted set bo‘sh bo‘lolmaydi, shuning uchun belgi qo‘yiladi
+    redis.call('ZADD', KEYS[1], 0, '0')
+end
+local overflow = total - tonumber(ARGV[2])
+if overflow > 0 then
+    local old = redis.call('ZRANGE', KEYS[1], 0, overflow - 1)
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, overflow - 1)
+    redis.call('HDEL', KEYS[2], unpack(old))
+    redis.call('HSET', KEYS[2], '__more__', '1')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+REMOVE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+return 1
+"""
+
+# Eng oxirgi ARGV[1] ta xabar (yangidan eskiga) va ularning id’lari, jami soni va __more__ bayrog‘i
+PAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local bodies = {}
+if #ids > 0 then
+    bodies = redis.call('HMGET', KEYS[2], unpack(ids))
+end
+return {redis.call('ZCARD', KEYS[1]), redis.call('HGET', KEYS[2], '__more__'), bodies, ids}
+"""
+
+
+_scripts = {}  # {skript matni: Script} - sha1 har chaqiruvda qayta hisoblanmaydi
+
+
+def _script(redis: Redis, source: str):
+    # Script bir marta yaratiladi; chaqiruvda client= beriladi (Redis yoki pipeline)
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis.register_script(source)
+    return script
+
+
+def _keys(key: str):
+    return f"{key}:ids", f"{key}:msgs"
+
+
+async def get_page_raw(redis: Redis, key: str, limit: int):
+    # Qaytadi: (xronologik tartibdagi xabar JSON baytlari, eng eski id, has_more) yoki kesh yo‘q bo‘lsa None
+    result = await _script(redis, PAGE_SCRIPT)(keys=_keys(key), args=[limit], client=redis)
+    if not result:
+        return None
+    total, more, bodies, ids = result
+    if total < limit and more == b"1":
+        # Kesh to‘liq sahifa bera olmaydi (masalan, append yaratgan kalit) - DB’dan olinib fill qilinadi
+        return None
+    bodies = [body for body in reversed(bodies) if body is not None]
+    oldest_id = int(ids[-1]) if bodies else None
+    return bodies, oldest_id, total > limit or more == b"1"
+
+
+async def get_page(redis: Redis, key: str, limit: int):
+    # Qaytadi: (xronologik tartibdagi xabarlar, has_more) yoki kesh yo‘q bo‘lsa (None, False)
+    page = await get_page_raw(redis, key, limit)
+    if page is None:
+        return None, False
+    bodies, _, has_more = page
+    return [loads(body) for body in bodies], has_more
+
+
+async def fill(redis: Redis, key: str, messages: list, has_more: bool):
+    # messages - models.Message ro‘yxati
+    args = ["1" if has_more else "0", CACHE_MAX_MESSAGES, CACHE_TTL]
+    for m in messages:
+        args += [m.msg_id, dumps(m.to_wire())]
+    await _script(redis, FILL_SCRIPT)(keys=_keys(key), args=args, client=redis)
+
+
+async def append(redis: Redis, key: str, msg_id: int, body: bytes):
+    # body - xabarning tayyor JSON’i (codec.Frame.json), qayta encode qilinmaydi
+    await _script(redis, APPEND_SCRIPT)(
+        keys=_keys(key), args=[msg_id, body, CACHE_MAX_MESSAGES, CACHE_TTL], client=redis
+    )
+
+
+async def update(redis: Redis, key: str, msg_id: int, fields: dict):
+    # Bitta xabarni o‘zgartirish: WATCH bilan optimistik tranzaksiya (parallel yozuvchilar uchun xavfsiz)
+    _, msgs_key = _keys(key)
+    field = str(msg_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(msgs_key)
+                body = await pipe.hget(msgs_key, field)
+                if body is None:
+                    await pipe.unwatch()
+                    return
+                msg = loads(body)
+                msg.update(fields)
+                pipe.multi()
+                pipe.hset(msgs_key, field, dumps(msg))
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+async def remove(redis: Redis, key: str, msg_id: int):
+    await _script(redis, REMOVE_SCRIPT)(keys=_keys(key), args=[msg_id], client=redis)
+
+
+async def import_legacy(redis: Redis, key: str, legacy_keys) -> bool:
+    # Eski formatdagi (butun suhbat bitta JSON satrda) keshni yangi tuzilmaga ko‘chirish.
+    # Eng uzun nusxa olinadi, eski kalitlar o‘chiriladi.
+    best = None
+    for legacy_key in legacy_keys:
+        try:
+            raw = await redis.get(legacy_key)
+        except ResponseError:
+            continue  # kalit boshqa turda - eski format emas
+        if raw:
+            messages = [Message.from_wire(m) for m in loads(raw)]
+            if best is None or len(messages) > len(best):
+                best = messages
+    if best is None:
+        return False
+    best.sort(key=lambda m: m.msg_id)
+    # Eski nusxa to‘liq bo‘lmasligi mumkin: eskiroq sahifalar DB’dan olinadi
+    await fill(redis, key, best[-CACHE_MAX_MESSAGES:], has_more=True)
+    await redis.delete(*legacy_keys)
+    return True
+
+
+# GET /users qidiruvining birinchi sahifalari: usersearch:<limit>:<query> hash - javobning tayyor
+# JSON baytlari va keyingi sahifa kursori. TTL qisqa: yangi foydalanuvchi ko‘pi bilan
+# USER_SEARCH_CACHE_TTL soniyadan keyin ko‘rinadi, shuning uchun invalidatsiya qilinmaydi.
+SEARCH_PREFIX = "usersearch:"
+
+
+def search_key(query: str, limit: int) -> str:
+    return f"{SEARCH_PREFIX}{limit}:{query.strip().lower()}"
+
+
+async def get_search(redis: Redis, query: str, limit: int):
+    # (body, next_cursor yoki None) yoki None - keshda yo‘q
+    body, next_cursor = await redis.hmget(search_key(query, limit), "body", "next")
+    if body is None:
+        return None
+    return body, next_cursor.decode() if next_cursor else None
+
+
+async def set_search(redis: Redis, query: str, limit: int, body: bytes, next_cursor):
+    key = search_key(query, limit)
+    pipe = redis.pipeline(transaction=False)
+    pipe.hset(key, mapping={"body": body, "next": next_cursor or ""})
+    pipe.expire(key, USER_SEARCH_CACHE_TTL)
+    await pipe.execute()
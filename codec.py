@@ -0,0 +1,99 @@
+# codec.py
+# Xabarlarni serializatsiya qilish: har bir xabar bir marta encode qilinadi va o‘sha baytlar
+# jo‘natuvchiga echo, qabul qiluvchilarga fan-out, Redis pub/sub va keshda qayta ishlatiladi.
+#
+# JSON: orjson o‘rnatilgan bo‘lsa u, aks holda standart json (natija bir xil JSON).
+# Klient formati ulanishda tanlanadi: ?codec=msgpack yoki Sec-WebSocket-Protocol: msgpack
+# (msgpack o‘rnatilgan bo‘lsa) - binary freymlar; qolganlar - JSON matn freymlar.
+import json
+from config import WS_CODEC
+
+try:
+    import orjson
+except ImportError:  # ixtiyoriy tezlatgich
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Frame:
+    # Bitta chiquvchi freym: dict va/yoki tayyor JSON baytlar; boshqa formatlar kerak bo‘lganda
+    # bir marta hosil qilinadi va shu freymni olgan barcha socketlar uchun saqlanadi
+    __slots__ = ("_msg", "_json", "_text", "_msgpack")
+
+    def __init__(self, msg: dict = None, json_bytes: bytes = None):
+        self._msg = msg
+        self._json = json_bytes
+        self._text = None
+        self._msgpack = None
+
+    @property
+    def msg(self) -> dict:
+        if self._msg is None:
+            self._msg = loads(self._json)
+        return self._msg
+
+    @property
+    def json(self) -> bytes:
+        if self._json is None:
+            self._json = dumps(self._msg)
+        return self._json
+
+    @property
+    def text(self) -> str:
+        # ASGI matn freymi str talab qiladi: decode ham bir marta
+        if self._text is None:
+            self._text = self.json.decode()
+        return self._text
+
+    def packed(self) -> bytes:
+        if self._msgpack is None:
+            self._msgpack = msgpack.packb(self.msg)
+        return self._msgpack
+
+
+def history_frame(conv_id: str, bodies: list, before_id, has_more: bool) -> Frame:
+    # Keshdagi tayyor xabar JSON’laridan "history" freymini decode/encode qilmasdan yig‘ish
+    return Frame(json_bytes=b"".join((
+        b'{"action":"history","conversation_id":', dumps(conv_id),
+        b',"messages":[', b",".join(bodies),
+        b'],"before_id":', dumps(before_id),
+        b',"has_more":', b"true" if has_more else b"false", b"}",
+    )))
+
+
+def negotiate(websocket):
+    # Qaytadi: (format, accept() ga beriladigan subprotocol)
+    if msgpack is not None:
+        if MSGPACK in websocket.scope.get("subprotocols", []):
+            return MSGPACK, MSGPACK
+        if websocket.query_params.get("codec", WS_CODEC) == MSGPACK:
+            return MSGPACK, None
+    return JSON, None
+
+
+def decode_inbound(message: dict, fmt: str) -> dict:
+    # ASGI "websocket.receive": matn freymi har doim JSON, binary - klient formatida
+    if message.get("text") is not None:
+        return loads(message["text"])
+    if fmt == MSGPACK:
+        return msgpack.unpackb(message["bytes"])
+    return loads(message["bytes"])
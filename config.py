@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,6 +17,7 @@ def setup_cors(app):
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # GET /users keyingi sahifa kursori
 )
 
 # NeonDB ulanish sozlamalari
@@ -49,6 +51,21 @@ NEONDB_PARAMS = {
     "sslmode": os.getenv("NEONDB_SSLMODE", "require"),
 }
 
+# Ulanishlar pool sozlamalari (jarayon bo‘yicha bitta pool)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))  # pooldan ulanish kutish (soniya)
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))  # bitta so‘rov uchun limit (soniya)
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))  # bo‘sh ulanish yopiladi
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))  # 0 - o‘chirilgan
+# Neon "-pooler" (PgBouncer, transaction mode) prepared statement keshini ko‘tarmaydi
+DB_STATEMENT_CACHE_SIZE = int(os.getenv(
+    "DB_STATEMENT_CACHE_SIZE", "0" if "pooler" in NEONDB_PARAMS["host"] else "100"
+))
+# Migratsiyalar ulanishi: sessiya darajasidagi advisory lock PgBouncer (transaction mode) orqali
+# ishlamaydi, shuning uchun to‘g‘ridan-to‘g‘ri endpoint (Neon’da "-pooler" qo‘shimchasisiz host)
+NEONDB_DIRECT_HOST = os.getenv("NEONDB_DIRECT_HOST", NEONDB_PARAMS["host"].replace("-pooler", ""))
+
 # Railway Postgres ulanish sozlamalari
 # RAILWAY_DB_PARAMS = {
 #     "dbname": os.getenv("RAILWAY_DBNAME", "railway"),  # Railway baza nomi
@@ -61,6 +78,116 @@ NEONDB_PARAMS = {
 
 
 
+# Suhbat tarixini sahifalab yuklash (eng oxirgi xabarlardan boshlab)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+# Qayta ulanishda "sync": bitta freymdagi o‘zgarishlar (xabar + o‘chirilganlar) soni
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+SYNC_MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", "2000"))
+# Yetkazildi/o‘qildi (receipts.py): freymlar birlashtiriladigan oraliq, DB’ga yozish oralig‘i (soniya)
+# va xotiradagi chegaralar soni
+RECEIPT_FRAME_INTERVAL = float(os.getenv("RECEIPT_FRAME_INTERVAL", "0.25"))
+RECEIPT_FLUSH_INTERVAL = float(os.getenv("RECEIPT_FLUSH_INTERVAL", "2"))
+RECEIPT_CACHE_SIZE = int(os.getenv("RECEIPT_CACHE_SIZE", "100000"))
+
+# GET /users qidiruvi: sahifa hajmi, qism-satr qidiruvi uchun minimal uzunlik, birinchi sahifalar keshi
+USER_SEARCH_LIMIT = int(os.getenv("USER_SEARCH_LIMIT", "20"))
+USER_SEARCH_MAX_LIMIT = int(os.getenv("USER_SEARCH_MAX_LIMIT", "100"))
+USER_SEARCH_MIN_SUBSTRING = int(os.getenv("USER_SEARCH_MIN_SUBSTRING", "3"))
+USER_SEARCH_CACHE_TTL = int(os.getenv("USER_SEARCH_CACHE_TTL", "30"))  # soniya, 0 - o‘chirilgan
+
+# Redis ulanishlar pooli (jarayon bo‘yicha bitta klient)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # bo‘sh ulanish kutish (soniya)
+
+# Redis’dagi suhbat keshi
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+CACHE_MAX_MESSAGES = int(os.getenv("CACHE_MAX_MESSAGES", "500"))  # suhbat bo‘yicha eng oxirgi N ta xabar
+# Eski messages:<sender>:<receiver> JSON kalitlarini o‘qib, kanonik kalitga ko‘chirish
+CACHE_LEGACY_READ = os.getenv("CACHE_LEGACY_READ", "1") == "1"
+
+# permessage-deflate: klient taklif qilsa WebSocket freymlari siqiladi
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "1") == "1"
+# Klient o‘zi tanlamasa freym formati: "json" yoki "msgpack" (codec.py)
+WS_CODEC = os.getenv("WS_CODEC", "json")
+
+# Write-behind: xabar darhol yetkaziladi, DB’ga Redis stream orqali paketlab yoziladi
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_STREAM = os.getenv("WRITE_BEHIND_STREAM", "persist:messages")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))  # soniya
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "20"))
+# DB qabul qilmagan (yaroqsiz) yozuvlar shu stream’ga o‘tkaziladi - navbat to‘xtab qolmaydi
+WRITE_BEHIND_DEAD_STREAM = os.getenv("WRITE_BEHIND_DEAD_STREAM", "persist:messages:dead")
+# Snowflake worker raqami ijarasi (soniya): yiqilgan jarayonning raqami shuncha vaqtdan keyin bo‘shaydi
+SNOWFLAKE_LEASE_TTL = int(os.getenv("SNOWFLAKE_LEASE_TTL", "30"))
+
+# Xabar yetkazish shinasi: "redis" - bir nechta worker/node, "local" - bitta jarayon
+BROKER_BACKEND = os.getenv("BROKER_BACKEND", "redis")
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", "60"))  # onlayn holati (soniya), heartbeat yangilaydi
+
+# Har bir socketning chiquvchi navbati: to‘lsa OUTBOUND_OVERFLOW qo‘llanadi
+#   drop_oldest - eng eski freym tashlanadi, coalesce - shu xabarning eski edit/react freymi
+#   yangisi bilan almashtiriladi (bo‘lmasa drop_oldest), disconnect - socket yopiladi
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "256"))
+OUTBOUND_OVERFLOW = os.getenv("OUTBOUND_OVERFLOW", "drop_oldest")
+OUTBOUND_SEND_TIMEOUT = float(os.getenv("OUTBOUND_SEND_TIMEOUT", "10"))  # bitta freym yozish limiti (soniya)
+
+# Log darajasi: har bir freym/xabar haqidagi yozuvlar DEBUG da, yuklama ostida INFO tavsiya etiladi
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# /metrics: event loop kechikishini o‘lchash oralig‘i (soniya), 0 - o‘chirilgan
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# Guruh suhbatlari (xonalar)
+ROOM_MAX_MEMBERS = int(os.getenv("ROOM_MAX_MEMBERS", "5000"))
+
+# Media fayllar (storage.py): "cloudinary" yoki "local" (test/lokal ishlatish uchun)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "media")
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "/media")
+# Davom ettiriladigan yuklash: vaqtinchalik fayllar, tavsiya etilgan bo‘lak hajmi va limitlar
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "chat-uploads"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(200 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", "86400"))  # tugallanmagan sessiya (soniya)
+# Bir vaqtda backend’ga uzatilayotgan fayllar (thread’lar) soni va navbatda kutish limiti (soniya)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_QUEUE_TIMEOUT = float(os.getenv("UPLOAD_QUEUE_TIMEOUT", "30"))
+
+# Parol xeshi (passwords.py): scrypt narxi (n - CPU/xotira, 128*n*r bayt), pool va navbat limiti
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", "16384"))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" yoki "process"
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))  # soniya
+
+# Chiquvchi email (mailer.py): SMTP ulanishi, navbat, qayta urinish va manzil bo‘yicha limit
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+# Hisob ma’lumotlari faqat muhitdan; berilmasa mailer o‘chirilgan (parol tiklash 503)
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")  # Gmail’da App Password
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+MAIL_FROM = os.getenv("MAIL_FROM", SMTP_USER)
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "1"))  # har biri o‘z SMTP ulanishi bilan
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "1000"))
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", "5"))
+MAIL_RETRY_BASE = float(os.getenv("MAIL_RETRY_BASE", "1"))  # soniya, har urinishda 2 barobar
+MAIL_RETRY_MAX = float(os.getenv("MAIL_RETRY_MAX", "60"))
+MAIL_RATE_LIMIT = int(os.getenv("MAIL_RATE_LIMIT", "3"))  # bitta manzilga MAIL_RATE_WINDOW ichida
+MAIL_RATE_WINDOW = int(os.getenv("MAIL_RATE_WINDOW", "600"))
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))  # bo‘sh SMTP ulanishi yopiladi
+
+# Sessiya tokenlari (auth.py): HMAC kaliti (bo‘sh bo‘lsa Redis’da umumiy tasodifiy kalit yaratiladi),
+# amal qilish muddati (soniya), majburiylik va tekshirilgan tokenlar LRU keshi hajmi
+AUTH_SECRET = os.getenv("AUTH_SECRET", "")
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", str(7 * 24 * 3600)))
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "0") == "1"  # 0 - tokensiz eski klientlar ham ishlaydi
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
 CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
@@ -0,0 +1,144 @@
+# connection.py
+# Bitta WebSocket ulanishi va u obuna bo‘lgan suhbatlar.
+# /ws/{username} - multiplekslangan ulanish: klient suhbatlarga "subscribe"/"unsubscribe" bilan
+# qo‘shiladi/chiqadi, har bir freymda conversation_id bo‘ladi.
+# /ws/{username}/{receiver} - eski yo‘l: ulanish bitta suhbatga bog‘langan.
+#
+# Socketga to‘g‘ridan-to‘g‘ri yozilmaydi: send_json freymni ulanishning chegaralangan navbatiga
+# qo‘yadi, alohida writer vazifasi uni socketga yozadi. Sekin klient faqat o‘z navbatini
+# to‘ldiradi - jo‘natuvchining qabul qilish sikli kutib qolmaydi.
+# Navbatda codec.Frame turadi: fan-out bitta freymni barcha a’zolar navbatiga qo‘yadi,
+# har bir format (JSON/msgpack) shu freym uchun bir martagina encode qilinadi.
+import asyncio
+import logging
+from collections import deque
+import conversation
+from codec import Frame, JSON
+from config import OUTBOUND_QUEUE_SIZE, OUTBOUND_OVERFLOW, OUTBOUND_SEND_TIMEOUT
+from metrics import frames_sent
+
+logger = logging.getLogger(__name__)
+
+# Foydalanuvchining barcha suhbatlari (masalan, suhbatlar ro‘yxati ekrani uchun)
+ALL_CONVERSATIONS = "*"
+
+# Faqat oxirgi holati muhim bo‘lgan freymlar - coalesce shularni birlashtiradi
+COALESCE_ACTIONS = ("edit", "react")
+
+# 1013 Try Again Later: navbat to‘lib qolgan sekin klient uziladi
+CLOSE_SLOW_CONSUMER = 1013
+
+# Jarayon bo‘yicha jami hisoblagichlar (/stats)
+outbound_counters = {"dropped": 0, "coalesced": 0, "evicted": 0}
+
+
+def coalesce_key(msg: dict):
+    if msg.get("action") in COALESCE_ACTIONS:
+        return msg["action"], msg.get("conversation_id"), msg.get("msg_id")
+    return None
+
+
+class ChatConnection:
+    def __init__(self, websocket, username: str, receiver: str = None, fmt: str = JSON,
+                 queue_size: int = OUTBOUND_QUEUE_SIZE, overflow: str = OUTBOUND_OVERFLOW):
+        self.websocket = websocket
+        self.username = username
+        self.format = fmt
+        # Eski yo‘lda freymda conversation_id bo‘lmasa shu suhbat ishlatiladi
+        self.receiver = receiver
+        self.subscriptions = set()
+        if receiver is not None:
+            self.subscriptions.add(conversation.conversation_id(username, receiver))
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def wants(self, conv_id: str) -> bool:
+        return ALL_CONVERSATIONS in self.subscriptions or conv_id in self.subscriptions
+
+    def peer_for(self, frame: dict):
+        # Freym qaysi suhbatga tegishli: conversation_id, "with" yoki ulanishning o‘z suhbati
+        conv_id = frame.get("conversation_id")
+        if conv_id:
+            return conversation.peer(conv_id, self.username)
+        return frame.get("with") or self.receiver
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.queue.clear()
+
+    async def send_json(self, msg: dict):
+        await self.send_frame(Frame(msg))
+
+    async def send_frame(self, frame: Frame):
+        # Kutmaydi: tayyor freym navbatga qo‘yiladi, writer vazifasi yozadi
+        if self.closed:
+            return
+        if len(self.queue) >= self.queue_size and not self._overflow(frame):
+            return
+        self.queue.append(frame)
+        self._ready.set()
+
+    def _overflow(self, frame: Frame) -> bool:
+        # True - yangi freym navbatga qo‘shilsin
+        if self.overflow == "disconnect":
+            self._evict(f"navbat to‘ldi ({self.queue_size})")
+            return False
+        if self.overflow == "coalesce":
+            key = coalesce_key(frame.msg)
+            if key is not None:
+                for queued in self.queue:
+                    if coalesce_key(queued.msg) == key:
+                        # Eski holat olib tashlanadi, yangisi oxirga - tartib buzilmaydi
+                        self.queue.remove(queued)
+                        outbound_counters["coalesced"] += 1
+                        return True
+        self.queue.popleft()
+        outbound_counters["dropped"] += 1
+        return True
+
+    def _evict(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        outbound_counters["evicted"] += 1
+        logger.warning(f"{self.username} uzildi: {reason}")
+        asyncio.create_task(self._close())
+
+    async def _close(self):
+        try:
+            await self.websocket.close(code=CLOSE_SLOW_CONSUMER)
+        except Exception:
+            pass
+
+    async def _writer_loop(self):
+        while not self.closed:
+            if not self.queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            frame = self.queue.popleft()
+            if self.format == JSON:
+                send = self.websocket.send_text(frame.text)
+            else:
+                send = self.websocket.send_bytes(frame.packed())
+            try:
+                await asyncio.wait_for(send, OUTBOUND_SEND_TIMEOUT)
+                frames_sent.inc()
+            except asyncio.TimeoutError:
+                self._evict(f"freym {OUTBOUND_SEND_TIMEOUT}s ichida yozilmadi")
+            except Exception as e:
+                # Socket yopilgan - qabul qilish sikli uzilishni o‘zi qayta ishlaydi
+                logger.warning(f"{self.username} ga yozib bo‘lmadi: {str(e)}")
+                self.closed = True
+                self.queue.clear()
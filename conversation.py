@@ -0,0 +1,61 @@
+# conversation.py
+# Suhbatning yagona (tartibdan qat’i nazar) identifikatori: A->B va B->A bir xil suhbat.
+# Guruh suhbatlari (xonalar): room:<id>
+# Username’dagi ':' va '%' escape qilinadi (%3A, %25): aks holda ("a:b", "c") va ("a", "b:c")
+# bir xil id olardi. Boshqa username’lar uchun id o‘zgarmaydi (migratsiya 10 ham shu formatda).
+
+
+def escape_name(username: str) -> str:
+    return username.replace("%", "%25").replace(":", "%3A")
+
+
+def unescape_name(text: str) -> str:
+    return text.replace("%3A", ":").replace("%25", "%")
+
+
+def conversation_id(user_a: str, user_b: str) -> str:
+    low, high = sorted((user_a, user_b))
+    return f"dm:{escape_name(low)}:{escape_name(high)}"
+
+
+def room_conversation_id(room_id: int) -> str:
+    return f"room:{int(room_id)}"
+
+
+def room_id(conv_id: str):
+    # Xona suhbati bo‘lsa xona raqami, aks holda None
+    if not conv_id.startswith("room:"):
+        return None
+    try:
+        return int(conv_id[len("room:"):])
+    except ValueError:
+        return None
+
+
+def cache_key_for(conv_id: str) -> str:
+    return f"messages:{conv_id}"
+
+
+def cache_key(user_a: str, user_b: str) -> str:
+    return cache_key_for(conversation_id(user_a, user_b))
+
+
+def legacy_cache_keys(user_a: str, user_b: str):
+    # Eski format: har bir yo‘nalish uchun alohida JSON satr
+    return f"messages:{user_a}:{user_b}", f"messages:{user_b}:{user_a}"
+
+
+def peer(conv_id: str, username: str):
+    # Suhbatdagi ikkinchi ishtirokchi; username bu suhbatda bo‘lmasa None
+    kind, sep, rest = conv_id.partition(":")
+    low, sep2, high = rest.partition(":")
+    if kind != "dm" or not sep or not sep2:
+        return None
+    low, high = unescape_name(low), unescape_name(high)
+    if username == low:
+        other = high
+    elif username == high:
+        other = low
+    else:
+        return None
+    return other if conversation_id(username, other) == conv_id else None
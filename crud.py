@@ -0,0 +1,417 @@
+# crud.py
+# Xabarlarni saqlash qatlami: barcha so‘rovlar asyncpg orqali, event loop bloklanmaydi.
+# Har bir funksiya pooldan ulanishni faqat o‘z so‘rovi davomida oladi.
+import base64
+from typing import Optional
+from database import acquire
+from config import (
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, SYNC_PAGE_SIZE, SYNC_MAX_PAGE_SIZE, ROOM_MAX_MEMBERS, USER_SEARCH_LIMIT, USER_SEARCH_MAX_LIMIT,
+    USER_SEARCH_MIN_SUBSTRING,
+)
+from conversation import conversation_id, room_conversation_id
+from models import Message
+
+MESSAGE_COLUMNS = "id, sender_username, content, timestamp, edited, deleted, reaction, reply_to_id, type"
+
+# benchmarks/explain_history.py shu so‘rovlarning EXPLAIN planini tekshiradi
+HISTORY_LATEST_SQL = f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages
+    WHERE conversation_id = $1
+    ORDER BY id DESC
+    LIMIT $2
+"""
+HISTORY_BEFORE_SQL = f"""
+    SELECT {MESSAGE_COLUMNS} FROM messages
+    WHERE conversation_id = $1 AND id < $2
+    ORDER BY id DESC
+    LIMIT $3
+"""
+
+# Qayta ulanishdagi sync (migratsiya 7-8): suhbatdagi change_seq > kursor bo‘lgan xabarlar
+# (joriy holati bilan) va butunlay o‘chirilganlar, change_seq tartibida.
+# nextval tartibi commit tartibi emas: seq N olgan tranzaksiya N+1 dan keyin commit bo‘lishi mumkin,
+# klient N+1 ni tasdiqlasa N butunlay o‘tkazib yuboriladi. Shuning uchun "settled" - qatorni yozgan
+# tranzaksiya snapshot’dagi eng eski hali tugamagan tranzaksiyadan oldingi (xmin < snapshot xmin);
+# fetch_changes birinchi settled bo‘lmagan o‘zgarishda to‘xtaydi, u keyingi sync’da keladi
+SETTLED_SQL = "age(xmin) > age(pg_snapshot_xmin(pg_current_snapshot())::xid) AS settled"
+SYNC_MESSAGES_SQL = f"""
+    SELECT {MESSAGE_COLUMNS}, change_seq, {SETTLED_SQL} FROM messages
+    WHERE conversation_id = $1 AND change_seq > $2
+    ORDER BY change_seq
+    LIMIT $3
+"""
+SYNC_TOMBSTONES_SQL = f"""
+    SELECT msg_id, change_seq, {SETTLED_SQL} FROM message_tombstones
+    WHERE conversation_id = $1 AND change_seq > $2
+    ORDER BY change_seq
+    LIMIT $3
+"""
+
+# Foydalanuvchi qidiruvi (migratsiya 6 indekslari, benchmarks/user_search.py):
+#   1-bosqich - prefiks: idx_users_username_prefix (lower(username) COLLATE "C") bo‘yicha range scan
+#   2-bosqich - prefiks bo‘lmagan qism-satr: idx_users_username_trgm (pg_trgm GIN)
+# Ikkala bosqich ham (lower(username), username) bo‘yicha tartiblangan - faqat registri bilan farq
+# qiladigan username’lar ("Bob", "bob") sahifa chegarasida tushib qolmaydi. Kursor - (bosqich, kalit, username)
+# Prefiks LIKE 'ab%' o‘rniga aniq chegaralar (>= 'ab' AND < 'ac'): LIKE faqat custom planda range scan
+# bo‘ladi, statement cache generic planga o‘tgach esa butun indeks bo‘ylab Filter’ga aylanadi
+SEARCH_PREFIX_SQL = """
+    SELECT username, lower(username) AS key FROM users
+    WHERE lower(username) COLLATE "C" >= $1 AND lower(username) COLLATE "C" < $2
+      AND (lower(username) COLLATE "C", username COLLATE "C") > ($3, $4)
+    ORDER BY lower(username) COLLATE "C", username COLLATE "C"
+    LIMIT $5
+"""
+# Yuqori chegarasi yo‘q prefiks (bo‘sh so‘z yoki faqat U+10FFFF belgilari)
+SEARCH_PREFIX_OPEN_SQL = """
+    SELECT username, lower(username) AS key FROM users
+    WHERE lower(username) COLLATE "C" >= $1
+      AND (lower(username) COLLATE "C", username COLLATE "C") > ($2, $3)
+    ORDER BY lower(username) COLLATE "C", username COLLATE "C"
+    LIMIT $4
+"""
+SEARCH_SUBSTRING_SQL = """
+    SELECT username, lower(username) AS key FROM users
+    WHERE lower(username) LIKE $1 AND lower(username) NOT LIKE $2
+      AND (lower(username) COLLATE "C", username COLLATE "C") > ($3, $4)
+    ORDER BY lower(username) COLLATE "C", username COLLATE "C"
+    LIMIT $5
+"""
+PREFIX_TIER, SUBSTRING_TIER = 0, 1
+
+
+def clamp_page_size(limit) -> int:
+    if limit is None:
+        return HISTORY_PAGE_SIZE
+    return max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+
+
+async def fetch_history(conv_id: str, before_id=None, limit=None):
+    # Keyset pagination: before_id dan oldingi eng oxirgi `limit` ta xabar (DM yoki xona).
+    # Qaytadi: (xronologik tartibdagi Message ro‘yxati, yana eski xabarlar bormi)
+    limit = clamp_page_size(limit)
+    before_id = int(before_id) if before_id is not None else None
+    # Ikkala variant ham idx_messages_conversation_id (conversation_id, id DESC) bo‘yicha o‘qiladi;
+    # "$2 IS NULL OR id < $2" ko‘rinishi generic planda indeksdan to‘liq foydalanmaydi
+    async with acquire("fetch_history") as conn:
+        if before_id is None:
+            rows = await conn.fetch(HISTORY_LATEST_SQL, conv_id, limit + 1)
+        else:
+            rows = await conn.fetch(HISTORY_BEFORE_SQL, conv_id, before_id, limit + 1)
+    has_more = len(rows) > limit
+    return [Message.from_row(row) for row in reversed(rows[:limit])], has_more
+
+
+async def insert_message(msg_id: int, sender: str, receiver, content: str, reply_to_id=None,
+                         msg_type: str = "text", timestamp=None, conv_id: str = None):
+    # id snowflake.ids orqali oldindan ajratiladi (write-behind rejimi bilan bir xil tartib).
+    # Xona xabarida receiver None, conv_id = 'room:<id>'
+    async with acquire("insert_message") as conn:
+        await conn.execute(
+            "INSERT INTO messages (id, sender_username, receiver_username, conversation_id, content, reply_to_id, type, timestamp) "
+            "VALUES ($1, $2, $3, $4, $5, $6, $7, COALESCE($8, CURRENT_TIMESTAMP))",
+            msg_id, sender, receiver, conv_id or conversation_id(sender, receiver), content, reply_to_id, msg_type,
+            timestamp
+        )
+    return msg_id
+
+
+async def insert_messages_batch(rows: list):
+    # Bir nechta xabarni bitta INSERT ... SELECT unnest(...) bilan yozish (write-behind flush).
+    # Qayta yuborilgan (allaqachon yozilgan) id’lar ON CONFLICT bilan o‘tkazib yuboriladi.
+    columns = list(zip(*[
+        (r["msg_id"], r["sender"], r["receiver"], r.get("conversation_id") or conversation_id(r["sender"], r["receiver"]),
+         r["content"], r["reply_to_id"], r["type"], r["timestamp"])
+        for r in rows
+    ]))
+    async with acquire("insert_messages_batch") as conn:
+        await conn.execute("""
+            INSERT INTO messages (id, sender_username, receiver_username, conversation_id, content, reply_to_id, type, timestamp)
+            SELECT * FROM unnest($1::bigint[], $2::varchar[], $3::varchar[], $4::varchar[],
+                                 $5::text[], $6::bigint[], $7::varchar[], $8::timestamp[])
+            ON CONFLICT (id) DO NOTHING
+        """, *columns)
+
+
+# O‘zgartirish funksiyalari qator topilganini qaytaradi: write-behind rejimida xabar hali
+# DB’ga yozilmagan bo‘lishi mumkin, bunda o‘zgarish keyinroq qayta qo‘llanadi.
+# Har bir o‘zgarish yangi change_seq oladi - sync uni keyingi qayta ulanishda yetkazadi.
+# Hammasi freymdagi suhbat bilan cheklangan (boshqa suhbatdagi xabarni id bo‘yicha o‘zgartirib
+# bo‘lmaydi), tahrir va o‘chirish - faqat xabar muallifi.
+async def edit_message(msg_id: int, content: str, conv_id: str, sender: str) -> bool:
+    async with acquire("edit_message") as conn:
+        result = await conn.execute(
+            "UPDATE messages SET content = $1, edited = TRUE, change_seq = nextval('message_change_seq') "
+            "WHERE id = $2 AND conversation_id = $3 AND sender_username = $4",
+            content, msg_id, conv_id, sender
+        )
+    return result != "UPDATE 0"
+
+
+async def mark_deleted(msg_id: int, conv_id: str, sender: str) -> bool:
+    async with acquire("mark_deleted") as conn:
+        result = await conn.execute(
+            "UPDATE messages SET deleted = TRUE, change_seq = nextval('message_change_seq') "
+            "WHERE id = $1 AND conversation_id = $2 AND sender_username = $3",
+            msg_id, conv_id, sender
+        )
+    return result != "UPDATE 0"
+
+
+async def delete_message(msg_id: int, conv_id: str, sender: str) -> bool:
+    # Qator o‘rniga tombstone qoladi (bitta so‘rovda): offline klient o‘chirilganini sync’da biladi
+    async with acquire("delete_message") as conn:
+        result = await conn.execute("""
+            WITH gone AS (
+                DELETE FROM messages WHERE id = $1 AND conversation_id = $2 AND sender_username = $3
+                RETURNING id, conversation_id
+            )
+            INSERT INTO message_tombstones (msg_id, conversation_id)
+            SELECT id, conversation_id FROM gone
+            ON CONFLICT (msg_id) DO NOTHING
+        """, msg_id, conv_id, sender)
+    return result != "INSERT 0 0"
+
+
+async def set_reaction(msg_id: int, reaction: str, conv_id: str) -> bool:
+    async with acquire("set_reaction") as conn:
+        result = await conn.execute(
+            "UPDATE messages SET reaction = $1, change_seq = nextval('message_change_seq') "
+            "WHERE id = $2 AND conversation_id = $3",
+            reaction, msg_id, conv_id
+        )
+    return result != "UPDATE 0"
+
+
+async def message_exists(msg_id: int) -> bool:
+    async with acquire("message_exists") as conn:
+        return bool(await conn.fetchval("SELECT 1 FROM messages WHERE id = $1", msg_id))
+
+
+def clamp_sync_size(limit) -> int:
+    if limit is None:
+        return SYNC_PAGE_SIZE
+    return max(1, min(int(limit), SYNC_MAX_PAGE_SIZE))
+
+
+async def fetch_changes(conv_id: str, cursor: int, limit=None):
+    # Kursordan keyingi o‘zgarishlar. Qaytadi: (Message ro‘yxati, butunlay o‘chirilgan id’lar,
+    # yangi kursor - olingan oxirgi change_seq, yana o‘zgarishlar bormi)
+    limit = clamp_sync_size(limit)
+    cursor = int(cursor)
+    async with acquire("fetch_changes") as conn:
+        # Ikkala so‘rov bitta snapshot’da: settled ikkala jadval uchun bir xil chegara bilan hisoblanadi
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            rows = await conn.fetch(SYNC_MESSAGES_SQL, conv_id, cursor, limit + 1)
+            tombstones = await conn.fetch(SYNC_TOMBSTONES_SQL, conv_id, cursor, limit + 1)
+    # Ikkala ro‘yxat change_seq bo‘yicha birlashtiriladi, birinchi `limit` tasi qaytadi
+    changes = sorted(
+        [(row["change_seq"], row["settled"], row) for row in rows]
+        + [(row["change_seq"], row["settled"], row["msg_id"]) for row in tombstones],
+        key=lambda change: change[0]
+    )
+    # Kursor hali commit bo‘lmagan bo‘lishi mumkin bo‘lgan o‘zgarishlardan o‘tib ketmasligi uchun
+    # birinchi settled bo‘lmagan o‘zgarishdan keyingilar qaytarilmaydi
+    for i, (_, settled, _) in enumerate(changes):
+        if not settled:
+            changes = changes[:i]
+            break
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    messages, deleted = [], []
+    for _, _, change in changes:
+        if isinstance(change, int):
+            deleted.append(change)
+        else:
+            messages.append(Message.from_row(change))
+    next_cursor = changes[-1][0] if changes else cursor
+    return messages, deleted, next_cursor, has_more
+
+
+async def get_delivery_cursor(username: str, conv_id: str) -> int:
+    async with acquire("get_delivery_cursor") as conn:
+        return await conn.fetchval(
+            "SELECT last_seq FROM delivery_cursors WHERE username = $1 AND conversation_id = $2", username, conv_id
+        ) or 0
+
+
+async def save_delivery_cursor(username: str, conv_id: str, seq: int):
+    # Kursor faqat oldinga suriladi (kechikib kelgan eski ack uni orqaga qaytarmaydi)
+    async with acquire("save_delivery_cursor") as conn:
+        await conn.execute("""
+            INSERT INTO delivery_cursors (username, conversation_id, last_seq) VALUES ($1, $2, $3)
+            ON CONFLICT (username, conversation_id) DO UPDATE
+            SET last_seq = GREATEST(delivery_cursors.last_seq, EXCLUDED.last_seq), updated_at = CURRENT_TIMESTAMP
+        """, username, conv_id, seq)
+
+
+async def save_receipts(rows: list):
+    # rows: [(username, conv_id, delivered_id, read_id)] - receipts.py buferidan bitta so‘rovda
+    columns = list(zip(*rows))
+    async with acquire("save_receipts") as conn:
+        await conn.execute("""
+            INSERT INTO delivery_cursors (username, conversation_id, delivered_id, read_id)
+            SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::bigint[], $4::bigint[])
+            ON CONFLICT (username, conversation_id) DO UPDATE
+            SET delivered_id = GREATEST(delivery_cursors.delivered_id, EXCLUDED.delivered_id),
+                read_id = GREATEST(delivery_cursors.read_id, EXCLUDED.read_id),
+                updated_at = CURRENT_TIMESTAMP
+        """, *columns)
+
+
+async def fetch_receipts(conv_id: str, exclude: str) -> list:
+    # Suhbatdagi boshqa qatnashchilarning chegaralari (hech narsa olmaganlar qaytmaydi)
+    async with acquire("fetch_receipts") as conn:
+        rows = await conn.fetch("""
+            SELECT username, delivered_id, read_id FROM delivery_cursors
+            WHERE conversation_id = $1 AND username <> $2 AND delivered_id > 0
+        """, conv_id, exclude)
+    return [dict(row) for row in rows]
+
+
+def room_row_to_dict(row) -> dict:
+    return {
+        "room_id": row["id"],
+        "conversation_id": room_conversation_id(row["id"]),
+        "name": row["name"],
+        "created_by": row["created_by"],
+    }
+
+
+async def create_room(name: str, creator: str, members: list) -> dict:
+    usernames = list(dict.fromkeys([creator, *members]))
+    if len(usernames) > ROOM_MAX_MEMBERS:
+        raise ValueError(f"Xonada {ROOM_MAX_MEMBERS} tadan ortiq a’zo bo‘lishi mumkin emas")
+    async with acquire("create_room") as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                "INSERT INTO rooms (name, created_by) VALUES ($1, $2) RETURNING id, name, created_by",
+                name, creator
+            )
+            await conn.execute(
+                "INSERT INTO room_members (room_id, username) SELECT $1, unnest($2::varchar[])",
+                row["id"], usernames
+            )
+    return room_row_to_dict(row)
+
+
+async def add_room_members(room_id: int, usernames: list) -> bool:
+    # False - xona topilmadi; a’zolar soni ROOM_MAX_MEMBERS dan oshsa ValueError (hech kim qo‘shilmaydi)
+    async with acquire("add_room_members") as conn:
+        async with conn.transaction():
+            # Bir vaqtdagi qo‘shishlar limitdan oshib ketmasligi uchun xona qatori qulflanadi
+            if not await conn.fetchval("SELECT 1 FROM rooms WHERE id = $1 FOR UPDATE", room_id):
+                return False
+            await conn.execute("""
+                INSERT INTO room_members (room_id, username)
+                SELECT $1, unnest($2::varchar[])
+                ON CONFLICT DO NOTHING
+            """, room_id, usernames)
+            count = await conn.fetchval("SELECT count(*) FROM room_members WHERE room_id = $1", room_id)
+            if count > ROOM_MAX_MEMBERS:
+                raise ValueError(f"Xonada {ROOM_MAX_MEMBERS} tadan ortiq a’zo bo‘lishi mumkin emas")
+    return True
+
+
+async def remove_room_member(room_id: int, username: str) -> bool:
+    async with acquire("remove_room_member") as conn:
+        result = await conn.execute(
+            "DELETE FROM room_members WHERE room_id = $1 AND username = $2", room_id, username
+        )
+    return result != "DELETE 0"
+
+
+async def is_room_member(room_id: int, username: str) -> bool:
+    async with acquire("is_room_member") as conn:
+        return bool(await conn.fetchval(
+            "SELECT 1 FROM room_members WHERE room_id = $1 AND username = $2", room_id, username
+        ))
+
+
+async def room_owner(room_id: int):
+    # Xonani yaratgan foydalanuvchi; xona topilmasa None
+    async with acquire("room_owner") as conn:
+        return await conn.fetchval("SELECT created_by FROM rooms WHERE id = $1", room_id)
+
+
+async def user_rooms(username: str) -> list:
+    async with acquire("user_rooms") as conn:
+        rows = await conn.fetch("""
+            SELECT r.id, r.name, r.created_by FROM rooms r
+            JOIN room_members m ON m.room_id = r.id
+            WHERE m.username = $1
+            ORDER BY r.id
+        """, username)
+    return [room_row_to_dict(row) for row in rows]
+
+
+def clamp_search_limit(limit) -> int:
+    if limit is None:
+        return USER_SEARCH_LIMIT
+    return max(1, min(int(limit), USER_SEARCH_MAX_LIMIT))
+
+
+def encode_search_cursor(tier: int, row) -> str:
+    # Shaffof bo‘lmagan, HTTP sarlavhasiga sig‘adigan (ASCII) qiymat. NUL username’da bo‘lolmaydi
+    raw = f"{tier}:{row['key']}\0{row['username']}" if row is not None else f"{tier}:"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def parse_search_cursor(cursor: str):
+    # Qaytadi: (bosqich, (kalit, username)); noto‘g‘ri kursor - ValueError
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except ValueError:
+        raise ValueError("Noto‘g‘ri cursor")
+    tier, sep, rest = raw.partition(":")
+    if not sep or tier not in ("0", "1"):
+        raise ValueError("Noto‘g‘ri cursor")
+    key, _, username = rest.partition("\0")
+    return int(tier), (key, username)
+
+
+def like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    # COLLATE "C" (UTF-8 baytlari = kod nuqtalari tartibi) bo‘yicha prefix bilan boshlanadigan
+    # barcha satrlardan katta eng kichik satr; None - yuqori chegara yo‘q
+    prefix = prefix.rstrip("\U0010ffff")
+    if not prefix:
+        return None
+    last = ord(prefix[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        # Surrogate kod nuqtalari UTF-8’da bo‘lmaydi
+        last = 0xE000
+    return prefix[:-1] + chr(last)
+
+
+async def search_users(query: str, limit=None, cursor=None):
+    # Avval username shu so‘z bilan boshlanadiganlar, keyin ichida uchraydiganlar (query kamida
+    # USER_SEARCH_MIN_SUBSTRING belgi bo‘lsa - qisqa so‘zga trigram indeksi yordam bermaydi).
+    # Qaytadi: (username ro‘yxati, keyingi sahifa kursori yoki None)
+    limit = clamp_search_limit(limit)
+    tier, after = parse_search_cursor(cursor) if cursor else (PREFIX_TIER, ("", ""))
+    pattern = like_escape(query.strip().lower())
+    usernames = []
+    async with acquire("search_users") as conn:
+        if tier == PREFIX_TIER:
+            prefix = query.strip().lower()
+            upper = prefix_upper_bound(prefix)
+            if upper is None:
+                rows = await conn.fetch(SEARCH_PREFIX_OPEN_SQL, prefix, *after, limit + 1)
+            else:
+                rows = await conn.fetch(SEARCH_PREFIX_SQL, prefix, upper, *after, limit + 1)
+            if len(rows) > limit:
+                return [r["username"] for r in rows[:limit]], encode_search_cursor(PREFIX_TIER, rows[limit - 1])
+            usernames = [r["username"] for r in rows]
+            tier, after = SUBSTRING_TIER, ("", "")
+        if len(query.strip()) < USER_SEARCH_MIN_SUBSTRING:
+            return usernames, None
+        remaining = limit - len(usernames)
+        rows = await conn.fetch(SEARCH_SUBSTRING_SQL, f"%{pattern}%", pattern + "%", *after, remaining + 1)
+    if len(rows) > remaining:
+        # remaining == 0: prefikslar sahifani to‘ldirdi, qism-satrlar keyingi sahifadan boshlanadi
+        last = rows[remaining - 1] if remaining else None
+        return usernames + [r["username"] for r in rows[:remaining]], encode_search_cursor(SUBSTRING_TIER, last)
+    return usernames + [r["username"] for r in rows], None
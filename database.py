@@ -1,56 +1,169 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from config import NEONDB_PARAMS, app
-from redis.asyncio import Redis  # aioredis o‘rniga redis.asyncio
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+import asyncpg
+from config import (
+    NEONDB_PARAMS, NEONDB_DIRECT_HOST, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_ACQUIRE_TIMEOUT, DB_COMMAND_TIMEOUT,
+    DB_MAX_INACTIVE_LIFETIME, DB_HEALTH_CHECK_INTERVAL, DB_STATEMENT_CACHE_SIZE,
+    REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT,
+)
+from redis.asyncio import Redis, BlockingConnectionPool  # aioredis o‘rniga redis.asyncio
+from metrics import db_acquire_wait, db_query_latency
 import os
 
-# NeonDB (PostgreSQL) konfiguratsiyasi
+logger = logging.getLogger(__name__)
+
+# NeonDB (PostgreSQL) konfiguratsiyasi: jarayon bo‘yicha bitta umumiy pool
+pool = None
+_health_task = None
+
+
+async def init_pool():
+    global pool, _health_task
+    if pool is not None:
+        return pool
+    pool = await asyncpg.create_pool(
+        host=NEONDB_PARAMS["host"],
+        port=int(NEONDB_PARAMS["port"]),
+        user=NEONDB_PARAMS["user"],
+        password=NEONDB_PARAMS["password"],
+        database=NEONDB_PARAMS["dbname"],
+        ssl=NEONDB_PARAMS["sslmode"],
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+    )
+    if DB_HEALTH_CHECK_INTERVAL > 0:
+        _health_task = asyncio.create_task(_health_check_loop())
+    logger.info(f"DB pool yaratildi (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return pool
+
+
+async def close_pool():
+    global pool, _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        _health_task = None
+    if pool is not None:
+        await pool.close()
+        pool = None
+        logger.info("DB pool yopildi")
+
+
+async def _health_check_loop():
+    # Bo‘sh turgan ulanishlarni vaqti-vaqti bilan tekshirish; uzilgan bo‘lsa pool qayta ulanadi
+    while True:
+        await asyncio.sleep(DB_HEALTH_CHECK_INTERVAL)
+        try:
+            async with acquire("health_check") as conn:
+                await conn.fetchval("SELECT 1")
+        except Exception as e:
+            logger.warning(f"DB health check xatosi: {str(e)}; ulanishlar yangilanadi")
+            pool.expire_connections()
+
+
+async def connect_direct():
+    # Pooldan tashqari alohida ulanish, command_timeout’siz: uzoq davom etadigan migratsiyalar
+    # (to‘liq jadval UPDATE, CREATE INDEX CONCURRENTLY) DB_COMMAND_TIMEOUT bilan bekor qilinmasligi uchun.
+    # PgBouncer’siz host (NEONDB_DIRECT_HOST): sessiya advisory lock’i bitta backend’da qolishi kerak
+    if "pooler" in NEONDB_DIRECT_HOST:
+        logger.warning(f"NEONDB_DIRECT_HOST pooler’ga o‘xshaydi ({NEONDB_DIRECT_HOST}): migratsiya lock’i ishonchsiz")
+    return await asyncpg.connect(
+        host=NEONDB_DIRECT_HOST,
+        port=int(NEONDB_PARAMS["port"]),
+        user=NEONDB_PARAMS["user"],
+        password=NEONDB_PARAMS["password"],
+        database=NEONDB_PARAMS["dbname"],
+        ssl=NEONDB_PARAMS["sslmode"],
+        command_timeout=None,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+    )
+
+
 def get_db():
-    conn = psycopg2.connect(**NEONDB_PARAMS, cursor_factory=RealDictCursor)
-    return conn
+    if pool is None:
+        raise RuntimeError("DB pool hali yaratilmagan (init_pool chaqirilmagan)")
+    return pool
 
-# Redis konfiguratsiyasi
+
+@asynccontextmanager
+async def acquire(op: str = "other"):
+    # Ulanish faqat bitta so‘rov yoki tranzaksiya davomida olinadi:
+    # async with acquire("fetch_history") as conn: ...
+    # op - /metrics dagi db_query_duration_seconds yorlig‘i (ulanish ushlab turilgan vaqt)
+    start = time.perf_counter()
+    async with get_db().acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        acquired = time.perf_counter()
+        db_acquire_wait.observe(acquired - start)
+        try:
+            yield conn
+        finally:
+            db_query_latency.observe(time.perf_counter() - acquired, op)
+
+# Redis konfiguratsiyasi: jarayon bo‘yicha bitta klient, ulanishlar umumiy pooldan
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+redis_client = None
+
+
+async def init_redis():
+    global redis_client
+    if redis_client is not None:
+        return redis_client
+    # Pool to‘lsa yangi ulanish ochilmaydi, REDIS_POOL_TIMEOUT davomida bo‘shashi kutiladi
+    redis_pool = BlockingConnectionPool.from_url(
+        REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT
+    )
+    redis_client = Redis(connection_pool=redis_pool)
+    logger.info(f"Redis pool yaratildi (max={REDIS_MAX_CONNECTIONS})")
+    return redis_client
+
+
+async def close_redis():
+    global redis_client
+    if redis_client is not None:
+        await redis_client.close()
+        await redis_client.connection_pool.disconnect()
+        redis_client = None
+        logger.info("Redis pool yopildi")
+
+
+def get_redis():
+    if redis_client is None:
+        raise RuntimeError("Redis klient hali yaratilmagan (init_redis chaqirilmagan)")
+    return redis_client
+
+
+def pool_stats() -> dict:
+    # Pool to‘yinganligi: in_use max ga yaqinlashsa so‘rovlar navbatda kutadi
+    stats = {}
+    if pool is not None:
+        db_size = pool.get_size()
+        stats["db"] = {
+            "size": db_size,
+            "idle": pool.get_idle_size(),
+            "in_use": db_size - pool.get_idle_size(),
+            "max": pool.get_max_size(),
+        }
+    if redis_client is not None:
+        redis_pool = redis_client.connection_pool
+        in_use = len(redis_pool._in_use_connections)
+        stats["redis"] = {
+            "in_use": in_use,
+            "idle": len(redis_pool._available_connections),
+            "max": redis_pool.max_connections,
+            "saturation": round(in_use / redis_pool.max_connections, 3),
+        }
+    return stats
+
 
-async def get_redis():
-    redis = await Redis.from_url(REDIS_URL)  # Redis.from_url ishlatiladi
-    try:
-        yield redis
-    finally:
-        await redis.close()
-
-def init_db():
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE,
-                email VARCHAR(100) UNIQUE,
-                password VARCHAR(256),
-                reset_code VARCHAR(6)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                sender_username VARCHAR(255) NOT NULL,
-                receiver_username VARCHAR(255) NOT NULL,
-                content TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                edited BOOLEAN DEFAULT FALSE,
-                deleted BOOLEAN DEFAULT FALSE,
-                reaction VARCHAR(50),
-                reply_to_id INT,
-                FOREIGN KEY (reply_to_id) REFERENCES messages(id) ON DELETE SET NULL
-            )
-        """)
-        conn.commit()
-        print("Jadvallar yaratildi yoki allaqachon mavjud.")
-
-@app.on_event("startup")
-async def startup_event():
-    init_db()
+async def init_db():
+    # Sxema migrations.py dagi versiyalangan migratsiyalar orqali yangilanadi
+    import migrations
+    await migrations.migrate()
+    print("Jadvallar yaratildi yoki allaqachon mavjud.")
 
 
 # # database.py
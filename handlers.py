@@ -0,0 +1,491 @@
+# handlers.py
+# WebSocket action’lari reestri. Har bir action @action bilan ro‘yxatga olinadi va nima
+# kerakligini e’lon qiladi - dispatch faqat shularni tayyorlaydi:
+#   conversation - freymdagi suhbat (DM yoki xona) aniqlanadi va tekshiriladi
+#   db           - Postgres’ga murojaat qiladi: pool band bo‘lsa (timeout) socket uzilmaydi,
+#                  klientga xato freymi yuboriladi
+#   cache/fanout - Redis’ga yozadi: kesh va yetkazish buyruqlari uchun bitta pipeline ochiladi va
+#                  handler tugagach bitta round-trip’da bajariladi
+# Hech narsa talab qilmaydigan action’lar (masalan, unsubscribe) hech qanday resurs olmaydi.
+# Handler qaytargan Frame DM’da jo‘natuvchiga echo qilinadi (xonada a’zolar fan-out orqali oladi).
+#
+# Qayta ulanish: klient "sync" (yoki "subscribe" + cursor) bilan faqat o‘zi tasdiqlagan change_seq’dan
+# keyingi o‘zgarishlarni oladi - yangi/tahrirlangan/o‘chirilgan/reaksiyali xabarlar joriy holatida va
+# butunlay o‘chirilganlar id’lari. Qabul qilingach "ack" bilan kursor DB’da suriladi.
+# "delivered"/"read" - receipts.py buferiga (DB’ga bu yerda murojaat yo‘q), "receipts" - joriy holat.
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from redis.asyncio import Redis
+import cache
+import codec
+import conversation
+import crud
+from broker import broker
+from codec import Frame
+from config import CACHE_LEGACY_READ
+from connection import ChatConnection, ALL_CONVERSATIONS
+from metrics import action_latency, cache_lookups, frames_in, frames_out
+from models import Message, DELETED_CONTENT
+from receipts import receipts
+from writebehind import writer
+
+logger = logging.getLogger(__name__)
+
+MAX_BIGINT = 2 ** 63 - 1  # Postgres BIGINT: kattaroq qiymat asyncpg’da xato beradi
+
+
+@dataclass(frozen=True)
+class ActionSpec:
+    name: str
+    handler: object
+    conversation: bool
+    db: bool
+    cache: bool
+    fanout: bool
+
+
+ACTIONS = {}
+
+
+def action(name: str, conversation: bool = True, db: bool = False, cache: bool = False, fanout: bool = False):
+    def register(handler):
+        ACTIONS[name] = ActionSpec(name, handler, conversation, db, cache, fanout)
+        return handler
+    return register
+
+
+class ActionContext:
+    # Bitta kiruvchi freym uchun holat
+    def __init__(self, conn: ChatConnection, redis: Redis, data: dict, batched: bool):
+        self.conn = conn
+        self.redis = redis
+        self.data = data
+        self.batched = batched
+        self.username = conn.username
+        self.action = data.get("action", "send")
+        self.pipe = None
+        self.room = None
+        self.receiver = None
+        self.conv_id = None
+        self.cache_key = None
+        self.legacy_keys = ()
+
+    async def error(self, text: str):
+        await self.conn.send_json({"error": text, "action": self.action, "conversation_id": self.conv_id})
+
+    async def resolve(self, require_subscribed: bool = True) -> bool:
+        # Freym qaysi suhbatga tegishli; noto‘g‘ri bo‘lsa klientga xato yuboriladi va False
+        room = conversation.room_id(self.data.get("conversation_id") or "")
+        if room is not None:
+            self.room = room
+            self.conv_id = conversation.room_conversation_id(room)
+            # Xona: a’zolik "subscribe" da bir marta tekshiriladi
+            if require_subscribed and self.conv_id not in self.conn.subscriptions:
+                await self.error("Subscribe to the room first")
+                return False
+        else:
+            self.receiver = self.conn.peer_for(self.data)
+            if not self.receiver:
+                await self.error("conversation_id is required")
+                return False
+            # Ikkala tomon uchun bitta kanonik suhbat id va kesh kaliti
+            self.conv_id = conversation.conversation_id(self.username, self.receiver)
+            self.legacy_keys = conversation.legacy_cache_keys(self.username, self.receiver)
+        self.cache_key = conversation.cache_key_for(self.conv_id)
+        return True
+
+    async def publish(self, frame: Frame):
+        # DM - qabul qiluvchining socketlariga; xona - barcha a’zolarga (jo‘natuvchining socketlari ham)
+        if self.receiver is None:
+            await broker.publish_room(self.conv_id, frame, pipe=self.pipe)
+        else:
+            await broker.publish(self.receiver, frame, pipe=self.pipe)
+        frames_out.inc(self.action)
+
+
+async def dispatch(conn: ChatConnection, redis: Redis, data: dict, batched: bool):
+    ctx = ActionContext(conn, redis, data, batched)
+    spec = ACTIONS.get(ctx.action)
+    if spec is None:
+        frames_in.inc("unknown")
+        await conn.send_json({"error": f"Unknown action: {ctx.action}"})
+        return
+    frames_in.inc(ctx.action)
+    start = time.perf_counter()
+    try:
+        if spec.conversation and not await ctx.resolve():
+            return
+        if spec.cache or spec.fanout:
+            ctx.pipe = redis.pipeline(transaction=False)
+        frame = await spec.handler(ctx)
+        if ctx.pipe is not None and len(ctx.pipe):
+            await ctx.pipe.execute()
+        if frame is not None and ctx.receiver is not None:
+            await conn.send_frame(frame)
+            frames_out.inc(ctx.action)
+    except asyncio.TimeoutError:
+        if not spec.db:
+            raise
+        # DB pooldan ulanish DB_ACQUIRE_TIMEOUT ichida olinmadi - sessiya davom etadi
+        logger.warning(f"{ctx.action}: DB band ({conn.username})")
+        await ctx.error("Server busy, try again")
+    finally:
+        action_latency.observe(time.perf_counter() - start, ctx.action)
+
+
+def optional_int(data: dict, key: str):
+    # Freymdagi ixtiyoriy musbat butun son (yo‘q bo‘lsa None); noto‘g‘ri qiymat - ValueError
+    value = data.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(key)
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(key)
+    if not 0 < value <= MAX_BIGINT:
+        raise ValueError(key)
+    return value
+
+
+def required_msg_id(data: dict):
+    # msg_id majburiy: yo‘q yoki noto‘g‘ri (bool, BIGINT’dan katta, ...) bo‘lsa None
+    try:
+        return optional_int(data, "msg_id")
+    except ValueError:
+        return None
+
+
+async def load_cached_page(redis: Redis, conv_id: str, limit: int, legacy_keys=()):
+    # Kesh suhbatning eng oxirgi qismini saqlaydi: (xabar JSON baytlari, eng eski id, has_more) yoki None
+    cache_key = conversation.cache_key_for(conv_id)
+    page = await cache.get_page_raw(redis, cache_key, limit)
+    if page is None and CACHE_LEGACY_READ and legacy_keys:
+        # Eski yo‘nalishli kalitlar bo‘lsa, yangi kalitga ko‘chirib olinadi
+        if await cache.import_legacy(redis, cache_key, legacy_keys):
+            page = await cache.get_page_raw(redis, cache_key, limit)
+    cache_lookups.inc("miss" if page is None else "hit")
+    return page
+
+
+async def send_history(conn: ChatConnection, redis: Redis, conv_id: str, before_id=None, limit=None, batched=True,
+                       legacy_keys=()):
+    limit = crud.clamp_page_size(limit)
+    page = await load_cached_page(redis, conv_id, limit, legacy_keys) if before_id is None else None
+    if page is not None:
+        bodies, oldest_id, has_more = page
+        logger.debug(f"Redis’dan {len(bodies)} ta xabar olindi")
+        if batched:
+            # Keshdagi tayyor JSON’lar decode/encode qilinmasdan bitta freymga yig‘iladi
+            await conn.send_frame(codec.history_frame(conv_id, bodies, oldest_id, has_more))
+            return
+        messages = [Message.from_wire(codec.loads(body)) for body in bodies]
+    else:
+        messages, has_more = await crud.fetch_history(conv_id, before_id, limit)
+        logger.debug(f"DB’dan {len(messages)} ta xabar olindi")
+        if before_id is None:
+            await cache.fill(redis, conversation.cache_key_for(conv_id), messages, has_more)
+    # Keyingi (eskiroq) sahifa uchun kursor
+    next_before_id = messages[0].msg_id if messages else before_id
+    if batched:
+        # Butun sahifa bitta freymda: bitta encode, bitta WebSocket freym
+        await conn.send_json({
+            "action": "history",
+            "conversation_id": conv_id,
+            "messages": [m.to_wire() for m in messages],
+            "before_id": next_before_id,
+            "has_more": has_more,
+        })
+        return
+    # Eski klientlar (?history=legacy): har bir xabar alohida freymda
+    for m in messages:
+        m.conversation_id = conv_id
+        await conn.send_json(m.to_wire())
+    await conn.send_json({
+        "action": "page_info", "conversation_id": conv_id, "before_id": next_before_id, "has_more": has_more
+    })
+
+
+async def send_changes(conn: ChatConnection, username: str, conv_id: str, cursor=None, limit=None):
+    # cursor berilmasa - foydalanuvchining DB’dagi tasdiqlangan kursori
+    if cursor is None:
+        cursor = await crud.get_delivery_cursor(username, conv_id)
+    messages, deleted, next_cursor, has_more = await crud.fetch_changes(conv_id, cursor, limit)
+    await conn.send_json({
+        "action": "sync",
+        "conversation_id": conv_id,
+        "messages": [m.to_wire() for m in messages],
+        "deleted": deleted,
+        "cursor": next_cursor,
+        "has_more": has_more,
+    })
+
+
+@action("subscribe", conversation=False, db=True)
+async def handle_subscribe(ctx: ActionContext):
+    if ctx.data.get("conversation_id") == ALL_CONVERSATIONS:
+        # Barcha suhbatlardagi yangi xabarlar (tarixsiz)
+        ctx.conn.subscriptions.add(ALL_CONVERSATIONS)
+        await ctx.conn.send_json({"action": "subscribed", "conversation_id": ALL_CONVERSATIONS})
+        return
+    if not await ctx.resolve(require_subscribed=False):
+        return
+    if ctx.room is not None:
+        if not await crud.is_room_member(ctx.room, ctx.username):
+            await ctx.error("Not a member of this room")
+            return
+        await broker.join_room(ctx.conn, ctx.conv_id)
+    ctx.conn.subscriptions.add(ctx.conv_id)
+    if "cursor" in ctx.data:
+        # Qayta ulangan klient: oxirgi sahifa o‘rniga faqat farq
+        await sync_from_frame(ctx)
+        return
+    try:
+        limit = optional_int(ctx.data, "limit")
+    except ValueError:
+        await ctx.error("limit must be a positive integer")
+        return
+    await send_history(
+        ctx.conn, ctx.redis, ctx.conv_id, limit=limit, batched=ctx.batched, legacy_keys=ctx.legacy_keys
+    )
+
+
+@action("unsubscribe", conversation=False)
+async def handle_unsubscribe(ctx: ActionContext):
+    if ctx.data.get("conversation_id") == ALL_CONVERSATIONS:
+        ctx.conn.subscriptions.discard(ALL_CONVERSATIONS)
+        await ctx.conn.send_json({"action": "unsubscribed", "conversation_id": ALL_CONVERSATIONS})
+        return
+    if not await ctx.resolve(require_subscribed=False):
+        return
+    ctx.conn.subscriptions.discard(ctx.conv_id)
+    if ctx.room is not None:
+        await broker.leave_room(ctx.conn, ctx.conv_id)
+    await ctx.conn.send_json({"action": "unsubscribed", "conversation_id": ctx.conv_id})
+
+
+@action("fetch", db=True)
+async def handle_fetch(ctx: ActionContext):
+    logger.debug(f"Fetch boshlandi: {ctx.username} -> {ctx.conv_id}")
+    # Noto‘g‘ri qiymat DB’gacha yetib bormaydi (aks holda ValueError/DataError socketni uzadi);
+    # limit send_history’da HISTORY_MAX_PAGE_SIZE gacha qisqartiriladi
+    try:
+        before_id = optional_int(ctx.data, "before_id")
+        limit = optional_int(ctx.data, "limit")
+    except ValueError as e:
+        await ctx.error(f"{e} must be a positive integer")
+        return
+    await send_history(
+        ctx.conn, ctx.redis, ctx.conv_id,
+        before_id=before_id, limit=limit, batched=ctx.batched, legacy_keys=ctx.legacy_keys
+    )
+
+
+def cursor_int(data: dict):
+    # change_seq kursori: optional_int kabi, lekin 0 ham yaroqli (hali hech narsa olinmagan)
+    value = data.get("cursor")
+    if value == 0 and not isinstance(value, bool):
+        return 0
+    return optional_int(data, "cursor")
+
+
+async def sync_from_frame(ctx: ActionContext):
+    # Noto‘g‘ri cursor/limit (bool, inf, BIGINT’dan katta) DB’gacha yetmaydi - socket uzilmaydi
+    try:
+        cursor = cursor_int(ctx.data)
+        limit = optional_int(ctx.data, "limit")
+    except ValueError:
+        await ctx.error("cursor and limit must be integers")
+        return
+    await send_changes(ctx.conn, ctx.username, ctx.conv_id, cursor, limit)
+
+
+@action("sync", db=True)
+async def handle_sync(ctx: ActionContext):
+    await sync_from_frame(ctx)
+
+
+@action("ack", db=True)
+async def handle_ack(ctx: ActionContext):
+    try:
+        cursor = cursor_int(ctx.data)
+    except ValueError:
+        cursor = None
+    if cursor is None:
+        await ctx.error("cursor is required for ack action")
+        return
+    await crud.save_delivery_cursor(ctx.username, ctx.conv_id, cursor)
+
+
+async def record_receipt(ctx: ActionContext, field: str):
+    msg_id = required_msg_id(ctx.data)
+    if msg_id is None:
+        await ctx.error(f"msg_id is required for {ctx.action} action")
+        return
+    # Freym suhbatning boshqa tomoniga (xonada - barcha a’zolarga) birlashtirilib yuboriladi
+    receipts.record(ctx.username, ctx.conv_id, ctx.receiver, **{field: msg_id})
+
+
+@action("delivered")
+async def handle_delivered(ctx: ActionContext):
+    await record_receipt(ctx, "delivered_id")
+
+
+@action("read")
+async def handle_read(ctx: ActionContext):
+    await record_receipt(ctx, "read_id")
+
+
+@action("receipts", db=True)
+async def handle_receipts(ctx: ActionContext):
+    # Ulanishdan keyin: boshqa qatnashchilar qaysi xabargacha olgan/o‘qigan
+    await ctx.conn.send_json({
+        "action": "receipts",
+        "conversation_id": ctx.conv_id,
+        "receipts": await crud.fetch_receipts(ctx.conv_id, ctx.username),
+    })
+
+
+@action("send", db=True, cache=True, fanout=True)
+async def handle_send(ctx: ActionContext):
+    content = ctx.data.get("content")
+    if not content or not isinstance(content, str):
+        await ctx.conn.send_json({"error": "Content is required for send action"})
+        return None
+    # Yaroqsiz qiymat write-behind stream’iga ham, DB’ga ham yetib bormaydi
+    try:
+        reply_to_id = optional_int(ctx.data, "reply_to_id")
+    except ValueError:
+        await ctx.error("reply_to_id must be a positive integer")
+        return None
+    msg_id, timestamp = await writer.save_message(ctx.username, ctx.receiver, content, reply_to_id, conv_id=ctx.conv_id)
+    message = Message(
+        msg_id, ctx.username, content, timestamp.isoformat(),
+        reply_to_id=reply_to_id, conversation_id=ctx.conv_id
+    )
+    # Kesh va yetkazish bitta Redis round-trip’da
+    frame = Frame(message.to_wire())
+    await cache.append(ctx.pipe, ctx.cache_key, msg_id, frame.json)
+    await ctx.publish(frame)
+    return frame
+
+
+@action("voice", db=True, cache=True, fanout=True)
+async def handle_voice(ctx: ActionContext):
+    file_url = ctx.data.get("file_url")
+    logger.debug(f"Voice action qabul qilindi: {ctx.data}")
+    msg_id = ctx.data.get("msg_id", None)
+    if not file_url or not msg_id:
+        logger.error(f"Xato: file_url={file_url}, msg_id={msg_id}")
+        await ctx.conn.send_json({"error": "file_url and msg_id are required for voice action"})
+        return None
+    new_msg_id, timestamp = await writer.save_message(
+        ctx.username, ctx.receiver, file_url, msg_type="voice", conv_id=ctx.conv_id
+    )
+    message = Message(new_msg_id, ctx.username, file_url, timestamp.isoformat(), type="voice", conversation_id=ctx.conv_id)
+    frame = Frame(message.to_wire(action="voice"))
+    await cache.append(ctx.pipe, ctx.cache_key, new_msg_id, frame.json)
+    await ctx.publish(frame)
+    return frame
+
+
+async def apply_change(ctx: ActionContext, op: str, applied: bool, msg_id, value=None) -> bool:
+    # applied - suhbat (va muallif) bilan cheklangan UPDATE/DELETE qator topdimi. Topmasa: write-behind
+    # rejimida xabar hali navbatda bo‘lishi mumkin (DB’da umuman yo‘q) - o‘zgarish keyinga qoldiriladi;
+    # aks holda xabar boshqa suhbatda yoki boshqa muallifniki - xato, kesh va fan-out’ga tegilmaydi
+    if applied:
+        return True
+    if writer.enabled and not await crud.message_exists(msg_id):
+        await writer.defer_update(op, msg_id, value, ctx.conv_id, ctx.username)
+        return True
+    await ctx.error("Message not found in this conversation")
+    return False
+
+
+@action("edit", db=True, cache=True, fanout=True)
+async def handle_edit(ctx: ActionContext):
+    msg_id = required_msg_id(ctx.data)
+    new_content = ctx.data.get("content")
+    if msg_id is None or not new_content or not isinstance(new_content, str):
+        await ctx.conn.send_json({"error": "msg_id and content are required"})
+        return None
+    applied = await crud.edit_message(msg_id, new_content, ctx.conv_id, ctx.username)
+    if not await apply_change(ctx, "edit", applied, msg_id, new_content):
+        return None
+    frame = Frame({
+        "conversation_id": ctx.conv_id,
+        "action": "edit",
+        "msg_id": msg_id,
+        "content": new_content,
+        "edited": True
+    })
+    # Kesh yozuvi WATCH tranzaksiyasi bilan, pipeline’dan tashqarida
+    await cache.update(ctx.redis, ctx.cache_key, msg_id, {"content": new_content, "edited": True})
+    await ctx.publish(frame)
+    return frame
+
+
+@action("delete", db=True, cache=True, fanout=True)
+async def handle_delete(ctx: ActionContext):
+    msg_id = required_msg_id(ctx.data)
+    delete_for_all = ctx.data.get("delete_for_all", False)
+    if msg_id is None:
+        await ctx.conn.send_json({"error": "msg_id is required for delete action"})
+        return None
+    if delete_for_all:
+        applied = await crud.mark_deleted(msg_id, ctx.conv_id, ctx.username)
+        if not await apply_change(ctx, "delete", applied, msg_id):
+            return None
+        await cache.update(ctx.redis, ctx.cache_key, msg_id, {"content": DELETED_CONTENT, "deleted": True})
+    frame = Frame({
+        "conversation_id": ctx.conv_id,
+        "action": "delete",
+        "msg_id": msg_id,
+        "delete_for_all": delete_for_all,
+        "content": DELETED_CONTENT if delete_for_all else None
+    })
+    await ctx.publish(frame)
+    return frame
+
+
+@action("delete_permanent", db=True, cache=True, fanout=True)
+async def handle_delete_permanent(ctx: ActionContext):
+    msg_id = required_msg_id(ctx.data)
+    if msg_id is None:
+        await ctx.conn.send_json({"error": "msg_id is required for delete_permanent action"})
+        return None
+    applied = await crud.delete_message(msg_id, ctx.conv_id, ctx.username)
+    if not await apply_change(ctx, "delete_permanent", applied, msg_id):
+        return None
+    frame = Frame({
+        "conversation_id": ctx.conv_id,
+        "action": "delete_permanent",
+        "msg_id": msg_id
+    })
+    await cache.remove(ctx.pipe, ctx.cache_key, msg_id)
+    await ctx.publish(frame)
+    return frame
+
+
+@action("react", db=True, cache=True, fanout=True)
+async def handle_react(ctx: ActionContext):
+    msg_id = required_msg_id(ctx.data)
+    reaction = ctx.data.get("reaction")
+    if msg_id is None or not reaction or not isinstance(reaction, str):
+        await ctx.conn.send_json({"error": "msg_id and reaction are required"})
+        return None
+    applied = await crud.set_reaction(msg_id, reaction, ctx.conv_id)
+    if not await apply_change(ctx, "react", applied, msg_id, reaction):
+        return None
+    frame = Frame({
+        "conversation_id": ctx.conv_id,
+        "action": "react",
+        "msg_id": msg_id,
+        "reaction": reaction
+    })
+    await cache.update(ctx.redis, ctx.cache_key, msg_id, {"reaction": reaction})
+    await ctx.publish(frame)
+    return frame
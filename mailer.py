@@ -0,0 +1,164 @@
+# mailer.py
+# Chiquvchi email: so‘rov faqat xatni navbatga qo‘yadi, SMTP bilan fon workerlari ishlaydi.
+# Har bir worker bitta autentifikatsiyadan o‘tgan SMTP ulanishini qayta ishlatadi (connect,
+# STARTTLS, login har xat uchun emas), sinxron smtplib chaqiruvlari thread’da - event loop
+# bloklanmaydi. Xato bo‘lsa xat MAIL_RETRY_BASE * 2^urinish (MAIL_RETRY_MAX gacha) kutib qayta
+# yuboriladi, MAIL_MAX_RETRIES dan keyin tashlanadi. Bitta manzilga MAIL_RATE_WINDOW ichida
+# MAIL_RATE_LIMIT tadan ortiq xat yuborilmaydi (Redis hisoblagichi - barcha workerlar uchun umumiy).
+# SMTP_USER/SMTP_PASSWORD berilmasa mailer ishga tushmaydi (enabled=False).
+# Navbat jarayon xotirasida: to‘xtatilganda yuborilmagan xatlar yo‘qoladi (parol tiklashni
+# foydalanuvchi qayta so‘rashi mumkin).
+import asyncio
+import logging
+import smtplib
+from email.mime.text import MIMEText
+from config import (
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_STARTTLS, SMTP_TIMEOUT, MAIL_FROM, MAIL_WORKERS,
+    MAIL_QUEUE_SIZE, MAIL_MAX_RETRIES, MAIL_RETRY_BASE, MAIL_RETRY_MAX, MAIL_RATE_LIMIT, MAIL_RATE_WINDOW,
+    MAIL_IDLE_TIMEOUT,
+)
+from database import get_redis
+from metrics import mail_events
+
+logger = logging.getLogger(__name__)
+
+RATE_PREFIX = "mailrate:"
+
+# Oynadagi birinchi so‘rov TTL’ni qo‘yadi; skript atomar - INCR va EXPIRE orasida kalit muddati
+# tugab, TTL’siz qolib ketmaydi. TTL’siz qolgan eski kalitga ham TTL qo‘yiladi
+RATE_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 or redis.call('TTL', KEYS[1]) == -1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class SmtpConnection:
+    # Bitta workerning SMTP ulanishi; metodlar sinxron va faqat shu worker thread’idan chaqiriladi
+    def __init__(self):
+        self.smtp = None
+
+    def _connect(self):
+        smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        self.smtp = smtp
+
+    def send(self, msg: MIMEText):
+        if self.smtp is None:
+            self._connect()
+        try:
+            self.smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Server bo‘sh turgan ulanishni yopgan - bir marta qayta ulanib yuboriladi
+            self.smtp = None
+            self._connect()
+            self.smtp.send_message(msg)
+
+    def close(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.smtp = None
+
+
+class Mailer:
+    def __init__(self, workers: int = MAIL_WORKERS):
+        self.workers = workers
+        self.queue = None
+        self.redis = None
+        self._tasks = []
+        self._retries = set()
+        self._rate = None
+        self.enabled = bool(SMTP_USER and SMTP_PASSWORD)
+
+    async def start(self):
+        if not self.enabled:
+            logger.warning("SMTP_USER/SMTP_PASSWORD berilmagan: mailer o‘chirilgan")
+            return
+        self.redis = get_redis()
+        self._rate = self.redis.register_script(RATE_SCRIPT)
+        self.queue = asyncio.Queue(maxsize=MAIL_QUEUE_SIZE)
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+        logger.info(f"Mailer ishga tushdi (workers={self.workers}, smtp={SMTP_HOST}:{SMTP_PORT})")
+
+    async def stop(self):
+        tasks = [*self._tasks, *self._retries]
+        for task in tasks:
+            task.cancel()
+        # Workerlar SMTP ulanishini (thread’da) yopib bo‘lishini kutish
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+        if self.queue is not None and self.queue.qsize():
+            logger.warning(f"Mailer to‘xtatildi, {self.queue.qsize()} ta xat yuborilmadi")
+
+    async def allow(self, email: str) -> bool:
+        # Manzil bo‘yicha limit (RATE_SCRIPT; EXPIRE ... NX Redis 7 dan oldin yo‘q)
+        key = RATE_PREFIX + email.strip().lower()
+        count = await self._rate(keys=[key], args=[MAIL_RATE_WINDOW])
+        if count > MAIL_RATE_LIMIT:
+            mail_events.inc("rate_limited")
+            return False
+        return True
+
+    def send(self, to: str, subject: str, body: str):
+        # Kutmaydi: navbat to‘la bo‘lsa MailQueueFull
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        msg["From"] = MAIL_FROM
+        msg["To"] = to
+        try:
+            self.queue.put_nowait((msg, 0))
+        except asyncio.QueueFull:
+            raise MailQueueFull()
+
+    def send_reset_code(self, email: str, reset_code: str):
+        self.send(email, "Parolni Tiklash", f"Sizning parolni tiklash kodingiz: {reset_code}")
+
+    async def _retry_later(self, msg: MIMEText, attempt: int):
+        await asyncio.sleep(min(MAIL_RETRY_MAX, MAIL_RETRY_BASE * 2 ** (attempt - 1)))
+        await self.queue.put((msg, attempt))
+
+    async def _worker_loop(self):
+        conn = SmtpConnection()
+        try:
+            while True:
+                try:
+                    msg, attempt = await asyncio.wait_for(self.queue.get(), MAIL_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # Uzoq bo‘sh turgan ulanishni server baribir uzadi
+                    await asyncio.to_thread(conn.close)
+                    continue
+                try:
+                    await asyncio.to_thread(conn.send, msg)
+                    mail_events.inc("sent")
+                except (smtplib.SMTPException, OSError) as e:
+                    await asyncio.to_thread(conn.close)
+                    attempt += 1
+                    if attempt > MAIL_MAX_RETRIES:
+                        mail_events.inc("failed")
+                        logger.error(f"Xat yuborilmadi ({msg['To']}), urinishlar tugadi: {str(e)}")
+                        continue
+                    mail_events.inc("retried")
+                    logger.warning(f"Xat yuborilmadi ({msg['To']}), {attempt}-qayta urinish: {str(e)}")
+                    task = asyncio.create_task(self._retry_later(msg, attempt))
+                    self._retries.add(task)
+                    task.add_done_callback(self._retries.discard)
+        finally:
+            # quit() server javobini kutadi - sinxron chaqiruv event loop’ni bloklamasligi uchun thread’da
+            await asyncio.to_thread(conn.close)
+
+
+mailer = Mailer()
@@ -1,8 +1,21 @@
 import os
+import asyncio
 import uvicorn
-from fastapi import FastAPI
-from config import NEONDB_PARAMS, setup_cors
-from database import init_db
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse
+from config import (
+    NEONDB_PARAMS, WS_PER_MESSAGE_DEFLATE, STORAGE_BACKEND, LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL, setup_cors,
+)
+from database import init_db, init_pool, close_pool, init_redis, close_redis, pool_stats
+from broker import broker
+from writebehind import writer
+from mailer import mailer
+from receipts import receipts
+from auth import tokens
+import passwords
+import metrics
+from metrics import action_latency, loop_monitor
 from routes import router
 from websocket import router as websocket_routes
 # from wss import router as websocket_routes
@@ -16,18 +29,59 @@ setup_cors(app)
 app.include_router(router)
 app.include_router(websocket_routes)
 
-# Dastur boshlanganda jadval yaratish
+# Lokal storage (STORAGE_BACKEND=local): yuklangan fayllar shu yerdan beriladi
+if STORAGE_BACKEND == "local":
+    app.mount(LOCAL_STORAGE_URL, StaticFiles(directory=LOCAL_STORAGE_DIR, check_dir=False), name="media")
+
+# Dastur boshlanganda pool ochish va jadval yaratish
 @app.on_event("startup")
 async def startup_event():
-    init_db()
+    await init_pool()
+    await init_redis()
+    await init_db()
+    await tokens.start()
+    await broker.start()
+    await writer.start()
+    await receipts.start()
+    await mailer.start()
+    await loop_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await loop_monitor.stop()
+    await mailer.stop()
+    await receipts.stop()
+    await writer.stop()
+    await broker.stop()
+    await tokens.stop()
+    await close_redis()
+    await close_pool()
+    passwords.shutdown()
+
+# Pooldan ulanish DB_ACQUIRE_TIMEOUT ichida olinmasa - 503
+@app.exception_handler(asyncio.TimeoutError)
+async def pool_timeout_handler(request: Request, exc: asyncio.TimeoutError):
+    return JSONResponse(status_code=503, content={"detail": "Server band, keyinroq urinib ko‘ring"})
 
 @app.get("/")
 async def root():
     return {"message": "Server va API ishlayapti!"}
 
+# DB va Redis pool to‘yinganligi, socketlarning chiquvchi navbatlari, action’lar kechikishi
+@app.get("/stats")
+async def stats():
+    return {**pool_stats(), "outbound": broker.outbound_stats(), "actions": action_latency.snapshot()}
+
+# Prometheus scrape: socketlar, freymlar, DB/kesh/fan-out kechikishi, event loop lag, pool holati.
+# Har bir worker o‘z metrikalarini beradi (--workers > 1 da har birini alohida scrape qiling)
+@app.get("/metrics")
+async def prometheus_metrics():
+    text = metrics.render({"pool": pool_stats(), "outbound": broker.outbound_stats()})
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))  # Railway’dan PORT o‘qiydi, default 8000
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE)
 
 # import os
 # import uvicorn
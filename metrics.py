@@ -0,0 +1,189 @@
+# metrics.py
+# Jarayon ichidagi oddiy metrikalar (tashqi kutubxonasiz). Histogram - Prometheus uslubidagi
+# kumulyativ bucket’lar; /stats da count/sum va bucket’lardan baholangan p50/p95/p99,
+# /metrics da Prometheus text formatida (render). Har bir metrika REGISTRY ga o‘zi qo‘shiladi.
+# Hot path’da faqat lug‘atdagi sonni oshirish bor - qulf, format va I/O yo‘q.
+import asyncio
+import time
+from contextlib import contextmanager
+from config import METRICS_LOOP_LAG_INTERVAL
+
+# Soniyalarda: 1 ms dan 10 s gacha
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Jarayon ichidagi tezkor ishlar uchun: 50 µs dan 1 s gacha
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1.0)
+
+REGISTRY = []
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # {label qiymatlari: son}
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # {label qiymatlari: [bucket hisoblari..., +Inf], sum}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def quantile(self, q: float, *labels) -> float:
+        # Bucket yuqori chegarasi bo‘yicha baho (Prometheus histogram_quantile kabi, interpolyatsiyasiz)
+        counts, _ = self.series[labels]
+        target = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        result = {}
+        for labels, (counts, total) in self.series.items():
+            result[":".join(labels) or self.name] = {
+                "count": sum(counts),
+                "sum": round(total, 6),
+                "p50": self.quantile(0.5, *labels),
+                "p95": self.quantile(0.95, *labels),
+                "p99": self.quantile(0.99, *labels),
+            }
+        return result
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, labels, f'le="{le}"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+def _flatten(prefix: str, stats: dict):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def render(stats: dict = None) -> str:
+    # Prometheus text format (0.0.4). stats - so‘rov paytida hisoblanadigan qiymatlar
+    # (pool_stats, outbound_stats), gauge sifatida "chat_<kalit>_<kalit>" nomi bilan chiqadi
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, value in _flatten("chat", stats or {}):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    # Event loop kechikishi: sleep(interval) qancha kech uyg‘ongani. Bloklovchi kod yoki
+    # haddan tashqari ko‘p tayyor task bo‘lsa o‘sadi
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            loop_lag.observe(lag)
+            loop_lag_last.set(lag)
+
+
+# WebSocket action’lari bajarilish vaqti (handlers.dispatch)
+action_latency = Histogram("ws_action_duration_seconds", "WebSocket action handler latency", ("action",))
+active_sockets = Gauge("ws_active_sockets", "Open WebSocket connections in this process")
+frames_in = Counter("ws_frames_in_total", "Inbound WebSocket frames", ("action",))
+frames_out = Counter("ws_frames_out_total", "Frames produced by action handlers (echo and fan-out)", ("action",))
+frames_sent = Counter("ws_frames_sent_total", "Frames written to sockets")
+# database.acquire: pooldan ulanish kutish va ulanish ushlab turilgan vaqt (so‘rov/tranzaksiya)
+db_acquire_wait = Histogram("db_pool_acquire_seconds", "Time waiting for a pooled DB connection")
+db_query_latency = Histogram("db_query_duration_seconds", "DB connection hold time per operation", ("op",))
+cache_lookups = Counter("cache_history_lookups_total", "History page lookups in the messages:* cache", ("result",))
+user_search_cache = Counter("cache_user_search_lookups_total", "First-page GET /users lookups in cache", ("result",))
+fanout_latency = Histogram(
+    "fanout_local_duration_seconds", "Enqueueing one frame to local sockets", ("scope",), buckets=FAST_BUCKETS
+)
+mail_events = Counter("mail_events_total", "Outbound mail queue results", ("result",))
+receipt_events = Counter("receipt_events_total", "Delivered/read receipt buffer activity", ("result",))
+auth_checks = Counter("auth_token_checks_total", "Session token verifications", ("result",))
+loop_lag = Histogram("event_loop_lag_seconds", "Event loop scheduling delay", buckets=FAST_BUCKETS)
+loop_lag_last = Gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample")
+
+loop_monitor = LoopLagMonitor(METRICS_LOOP_LAG_INTERVAL)
@@ -0,0 +1,282 @@
+# migrations.py
+# Versiyalangan sxema migratsiyalari. Har bir migratsiya bir marta bajariladi va
+# schema_migrations jadvaliga yoziladi. Yangi o‘zgarish - ro‘yxat oxiriga yangi versiya,
+# eski versiyalar hech qachon o‘zgartirilmaydi.
+#
+# Har bir element: (versiya, nom, SQL buyruqlar ro‘yxati, tranzaksiya ichidami)
+# CREATE INDEX CONCURRENTLY tranzaksiya ichida ishlamaydi - bunday migratsiyalar
+# tranzaksiyasiz bajariladi va idempotent (IF NOT EXISTS) yozilishi shart.
+#
+# Migratsiyalar pooldan emas, timeout’siz alohida ulanishda va sessiya darajasidagi advisory lock
+# ostida bajariladi (bir vaqtda faqat bitta worker). Sessiya lock’i sababli ulanish to‘g‘ridan-to‘g‘ri
+# Postgres’ga (NEONDB_DIRECT_HOST) ochiladi, PgBouncer transaction mode orqali emas.
+# Uzilgan CONCURRENTLY qurilishi INVALID indeks qoldiradi va IF NOT EXISTS uni o‘tkazib yuboradi:
+# shuning uchun bunday indeks avval o‘chiriladi, qurilgandan keyin indisvalid tekshiriladi va
+# yaroqsiz bo‘lsa versiya yozilmaydi (keyingi ishga tushishda qayta quriladi).
+import logging
+import re
+from database import connect_direct
+
+logger = logging.getLogger(__name__)
+
+# Bir vaqtda ishga tushgan workerlar migratsiyani ikki marta bajarmasligi uchun
+MIGRATION_LOCK_ID = 8_114_202_501
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE,
+            email VARCHAR(100) UNIQUE,
+            password VARCHAR(256),
+            reset_code VARCHAR(6)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id SERIAL PRIMARY KEY,
+            sender_username VARCHAR(255) NOT NULL,
+            receiver_username VARCHAR(255) NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            edited BOOLEAN DEFAULT FALSE,
+            deleted BOOLEAN DEFAULT FALSE,
+            reaction VARCHAR(50),
+            reply_to_id INT,
+            type VARCHAR(50) DEFAULT 'text',
+            FOREIGN KEY (reply_to_id) REFERENCES messages(id) ON DELETE SET NULL
+        )
+        """,
+        # init_db davridagi bazalarda type ustuni bo‘lmasligi mumkin
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS type VARCHAR(50) DEFAULT 'text'",
+    ], True),
+    (2, "messages.conversation_id", [
+        # conversation.conversation_id() bilan bir xil: 'dm:' || kichik || ':' || katta (bayt tartibida)
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS conversation_id VARCHAR(520)",
+        """
+        UPDATE messages
+        SET conversation_id = 'dm:' || LEAST(sender_username COLLATE "C", receiver_username COLLATE "C")
+                           || ':' || GREATEST(sender_username COLLATE "C", receiver_username COLLATE "C")
+        WHERE conversation_id IS NULL
+        """,
+        "ALTER TABLE messages ALTER COLUMN conversation_id SET NOT NULL",
+    ], True),
+    (3, "conversation history indexes", [
+        # Suhbat tarixi: WHERE conversation_id = $1 [AND id < $2] ORDER BY id DESC LIMIT n
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_conversation_id "
+        "ON messages (conversation_id, id DESC)",
+        # ON DELETE SET NULL uchun: xabar o‘chirilganda javoblarni qidirish
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_reply_to_id "
+        "ON messages (reply_to_id) WHERE reply_to_id IS NOT NULL",
+    ], False),
+    (4, "bigint message ids", [
+        # snowflake id’lar (53 bit) INT ga sig‘maydi
+        "ALTER TABLE messages ALTER COLUMN id TYPE BIGINT, ALTER COLUMN reply_to_id TYPE BIGINT",
+        "ALTER SEQUENCE IF EXISTS messages_id_seq AS BIGINT",
+    ], True),
+    (5, "rooms", [
+        """
+        CREATE TABLE IF NOT EXISTS rooms (
+            id BIGSERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            created_by VARCHAR(50) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS room_members (
+            room_id BIGINT NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+            username VARCHAR(50) NOT NULL,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (room_id, username)
+        )
+        """,
+        # Foydalanuvchining xonalari ro‘yxati
+        "CREATE INDEX IF NOT EXISTS idx_room_members_username ON room_members (username)",
+        # Xona xabarlarida qabul qiluvchi yo‘q: conversation_id = 'room:<id>'
+        "ALTER TABLE messages ALTER COLUMN receiver_username DROP NOT NULL",
+    ], True),
+    (6, "user search indexes", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # Prefiks qidiruvi va kursor: lower(username) COLLATE "C" LIKE 'ab%' AND > $2 ORDER BY ...
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username_prefix "
+        "ON users ((lower(username)) COLLATE \"C\")",
+        # Qism-satr qidiruvi: lower(username) LIKE '%ab%'
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username_trgm "
+        "ON users USING gin (lower(username) gin_trgm_ops)",
+    ], False),
+    (7, "change sequence and delivery cursors", [
+        # Har bir o‘zgarish (yangi xabar, tahrir, o‘chirish, reaksiya) qatorga yangi change_seq beradi;
+        # qayta ulangan klient faqat o‘zi tasdiqlagan seq’dan keyingilarini oladi ("sync")
+        "CREATE SEQUENCE IF NOT EXISTS message_change_seq AS BIGINT",
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS change_seq BIGINT",
+        "UPDATE messages SET change_seq = nextval('message_change_seq') WHERE change_seq IS NULL",
+        "ALTER TABLE messages ALTER COLUMN change_seq SET DEFAULT nextval('message_change_seq')",
+        "ALTER TABLE messages ALTER COLUMN change_seq SET NOT NULL",
+        # Butunlay o‘chirilgan xabarlar: qator yo‘q, klientga faqat id yetkaziladi
+        """
+        CREATE TABLE IF NOT EXISTS message_tombstones (
+            msg_id BIGINT PRIMARY KEY,
+            conversation_id VARCHAR(520) NOT NULL,
+            change_seq BIGINT NOT NULL DEFAULT nextval('message_change_seq'),
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_message_tombstones_sync ON message_tombstones (conversation_id, change_seq)",
+        # Foydalanuvchi har bir suhbatda qaysi change_seq gacha olganini tasdiqlagan
+        """
+        CREATE TABLE IF NOT EXISTS delivery_cursors (
+            username VARCHAR(50) NOT NULL,
+            conversation_id VARCHAR(520) NOT NULL,
+            last_seq BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, conversation_id)
+        )
+        """,
+    ], True),
+    (8, "change sequence index", [
+        # Sync: WHERE conversation_id = $1 AND change_seq > $2 ORDER BY change_seq LIMIT n
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_conversation_change_seq "
+        "ON messages (conversation_id, change_seq)",
+    ], False),
+    (9, "delivered/read receipts", [
+        # Har bir xabar uchun emas: foydalanuvchi suhbatda qaysi msg_id gacha olgan/o‘qigan
+        "ALTER TABLE delivery_cursors ADD COLUMN IF NOT EXISTS delivered_id BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE delivery_cursors ADD COLUMN IF NOT EXISTS read_id BIGINT NOT NULL DEFAULT 0",
+    ], True),
+    (10, "escaped dm conversation ids", [
+        # conversation.conversation_id() bilan bir xil: username’dagi '%' -> '%25', ':' -> '%3A'.
+        # Faqat shunday belgili username’lar qatnashgan DM qatorlari qayta hisoblanadi, qolganlarining
+        # id’si o‘zgarmaydi. Tombstone va delivery_cursors - 12-migratsiyada.
+        """
+        UPDATE messages
+        SET conversation_id = 'dm:'
+            || replace(replace(LEAST(sender_username COLLATE "C", receiver_username COLLATE "C"), '%', '%25'), ':', '%3A')
+            || ':'
+            || replace(replace(GREATEST(sender_username COLLATE "C", receiver_username COLLATE "C"), '%', '%25'), ':', '%3A')
+        WHERE conversation_id LIKE 'dm:%'
+          AND (strpos(sender_username, ':') > 0 OR strpos(sender_username, '%') > 0
+               OR strpos(receiver_username, ':') > 0 OR strpos(receiver_username, '%') > 0)
+        """,
+    ], True),
+    (11, "user search tie-breaker index", [
+        # Prefiks qidiruvi va kursor: (lower(username), username) > ($3, $4) ORDER BY ikkalasi -
+        # registri bilan farq qiluvchi username’lar sahifa chegarasida tushib qolmasligi uchun
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username_prefix_key "
+        "ON users ((lower(username)) COLLATE \"C\", username COLLATE \"C\")",
+        # Eski indeksni yangisi to‘liq qoplaydi
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_users_username_prefix",
+    ], False),
+    (12, "escaped dm ids for cursors and tombstones", [
+        # 10-migratsiya ko‘chirgan DM’lar: eski (ekranlanmagan) id -> yangi id, har bir ishtirokchi uchun
+        """
+        CREATE TEMP TABLE dm_id_moves ON COMMIT DROP AS
+        SELECT DISTINCT
+            'dm:' || LEAST(sender_username COLLATE "C", receiver_username COLLATE "C")
+                  || ':' || GREATEST(sender_username COLLATE "C", receiver_username COLLATE "C") AS old_id,
+            conversation_id AS new_id,
+            p.username
+        FROM messages CROSS JOIN LATERAL unnest(ARRAY[sender_username, receiver_username]) AS p(username)
+        WHERE conversation_id LIKE 'dm:%'
+          AND (strpos(sender_username, ':') > 0 OR strpos(sender_username, '%') > 0
+               OR strpos(receiver_username, ':') > 0 OR strpos(receiver_username, '%') > 0)
+        """,
+        # Eski id boshqa suhbatning amaldagi yangi id’siga teng bo‘lsa (masalan "a%25" va "a%"),
+        # undagi qatorlar o‘sha suhbatniki - ularga tegilmaydi
+        "DELETE FROM dm_id_moves WHERE old_id IN (SELECT new_id FROM dm_id_moves)",
+        # Kursorlar yangi id’ga ko‘chiriladi. Bir eski id bir nechta suhbatni birlashtirgan bo‘lsa,
+        # undagi tombstone qaysi suhbatniki ekanini bilib bo‘lmaydi: last_seq 0 dan boshlanadi va klient
+        # yangi suhbatni to‘liq sync qiladi (o‘chirilgan xabarlar javobda bo‘lmaydi). Receipt id’lari
+        # global - ular saqlanadi.
+        """
+        INSERT INTO delivery_cursors (username, conversation_id, last_seq, delivered_id, read_id)
+        SELECT c.username, m.new_id,
+               CASE WHEN t.targets = 1 THEN c.last_seq ELSE 0 END, c.delivered_id, c.read_id
+        FROM delivery_cursors c
+        JOIN dm_id_moves m ON m.old_id = c.conversation_id AND m.username = c.username
+        JOIN (SELECT old_id, count(DISTINCT new_id) AS targets FROM dm_id_moves GROUP BY old_id) t
+          ON t.old_id = m.old_id
+        ON CONFLICT (username, conversation_id) DO UPDATE
+        SET last_seq = GREATEST(delivery_cursors.last_seq, EXCLUDED.last_seq),
+            delivered_id = GREATEST(delivery_cursors.delivered_id, EXCLUDED.delivered_id),
+            read_id = GREATEST(delivery_cursors.read_id, EXCLUDED.read_id),
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        "DELETE FROM delivery_cursors c USING dm_id_moves m WHERE c.conversation_id = m.old_id",
+        # Tombstone faqat eski id bitta suhbatga to‘g‘ri kelganda ko‘chiriladi; birlashgan id’lardagilari
+        # eski id’da qoladi (yuqoridagi to‘liq sync ularning o‘rnini bosadi)
+        """
+        UPDATE message_tombstones t SET conversation_id = m.new_id
+        FROM (
+            SELECT old_id, min(new_id) AS new_id FROM dm_id_moves
+            GROUP BY old_id HAVING count(DISTINCT new_id) = 1
+        ) m
+        WHERE t.conversation_id = m.old_id
+        """,
+    ], True),
+]
+
+
+async def applied_versions(conn) -> set:
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    rows = await conn.fetch("SELECT version FROM schema_migrations")
+    return {row["version"] for row in rows}
+
+
+CONCURRENT_INDEX_RE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+async def index_valid(conn, name: str):
+    # None - indeks yo‘q, True/False - pg_index.indisvalid
+    return await conn.fetchval("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1 AND pg_catalog.pg_table_is_visible(c.oid)
+    """, name)
+
+
+async def run_concurrent(conn, statements):
+    for statement in statements:
+        match = CONCURRENT_INDEX_RE.search(statement)
+        if match and await index_valid(conn, match.group(1)) is False:
+            logger.warning(f"Yaroqsiz indeks {match.group(1)} qayta quriladi")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+        await conn.execute(statement)
+        if match and not await index_valid(conn, match.group(1)):
+            raise RuntimeError(f"Indeks {match.group(1)} qurilmadi (INVALID)")
+
+
+async def migrate():
+    conn = await connect_direct()
+    try:
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+        try:
+            # Lock olingandan keyin o‘qiladi: boshqa worker bajarib bo‘lganlari qayta bajarilmaydi
+            done = await applied_versions(conn)
+            for version, name, statements, transactional in MIGRATIONS:
+                if version in done:
+                    continue
+                if transactional:
+                    async with conn.transaction():
+                        for statement in statements:
+                            await conn.execute(statement)
+                        await conn.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name
+                        )
+                else:
+                    await run_concurrent(conn, statements)
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name
+                    )
+                logger.info(f"Migratsiya {version} ({name}) bajarildi")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+    finally:
+        await conn.close()
@@ -1,5 +1,10 @@
 # models.py
 from pydantic import BaseModel
+from dataclasses import dataclass
+from typing import List, Optional
+
+# O‘chirilgan xabar o‘rniga ko‘rsatiladigan matn
+DELETED_CONTENT = "This message was deleted"
 
 class UserRegister(BaseModel):
     username: str
@@ -19,4 +24,80 @@ class VerifyResetCode(BaseModel):
 
 class NewPassword(BaseModel):
     email: str
-    new_password: str
\ No newline at end of file
+    new_password: str
+
+class RoomCreate(BaseModel):
+    name: str
+    creator: str
+    members: List[str] = []
+
+class RoomMembers(BaseModel):
+    usernames: List[str]
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int  # baytlarda
+    sender: str
+    receiver: str
+
+
+# Chat xabari: DB qatori, kesh va yetkazish uchun yagona tur. slots - har bir xabar uchun
+# __dict__ yo‘q, katta tarix sahifalarida xotira va allokatsiya kamroq.
+@dataclass(slots=True)
+class Message:
+    msg_id: int
+    sender: str
+    content: str
+    timestamp: str  # ISO format, bir marta hosil qilinadi
+    edited: bool = False
+    deleted: bool = False
+    reaction: Optional[str] = None
+    reply_to_id: Optional[int] = None
+    type: str = "text"
+    conversation_id: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> "Message":
+        deleted = row["deleted"]
+        return cls(
+            row["id"],
+            row["sender_username"],
+            DELETED_CONTENT if deleted else row["content"],
+            row["timestamp"].isoformat(),
+            row["edited"],
+            deleted,
+            row["reaction"] or None,
+            row["reply_to_id"] or None,
+            row["type"] or "text",
+        )
+
+    @classmethod
+    def from_wire(cls, data: dict) -> "Message":
+        # Eski kesh yozuvlarida ba’zi maydonlar bo‘lmasligi mumkin (masalan, ovozli xabarlar)
+        return cls(
+            data["msg_id"],
+            data["sender"],
+            data["content"],
+            data["timestamp"],
+            data.get("edited", False),
+            data.get("deleted", False),
+            data.get("reaction"),
+            data.get("reply_to_id"),
+            data.get("type") or "text",
+            data.get("conversation_id"),
+        )
+
+    def to_wire(self, action: str = None) -> dict:
+        wire = {} if self.conversation_id is None else {"conversation_id": self.conversation_id}
+        wire["msg_id"] = self.msg_id
+        wire["sender"] = self.sender
+        wire["content"] = self.content
+        wire["timestamp"] = self.timestamp
+        wire["edited"] = self.edited
+        wire["deleted"] = self.deleted
+        wire["reaction"] = self.reaction
+        wire["reply_to_id"] = self.reply_to_id
+        wire["type"] = self.type
+        if action is not None:
+            wire["action"] = action
+        return wire
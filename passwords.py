@@ -0,0 +1,107 @@
+# passwords.py
+# Parol xeshlash: tuzli scrypt (hashlib, xotira talab qiladigan KDF). Bitta xesh o‘nlab ms CPU
+# oladi, shuning uchun event loop’da emas, cheklangan pool’da bajariladi:
+#   PASSWORD_HASH_EXECUTOR=thread  - hashlib.scrypt GIL’ni qo‘yib yuboradi, thread’lar yetarli
+#   PASSWORD_HASH_EXECUTOR=process - alohida jarayonlar (CPU ko‘p bo‘lsa yoki GIL muammo bo‘lsa)
+# Navbatda PASSWORD_HASH_MAX_PENDING tadan ortiq so‘rov PASSWORD_HASH_QUEUE_TIMEOUT kutadi, keyin
+# asyncio.TimeoutError (main.py - 503): login to‘lqini boshqa so‘rovlarni bosib qo‘ymaydi.
+#
+# Saqlash formati: scrypt$<n>$<r>$<p>$<tuz b64>$<xesh b64>. Eski 64 belgili SHA-256 xeshlar
+# ham tekshiriladi va muvaffaqiyatli logindan keyin joriy parametrlar bilan qayta xeshlanadi
+# (needs_rehash). Parametrlar o‘zgartirilsa, eski scrypt xeshlar ham shu yo‘l bilan yangilanadi.
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import (
+    PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P, PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+from utils import hash_password as legacy_sha256
+
+SCHEME = "scrypt"
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+_executor = None
+_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_SIZE, maxmem=256 * n * r * p + 1024 * 1024
+    )
+
+
+def hash_sync(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
+    salt = os.urandom(SALT_SIZE)
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_sync(password: str, stored: str) -> bool:
+    if stored.startswith(SCHEME + "$"):
+        try:
+            _, n, r, p, salt, key = stored.split("$")
+            expected = _unb64(key)
+            actual = _scrypt(password, _unb64(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+    # Eski format: tuzsiz SHA-256 (hex)
+    return hmac.compare_digest(legacy_sha256(password), stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(f"{SCHEME}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$")
+
+
+# Foydalanuvchi topilmaganda ham bir xil vaqt sarflanadi (username mavjudligini vaqt bo‘yicha bilib bo‘lmaydi)
+DUMMY_HASH = hash_sync("dummy-password")
+
+
+def _get_executor():
+    # Birinchi murojaatda yaratiladi: uvicorn workerlari fork’dan keyin o‘z pool’ini oladi
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+    return _executor
+
+
+async def _run(func, *args):
+    await asyncio.wait_for(_slots.acquire(), PASSWORD_HASH_QUEUE_TIMEOUT)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+    finally:
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_sync, password)
+
+
+async def verify_password(password: str, stored) -> bool:
+    # stored None bo‘lsa (foydalanuvchi yo‘q) DUMMY_HASH bilan tekshiriladi va False
+    if stored is None:
+        await _run(verify_sync, password, DUMMY_HASH)
+        return False
+    return await _run(verify_sync, password, stored)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
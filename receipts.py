@@ -0,0 +1,145 @@
+# receipts.py
+# Yetkazildi/o‘qildi holati: har bir xabar uchun qator emas, (foydalanuvchi, suhbat) bo‘yicha
+# ikkita chegara - delivered_id va read_id (shu id gacha barcha xabarlar yetkazilgan/o‘qilgan).
+# Klient "delivered"/"read" freymini har xabar uchun yuborsa ham:
+#   - chegara faqat oldinga suriladi, eski/takroriy freym hech narsa qilmaydi
+#   - RECEIPT_FRAME_INTERVAL ichidagi barcha o‘zgarishlar bitta "receipt" freymiga birlashadi
+#     (oraliqdagi barcha id’larni qoplaydi) va suhbatning boshqa tomoniga yuboriladi
+#   - DB’ga RECEIPT_FLUSH_INTERVAL da bir marta, barcha o‘zgarganlar bitta so‘rovda yoziladi
+#     (delivery_cursors jadvali, GREATEST - workerlar tartibi muhim emas)
+# Klient freymdagi qiymatlarni max bilan qo‘llaydi: boshqa workerdagi socket eskiroq chegarani
+# yuborishi mumkin (har bir worker faqat o‘zi ko‘rgan freymlarni biladi).
+# Buferdagi yozilmagan chegaralar to‘xtatishda yoziladi; jarayon yiqilsa oxirgi oraliq yo‘qolishi
+# mumkin - klient keyingi freymda qayta yuboradi.
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+import asyncpg
+import crud
+from broker import broker
+from codec import Frame
+from config import RECEIPT_FRAME_INTERVAL, RECEIPT_FLUSH_INTERVAL, RECEIPT_CACHE_SIZE
+from database import get_redis
+from metrics import receipt_events
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptBuffer:
+    def __init__(self):
+        self.marks = OrderedDict()  # {(username, conv_id): [delivered_id, read_id]} - ma’lum chegaralar (LRU)
+        self.outbox = {}  # {(username, conv_id): receiver yoki None (xona)} - yuborilmagan freymlar
+        self.dirty = set()  # DB’ga yozilmagan (username, conv_id)
+        self.redis = None
+        self._task = None
+
+    async def start(self):
+        self.redis = get_redis()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush_db()
+        except Exception as e:
+            logger.error(f"Receipt’lar yozilmadi: {str(e)}")
+
+    def record(self, username: str, conv_id: str, receiver, delivered_id: int = 0, read_id: int = 0) -> bool:
+        # O‘qilgan xabar yetkazilgan ham. Qaytadi: chegara surildimi (False - eski/takroriy freym)
+        key = (username, conv_id)
+        delivered_id = max(delivered_id, read_id)
+        mark = self.marks.get(key)
+        if mark is None:
+            if len(self.marks) >= RECEIPT_CACHE_SIZE:
+                self._evict()
+            mark = self.marks[key] = [0, 0]
+        else:
+            self.marks.move_to_end(key)
+        if delivered_id <= mark[0] and read_id <= mark[1]:
+            receipt_events.inc("stale")
+            return False
+        mark[0] = max(mark[0], delivered_id)
+        mark[1] = max(mark[1], read_id)
+        self.outbox[key] = receiver
+        self.dirty.add(key)
+        receipt_events.inc("recorded")
+        return True
+
+    def _evict(self):
+        # Eng eski, yozilishi kutilmayotgan chegara o‘chiriladi (DB’da baribir saqlangan). Hammasi
+        # kutilayotgan bo‘lsa, hech biri o‘chirilmaydi - keyingi flush’dan so‘ng bo‘shaydi
+        for key in self.marks:
+            if key not in self.dirty and key not in self.outbox:
+                del self.marks[key]
+                return
+
+    async def flush_frames(self):
+        if not self.outbox:
+            return
+        outbox, self.outbox = self.outbox, {}
+        pipe = self.redis.pipeline(transaction=False)
+        for (username, conv_id), receiver in outbox.items():
+            delivered_id, read_id = self.marks[(username, conv_id)]
+            frame = Frame({
+                "action": "receipt",
+                "conversation_id": conv_id,
+                "username": username,
+                "delivered_id": delivered_id,
+                "read_id": read_id,
+            })
+            if receiver is None:
+                await broker.publish_room(conv_id, frame, pipe=pipe)
+            else:
+                await broker.publish(receiver, frame, pipe=pipe)
+        if len(pipe):
+            await pipe.execute()
+        receipt_events.inc("frames", amount=len(outbox))
+
+    async def flush_db(self):
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, set()
+        rows = [(username, conv_id, *self.marks[(username, conv_id)]) for username, conv_id in dirty]
+        try:
+            try:
+                await crud.save_receipts(rows)
+            except (asyncpg.DataError, ValueError):
+                # Yozib bo‘lmaydigan qator (masalan, BIGINT’ga sig‘maydigan id) har flush’da butun
+                # so‘rovni yiqitmasligi uchun: bittadan yoziladi, yaroqsizlari tashlanadi
+                for row in rows:
+                    await self._save_one(row)
+                return
+        except BaseException:
+            # Keyingi flush’da qayta urinadi (oraliqda yangilangan chegaralar ham qo‘shiladi)
+            self.dirty |= dirty
+            raise
+        receipt_events.inc("written", amount=len(rows))
+
+    async def _save_one(self, row):
+        try:
+            await crud.save_receipts([row])
+        except (asyncpg.DataError, ValueError) as e:
+            logger.error(f"Receipt tashlandi {row}: {str(e)}")
+            receipt_events.inc("dropped")
+            return
+        receipt_events.inc("written")
+
+    async def _flush_loop(self):
+        last_db_flush = time.monotonic()
+        while True:
+            try:
+                await asyncio.sleep(RECEIPT_FRAME_INTERVAL)
+                await self.flush_frames()
+                if time.monotonic() - last_db_flush >= RECEIPT_FLUSH_INTERVAL:
+                    last_db_flush = time.monotonic()
+                    await self.flush_db()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Receipt flush xatosi: {str(e)}")
+
+
+receipts = ReceiptBuffer()
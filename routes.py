@@ -1,124 +1,283 @@
-from fastapi import APIRouter, HTTPException, UploadFile, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, Form, Depends, Request
 from fastapi.staticfiles import StaticFiles
-from config import app, CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET
-from models import UserRegister, UserLogin, PasswordReset, VerifyResetCode, NewPassword
-import psycopg2
-from fastapi.responses import JSONResponse
+from config import app, LOG_LEVEL, USER_SEARCH_CACHE_TTL
+from models import (
+    UserRegister, UserLogin, PasswordReset, VerifyResetCode, NewPassword, RoomCreate, RoomMembers, UploadCreate,
+)
+import asyncpg
+from fastapi.responses import JSONResponse, Response
+import asyncio
 import os
 import random
-from database import get_db
-from utils import hash_password, send_reset_code
-import cloudinary
-import cloudinary.uploader
+from typing import Optional
+from database import acquire, get_redis
+import cache
+import codec
+import crud
+import conversation
+from metrics import user_search_cache
+import passwords
+from mailer import mailer, MailQueueFull
+import storage
+from auth import tokens, current_user, require_user, ensure_user, token_from, TokenError
+from broker import broker, ROOM_REMOVED
+from codec import Frame
 import logging
 
 router = APIRouter()
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
-cloudinary.config(
-    cloud_name=CLOUDINARY_CLOUD_NAME,
-    api_key=CLOUDINARY_API_KEY,
-    api_secret=CLOUDINARY_API_SECRET
-)
-
 
 @router.post("/register")
-async def register(user: UserRegister, db=Depends(get_db)):
-    with db as conn:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        hashed_password = hash_password(user.password)
-        try:
-            cursor.execute(
-                "INSERT INTO users (username, email, password) VALUES (%s, %s, %s)",
-                (user.username, user.email, hashed_password)
+async def register(user: UserRegister):
+    hashed_password = await passwords.hash_password(user.password)
+    try:
+        async with acquire("register") as conn:
+            await conn.execute(
+                "INSERT INTO users (username, email, password) VALUES ($1, $2, $3)",
+                user.username, user.email, hashed_password
             )
-            conn.commit()
-            return {"message": "Foydalanuvchi muvaffaqiyatli ro‘yxatdan o‘tdi"}
-        except psycopg2.IntegrityError:
-            raise HTTPException(status_code=400, detail="Username yoki email allaqachon mavjud")
+        return {"message": "Foydalanuvchi muvaffaqiyatli ro‘yxatdan o‘tdi"}
+    except asyncpg.UniqueViolationError:
+        raise HTTPException(status_code=400, detail="Username yoki email allaqachon mavjud")
 
 
 @router.post("/login")
-async def login(user: UserLogin, db=Depends(get_db)):
-    with db as conn:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        hashed_password = hash_password(user.password)
-        cursor.execute(
-            "SELECT * FROM users WHERE username = %s AND password = %s",
-            (user.username, hashed_password)
-        )
-        result = cursor.fetchone()
-        if result:
-            return {"message": "Kirish muvaffaqiyatli", "username": result["username"]}
+async def login(user: UserLogin):
+    async with acquire("login") as conn:
+        result = await conn.fetchrow("SELECT username, password FROM users WHERE username = $1", user.username)
+    stored = result["password"] if result else None
+    if not await passwords.verify_password(user.password, stored):
         raise HTTPException(status_code=401, detail="Username yoki parol noto‘g‘ri")
+    if passwords.needs_rehash(stored):
+        # Eski SHA-256 (yoki eski parametrli) xesh joriy scrypt bilan almashtiriladi
+        new_hash = await passwords.hash_password(user.password)
+        async with acquire("login_rehash") as conn:
+            await conn.execute(
+                "UPDATE users SET password = $1 WHERE username = $2 AND password = $3",
+                new_hash, result["username"], stored
+            )
+    # Token keyingi so‘rovlarda "Authorization: Bearer" yoki WebSocket’da ?token= bilan yuboriladi
+    token, expires_at = tokens.issue(result["username"])
+    return {"message": "Kirish muvaffaqiyatli", "username": result["username"], "token": token, "expires_at": expires_at}
+
+
+@router.post("/logout")
+async def logout(request: Request):
+    # Token bekor qilinadi (barcha workerlarda), muddati tugaguncha qabul qilinmaydi
+    token = token_from(request)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Token talab qilinadi")
+    try:
+        await tokens.revoke(token)
+    except TokenError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"message": "Chiqildi"}
 
 
 @router.post("/reset-password")
-async def reset_password(data: PasswordReset, db=Depends(get_db)):
+async def reset_password(data: PasswordReset):
+    if not mailer.enabled:
+        raise HTTPException(status_code=503, detail="Email yuborish sozlanmagan")
+    if not await mailer.allow(data.email):
+        raise HTTPException(status_code=429, detail="Juda ko‘p urinish, keyinroq qayta urinib ko‘ring")
     reset_code = ''.join([str(random.randint(0, 9)) for _ in range(6)])
-    with db as conn:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute("UPDATE users SET reset_code = %s WHERE email = %s", (reset_code, data.email))
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Email topilmadi")
-        conn.commit()
-
-    send_reset_code(data.email, reset_code)
+    async with acquire("reset_password") as conn:
+        result = await conn.execute("UPDATE users SET reset_code = $1 WHERE email = $2", reset_code, data.email)
+    if result == "UPDATE 0":
+        raise HTTPException(status_code=404, detail="Email topilmadi")
+
+    # SMTP kutilmaydi: xat navbatga qo‘yiladi, mailer workeri yuboradi
+    try:
+        mailer.send_reset_code(data.email, reset_code)
+    except MailQueueFull:
+        raise HTTPException(status_code=503, detail="Server band, keyinroq urinib ko‘ring")
     return {"message": "Tiklash kodi emailingizga yuborildi"}
 
 
 @router.post("/verify-reset-code")
-async def verify_reset_code(data: VerifyResetCode, db=Depends(get_db)):
-    with db as conn:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute(
-            "SELECT * FROM users WHERE email = %s AND reset_code = %s",
-            (data.email, data.reset_code)
+async def verify_reset_code(data: VerifyResetCode):
+    async with acquire("verify_reset_code") as conn:
+        result = await conn.fetchrow(
+            "SELECT 1 FROM users WHERE email = $1 AND reset_code = $2",
+            data.email, data.reset_code
         )
-        result = cursor.fetchone()
-        if result:
-            return {"message": "Kod to‘g‘ri"}
-        raise HTTPException(status_code=400, detail="Kod noto‘g‘ri yoki email topilmadi")
+    if result:
+        return {"message": "Kod to‘g‘ri"}
+    raise HTTPException(status_code=400, detail="Kod noto‘g‘ri yoki email topilmadi")
 
 
 @router.post("/set-new-password")
-async def set_new_password(data: NewPassword, db=Depends(get_db)):
-    with db as conn:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        hashed_password = hash_password(data.new_password)
-        cursor.execute(
-            "UPDATE users SET password = %s, reset_code = NULL WHERE email = %s",
-            (hashed_password, data.email)
+async def set_new_password(data: NewPassword):
+    hashed_password = await passwords.hash_password(data.new_password)
+    async with acquire("set_new_password") as conn:
+        result = await conn.execute(
+            "UPDATE users SET password = $1, reset_code = NULL WHERE email = $2",
+            hashed_password, data.email
         )
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Email topilmadi")
-        conn.commit()
-        return {"message": "Yangi parol muvaffaqiyatli o‘rnatildi"}
+    if result == "UPDATE 0":
+        raise HTTPException(status_code=404, detail="Email topilmadi")
+    return {"message": "Yangi parol muvaffaqiyatli o‘rnatildi"}
 
 
 @router.get("/users")
-async def get_users(query: str = "", db=Depends(get_db)):
-    with db as conn:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute("SELECT username FROM users WHERE username ILIKE %s", (f"%{query}%",))
-        users = cursor.fetchall()
-        return [{"username": user["username"]} for user in users]
+async def get_users(query: str = "", limit: Optional[int] = None, cursor: Optional[str] = None):
+    # Javob avvalgidek username’lar ro‘yxati (avval prefiks mosliklar); keyingi sahifa kursori
+    # X-Next-Cursor sarlavhasida, u ?cursor= bilan qaytariladi. Birinchi sahifalar Redis’da keshlanadi
+    limit = crud.clamp_search_limit(limit)
+    use_cache = cursor is None and USER_SEARCH_CACHE_TTL > 0
+    redis = get_redis()
+    cached = await cache.get_search(redis, query, limit) if use_cache else None
+    if cached is not None:
+        user_search_cache.inc("hit")
+        body, next_cursor = cached
+    else:
+        try:
+            usernames, next_cursor = await crud.search_users(query, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        body = codec.dumps([{"username": username} for username in usernames])
+        if use_cache:
+            user_search_cache.inc("miss")
+            await cache.set_search(redis, query, limit, body, next_cursor)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/messages/{username}/{receiver}")
+async def get_messages(
+    username: str, receiver: str, before_id: Optional[int] = None, limit: Optional[int] = None,
+    user: Optional[str] = Depends(current_user),
+):
+    ensure_user(user, username)
+    # WebSocket "fetch" bilan bir xil: eng oxirgi sahifa, eskilari before_id orqali
+    messages, has_more = await crud.fetch_history(conversation.conversation_id(username, receiver), before_id, limit)
+    return {
+        "messages": [m.to_wire() for m in messages],
+        "before_id": messages[0].msg_id if messages else before_id,
+        "has_more": has_more,
+    }
+
+@router.post("/rooms")
+async def create_room(data: RoomCreate, user: Optional[str] = Depends(current_user)):
+    ensure_user(user, data.creator)
+    try:
+        return await crud.create_room(data.name, data.creator, data.members)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def ensure_room_owner(room_id: int, user: str):
+    # A’zolarni faqat xona egasi boshqaradi: xona yo‘q - 404, boshqa foydalanuvchi - 403
+    owner = await crud.room_owner(room_id)
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Xona topilmadi")
+    if owner != user:
+        raise HTTPException(status_code=403, detail="Faqat xona egasi a’zolarni o‘zgartira oladi")
+
+
+@router.post("/rooms/{room_id}/members")
+async def add_room_members(room_id: int, data: RoomMembers, user: str = Depends(require_user)):
+    await ensure_room_owner(room_id, user)
+    try:
+        found = await crud.add_room_members(room_id, data.usernames)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="Xona topilmadi")
+    return {"message": "A’zolar qo‘shildi"}
+
+
+@router.delete("/rooms/{room_id}/members/{username}")
+async def remove_room_member(room_id: int, username: str, user: str = Depends(require_user)):
+    # Egasi istalgan a’zoni chiqaradi, a’zo esa faqat o‘zini (xonadan chiqish)
+    if user != username:
+        await ensure_room_owner(room_id, user)
+    if not await crud.remove_room_member(room_id, username):
+        raise HTTPException(status_code=404, detail="A’zo topilmadi")
+    # Chiqarilgan foydalanuvchining ochiq socketlari (istalgan workerda) xonadan ajratiladi
+    conv_id = conversation.room_conversation_id(room_id)
+    await broker.publish(username, Frame({"action": ROOM_REMOVED, "conversation_id": conv_id}))
+    return {"message": "A’zo xonadan chiqarildi"}
+
+
+@router.get("/users/{username}/rooms")
+async def get_user_rooms(username: str, user: Optional[str] = Depends(current_user)):
+    ensure_user(user, username)
+    return await crud.user_rooms(username)
+
+
+@router.get("/rooms/{room_id}/messages")
+async def get_room_messages(
+    room_id: int, before_id: Optional[int] = None, limit: Optional[int] = None,
+    user: str = Depends(require_user),
+):
+    # WebSocket "subscribe" bilan bir xil: tarixni faqat a’zolar o‘qiydi
+    if not await crud.is_room_member(room_id, user):
+        raise HTTPException(status_code=403, detail="Siz bu xona a’zosi emassiz")
+    messages, has_more = await crud.fetch_history(conversation.room_conversation_id(room_id), before_id, limit)
+    return {
+        "messages": [m.to_wire() for m in messages],
+        "before_id": messages[0].msg_id if messages else before_id,
+        "has_more": has_more,
+    }
 
 @router.post("/upload")
-async def upload_file(file: UploadFile, sender: str = Form(...), receiver: str = Form(...)):
+async def upload_file(
+    file: UploadFile, sender: str = Form(...), receiver: str = Form(...),
+    user: Optional[str] = Depends(current_user),
+):
+    # Bitta so‘rovda yuklash (kichik fayllar); katta fayllar uchun /uploads (davom ettiriladigan)
+    ensure_user(user, sender)
     logger.info(f"Upload so‘rovi: sender={sender}, receiver={receiver}, file={file.filename}")
     try:
-        upload_result = cloudinary.uploader.upload(file.file,
-            folder="chatapp_media",
-            resource_type="auto"  # Cloudinary fayl turini avtomatik aniqlaydi (.ogg qoladi)
-        )
-        file_url = upload_result["secure_url"]
-        logger.info(f"Uploaded to Cloudinary: {file_url}")
-        return {"file_url": file_url}
+        file_url = await storage.storage.save(file.file, file.filename)
+    except asyncio.TimeoutError:
+        raise
     except Exception as e:
-        logger.error(f"Cloudinary yuklash xatosi: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Cloudinary yuklash xatosi: {str(e)}")
+        logger.error(f"Yuklash xatosi: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Yuklash xatosi: {str(e)}")
+    logger.info(f"Yuklandi: {file_url}")
+    return {"file_url": file_url}
+
+
+@router.post("/uploads")
+async def create_upload(data: UploadCreate, user: str = Depends(require_user)):
+    # Davom ettiriladigan yuklash sessiyasi: upload_id va tavsiya etilgan chunk_size qaytadi
+    ensure_user(user, data.sender)
+    try:
+        return await storage.create_upload(data.filename, data.size, data.sender, data.receiver)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str, user: str = Depends(require_user)):
+    # Uzilishdan keyin: qaysi offset’dan davom ettirish kerak
+    try:
+        status = await storage.upload_status(upload_id, user)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Yuklash sessiyasi topilmadi")
+    return status
+
+
+@router.put("/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, offset: int, request: Request, user: str = Depends(require_user)):
+    # So‘rov tanasi (bo‘lak) xotiraga to‘liq yig‘ilmasdan oqim sifatida diskka yoziladi
+    try:
+        status = await storage.write_chunk(upload_id, offset, request.stream(), user)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except storage.UploadOffsetError as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "offset": e.offset})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Yuklash sessiyasi topilmadi")
+    return status
 
 app.include_router(router)
 
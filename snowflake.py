@@ -0,0 +1,111 @@
+# snowflake.py
+# Xabar id’larini DB’ga murojaat qilmasdan oldindan ajratish (snowflake).
+# Tuzilishi (53 bit - JavaScript Number uchun xavfsiz):
+#   41 bit - EPOCH dan beri millisekund, 5 bit - worker raqami, 7 bit - shu millisekunddagi tartib raqami
+# Id’lar vaqt bo‘yicha o‘sib boradi va eski SERIAL id’lardan har doim katta,
+# shuning uchun keyset pagination (id bo‘yicha) o‘zgarmaydi.
+#
+# Worker raqami Redis’da ijaraga olinadi: snowflake:worker:<n> SET NX EX, fon vazifasi
+# SNOWFLAKE_LEASE_TTL/3 da yangilaydi. Bo‘sh raqam bo‘lmasa ishga tushish xato bilan to‘xtaydi
+# (ikki tirik worker bir xil raqam bilan bir xil id chiqarmasligi uchun). Ijara yo‘qotilsa va
+# qayta olinmasa, id berish to‘xtatiladi.
+import asyncio
+import secrets
+import time
+import logging
+from config import SNOWFLAKE_LEASE_TTL
+
+logger = logging.getLogger(__name__)
+
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 5
+SEQUENCE_BITS = 7
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+LEASE_PREFIX = "snowflake:worker:"
+
+# Ijara faqat egasi tomonidan yangilanadi/o‘chiriladi
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SnowflakeGenerator:
+    def __init__(self, worker_id: int = None):
+        self.worker_id = worker_id
+        self.last_ms = -1
+        self.sequence = 0
+        self.redis = None
+        self.token = secrets.token_hex(8)
+        self._renew = None
+        self._release = None
+        self._task = None
+
+    async def init(self, redis):
+        # Har bir workerga Redis orqali alohida raqam ijaraga beriladi (32 tagacha tirik worker)
+        self.redis = redis
+        self._renew = redis.register_script(RENEW_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+        for worker_id in range(MAX_WORKER + 1):
+            if await redis.set(LEASE_PREFIX + str(worker_id), self.token, nx=True, ex=SNOWFLAKE_LEASE_TTL):
+                self.worker_id = worker_id
+                break
+        else:
+            raise RuntimeError(f"Snowflake: bo‘sh worker raqami yo‘q ({MAX_WORKER + 1} tasi band)")
+        self._task = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"Snowflake worker_id={self.worker_id}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.worker_id is not None and self.redis is not None:
+            await self._release(keys=[LEASE_PREFIX + str(self.worker_id)], args=[self.token])
+            self.worker_id = None
+
+    async def _heartbeat_loop(self):
+        key = LEASE_PREFIX + str(self.worker_id)
+        while True:
+            await asyncio.sleep(SNOWFLAKE_LEASE_TTL / 3)
+            try:
+                if await self._renew(keys=[key], args=[self.token, SNOWFLAKE_LEASE_TTL]):
+                    continue
+                # Ijara muddati o‘tib ketgan: raqam bo‘sh bo‘lsa qayta olinadi, aks holda id berilmaydi
+                if not await self.redis.set(key, self.token, nx=True, ex=SNOWFLAKE_LEASE_TTL):
+                    logger.critical(f"Snowflake worker_id={self.worker_id} boshqa jarayonga o‘tdi, id berish to‘xtatildi")
+                    self.worker_id = None
+                    return
+                logger.warning(f"Snowflake worker_id={self.worker_id} ijarasi qayta olindi")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Snowflake ijarasini yangilash xatosi: {str(e)}")
+
+    async def next_id(self) -> int:
+        if self.worker_id is None:
+            raise RuntimeError("Snowflake worker raqami yo‘q (init chaqirilmagan yoki ijara yo‘qotilgan)")
+        while True:
+            # Soat orqaga ketsa, oxirgi millisekund davom ettiriladi
+            now = max(int(time.time() * 1000), self.last_ms)
+            if now > self.last_ms:
+                self.last_ms = now
+                self.sequence = 0
+                break
+            if self.sequence < MAX_SEQUENCE:
+                self.sequence += 1
+                break
+            # Shu millisekunddagi raqamlar tugadi - event loop’ni band qilmasdan keyingisini kutamiz
+            await asyncio.sleep(max(0.0, (self.last_ms + 1) / 1000 - time.time()))
+        return ((self.last_ms - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self.sequence
+
+
+ids = SnowflakeGenerator()
@@ -0,0 +1,243 @@
+# storage.py
+# Media fayllarni saqlash. Sinxron SDK/disk ishlari event loop’da emas, thread’da bajariladi
+# (aks holda 100 MB yuklash davomida jarayondagi barcha socketlar qotib qoladi), bir vaqtdagi
+# tashqi yuklashlar UPLOAD_CONCURRENCY bilan cheklanadi.
+#   STORAGE_BACKEND=cloudinary - cloudinary.uploader.upload_large (bo‘laklab yuboradi)
+#   STORAGE_BACKEND=local      - LOCAL_STORAGE_DIR, main.py uni LOCAL_STORAGE_URL da beradi
+#
+# Davom ettiriladigan (resumable) yuklash: POST /uploads sessiya ochadi, PUT /uploads/{id}?offset=
+# bo‘laklarni yozadi, GET /uploads/{id} qayerdan davom ettirishni aytadi. Qabul qilingan baytlar
+# UPLOAD_TMP_DIR dagi .part faylga yoziladi (offset = fayl hajmi), aloqa uzilsa yozilgani saqlanib
+# qoladi. Fayl to‘lgach backend’ga uzatiladi. Sessiyalar diskda: bir hostdagi workerlar umumiy
+# UPLOAD_TMP_DIR bilan ishlaydi, bir nechta node’da bitta yuklash bitta node’ga yo‘naltirilishi kerak.
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+import cloudinary
+import cloudinary.uploader
+from config import (
+    STORAGE_BACKEND, LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL, UPLOAD_TMP_DIR, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_SIZE,
+    UPLOAD_CONCURRENCY, UPLOAD_QUEUE_TIMEOUT, UPLOAD_SESSION_TTL,
+    CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET,
+)
+
+logger = logging.getLogger(__name__)
+
+# Diskka yozishdan oldin yig‘iladigan hajm: har bir kichik freym uchun thread chaqirilmaydi
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadOffsetError(ValueError):
+    # Klient yuborgan offset serverdagi bilan mos emas - klient offset’dan davom ettirishi kerak
+    def __init__(self, offset: int):
+        super().__init__(f"Offset mos emas, joriy offset: {offset}")
+        self.offset = offset
+
+
+class Storage(ABC):
+    def __init__(self):
+        self.slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def save(self, src, filename: str) -> str:
+        # src - fayl yo‘li yoki ochiq fayl obyekti; qaytadi: ommaviy URL.
+        # Navbat UPLOAD_QUEUE_TIMEOUT dan uzoq bo‘lsa asyncio.TimeoutError (main.py - 503)
+        await asyncio.wait_for(self.slots.acquire(), UPLOAD_QUEUE_TIMEOUT)
+        try:
+            return await asyncio.to_thread(self._save, src, filename)
+        finally:
+            self.slots.release()
+
+    @abstractmethod
+    def _save(self, src, filename: str) -> str:
+        # Sinxron yuklash (thread’da chaqiriladi); qaytadi: ommaviy URL
+        ...
+
+
+class CloudinaryStorage(Storage):
+    def __init__(self):
+        super().__init__()
+        cloudinary.config(
+            cloud_name=CLOUDINARY_CLOUD_NAME,
+            api_key=CLOUDINARY_API_KEY,
+            api_secret=CLOUDINARY_API_SECRET
+        )
+
+    def _save(self, src, filename: str) -> str:
+        result = cloudinary.uploader.upload_large(
+            src,
+            folder="chatapp_media",
+            resource_type="auto",  # Cloudinary fayl turini avtomatik aniqlaydi (.ogg qoladi)
+            chunk_size=UPLOAD_CHUNK_SIZE,
+        )
+        return result["secure_url"]
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str, base_url: str):
+        super().__init__()
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(root, exist_ok=True)
+
+    def _save(self, src, filename: str) -> str:
+        name = uuid.uuid4().hex + os.path.splitext(filename or "")[1].lower()
+        dest = os.path.join(self.root, name)
+        if isinstance(src, str):
+            shutil.move(src, dest)
+        else:
+            with open(dest, "wb") as out:
+                shutil.copyfileobj(src, out, UPLOAD_CHUNK_SIZE)
+        return f"{self.base_url}/{name}"
+
+
+def create_storage():
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL)
+    return CloudinaryStorage()
+
+
+storage = create_storage()
+
+
+# --- davom ettiriladigan yuklash sessiyalari ---
+
+_locks = {}  # {upload_id: [asyncio.Lock, kutayotgan/ishlayotgan PUT’lar soni]} - bitta sessiyaga bitta PUT
+
+
+@asynccontextmanager
+async def _session_lock(upload_id: str):
+    # Lock faqat PUT’lar davomida lug‘atda turadi: oxirgisi chiqqanda o‘chiriladi (tugagan, muddati
+    # o‘tgan yoki tashlab ketilgan sessiyalar lock’lari to‘planib qolmaydi)
+    entry = _locks.get(upload_id)
+    if entry is None:
+        entry = _locks[upload_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _locks[upload_id]
+
+
+def _paths(upload_id: str):
+    base = os.path.join(UPLOAD_TMP_DIR, upload_id)
+    return base + ".json", base + ".part"
+
+
+def _sweep_expired(active):
+    # Tugallanmay qolgan eski sessiyalar fayllari. Sessiya bo‘yicha (.json va .part birga) eng so‘nggi
+    # o‘zgarish vaqti olinadi: .json faqat yaratilganda yoziladi, davom etayotgan yuklashda .part
+    # yangilanib turadi. active - shu workerda PUT ishlayotgan sessiyalar, ular o‘chirilmaydi
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    sessions = {}
+    for name in os.listdir(UPLOAD_TMP_DIR):
+        upload_id = os.path.splitext(name)[0]
+        try:
+            mtime = os.path.getmtime(os.path.join(UPLOAD_TMP_DIR, name))
+        except OSError:
+            continue
+        sessions[upload_id] = max(mtime, sessions.get(upload_id, 0))
+    for upload_id, mtime in sessions.items():
+        if mtime < cutoff and upload_id not in active:
+            _remove_session(upload_id)
+
+
+def _create_session(meta: dict, active):
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    _sweep_expired(active)
+    meta_path, part_path = _paths(meta["upload_id"])
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    open(part_path, "wb").close()
+
+
+def _load_session(upload_id: str):
+    meta_path, part_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["offset"] = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        return None
+    return meta
+
+
+def _remove_session(upload_id: str):
+    for path in _paths(upload_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+async def create_upload(filename: str, size: int, sender: str, receiver: str) -> dict:
+    if size <= 0 or size > UPLOAD_MAX_SIZE:
+        raise ValueError(f"Fayl hajmi 1 bayt va {UPLOAD_MAX_SIZE} bayt orasida bo‘lishi kerak")
+    meta = {
+        "upload_id": uuid.uuid4().hex,
+        "filename": filename,
+        "size": size,
+        "sender": sender,
+        "receiver": receiver,
+    }
+    await asyncio.to_thread(_create_session, meta, set(_locks))
+    return {**meta, "offset": 0, "chunk_size": UPLOAD_CHUNK_SIZE}
+
+
+def _check_owner(meta: dict, owner: str):
+    # Sessiya uni yaratgan foydalanuvchiga (sender) bog‘langan
+    if meta["sender"] != owner:
+        raise PermissionError("Yuklash sessiyasi boshqa foydalanuvchiga tegishli")
+
+
+async def upload_status(upload_id: str, owner: str):
+    # None - sessiya topilmadi (yoki muddati o‘tgan); boshqa foydalanuvchiniki - PermissionError
+    meta = await asyncio.to_thread(_load_session, upload_id)
+    if meta is not None:
+        _check_owner(meta, owner)
+    return meta
+
+
+async def write_chunk(upload_id: str, offset: int, chunks, owner: str):
+    # chunks - baytlarning async iteratori (request.stream()). Qaytadi: sessiya holati
+    # (tugagan bo‘lsa "file_url" bilan) yoki None - sessiya topilmadi
+    async with _session_lock(upload_id):
+        meta = await asyncio.to_thread(_load_session, upload_id)
+        if meta is None:
+            return None
+        _check_owner(meta, owner)
+        if offset != meta["offset"]:
+            raise UploadOffsetError(meta["offset"])
+        _, part_path = _paths(upload_id)
+        out = await asyncio.to_thread(open, part_path, "ab")
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                if meta["offset"] + len(buffer) + len(chunk) > meta["size"]:
+                    raise ValueError("Yuborilgan baytlar e’lon qilingan hajmdan ko‘p")
+                buffer += chunk
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await asyncio.to_thread(out.write, bytes(buffer))
+                    meta["offset"] += len(buffer)
+                    buffer.clear()
+        finally:
+            # Uzilishda ham qabul qilingani saqlanadi - klient GET bilan offset’ni olib davom ettiradi
+            if buffer:
+                await asyncio.to_thread(out.write, bytes(buffer))
+                meta["offset"] += len(buffer)
+            await asyncio.to_thread(out.close)
+        if meta["offset"] < meta["size"]:
+            return meta
+        # Backend xato bersa sessiya qoladi: offset=size va bo‘sh tanali PUT uzatishni qaytaradi
+        meta["file_url"] = await storage.save(part_path, meta["filename"])
+        await asyncio.to_thread(_remove_session, upload_id)
+    logger.info(f"Yuklash tugadi: {meta['filename']} ({meta['size']} bayt) -> {meta['file_url']}")
+    return meta
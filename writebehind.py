@@ -0,0 +1,197 @@
+# writebehind.py
+# Xabarlarni saqlash: oddiy rejimda har bir xabar darhol INSERT qilinadi; WRITE_BEHIND=1 da
+# xabar Redis stream’ga (bardoshli navbat) yoziladi, darhol yetkaziladi va fon vazifasi
+# ularni WRITE_BEHIND_BATCH_SIZE tadan bitta ko‘p qatorli INSERT bilan DB’ga yozadi.
+#
+# Stream consumer group orqali o‘qiladi: worker yiqilsa, tasdiqlanmagan yozuvlarni
+# boshqa worker XAUTOCLAIM bilan oladi. INSERT ON CONFLICT DO NOTHING - qayta yozish xavfsiz.
+import asyncio
+import json
+import logging
+import os
+import socket
+from datetime import datetime
+import asyncpg
+from redis.exceptions import ResponseError
+import crud
+from config import (
+    WRITE_BEHIND, WRITE_BEHIND_STREAM, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_MAX_RETRIES, WRITE_BEHIND_DEAD_STREAM,
+)
+from database import get_redis
+from snowflake import ids
+
+logger = logging.getLogger(__name__)
+
+GROUP = "persisters"
+CLAIM_IDLE_MS = 30000  # shuncha vaqt tasdiqlanmagan yozuvlar boshqa workerga o‘tadi
+DEAD_STREAM_MAXLEN = 100_000
+# Qatorning o‘zidagi xato (qayta urinish foyda bermaydi): Postgres data/constraint xatolari va
+# asyncpg’ning argumentni kodlay olmaslik xatosi (ValueError). Ulanish va timeout xatolari bunga
+# kirmaydi - ular butun batch’ni keyinroq qayta urinadi.
+ROW_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError, ValueError)
+
+# Hali yozilmagan xabarga kelgan o‘zgarishlar shu funksiyalar bilan qayta qo‘llanadi
+# (handler’dagi kabi suhbat va muallif bilan cheklangan)
+PATCH_OPS = {
+    "edit": lambda d: crud.edit_message(d["msg_id"], d["value"], d["conversation_id"], d["sender"]),
+    "delete": lambda d: crud.mark_deleted(d["msg_id"], d["conversation_id"], d["sender"]),
+    "delete_permanent": lambda d: crud.delete_message(d["msg_id"], d["conversation_id"], d["sender"]),
+    "react": lambda d: crud.set_reaction(d["msg_id"], d["value"], d["conversation_id"]),
+}
+
+
+class MessageWriter:
+    def __init__(self, enabled: bool = WRITE_BEHIND):
+        self.enabled = enabled
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self.redis = None
+        self._task = None
+
+    async def start(self):
+        self.redis = get_redis()
+        await ids.init(self.redis)
+        if not self.enabled:
+            return
+        try:
+            await self.redis.xgroup_create(WRITE_BEHIND_STREAM, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Write-behind yoqildi (batch={WRITE_BEHIND_BATCH_SIZE}, interval={WRITE_BEHIND_FLUSH_INTERVAL}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await ids.stop()
+
+    async def save_message(self, sender: str, receiver, content: str, reply_to_id=None, msg_type: str = "text",
+                           conv_id: str = None):
+        # Qaytadi: (msg_id, timestamp) - ikkalasi ham yetkaziladigan xabar bilan bir xil.
+        # Xona xabari: receiver None, conv_id = 'room:<id>'
+        msg_id = await ids.next_id()
+        timestamp = datetime.now()
+        if not self.enabled:
+            await crud.insert_message(msg_id, sender, receiver, content, reply_to_id, msg_type, timestamp, conv_id)
+            return msg_id, timestamp
+        row = {
+            "msg_id": msg_id, "sender": sender, "receiver": receiver, "content": content,
+            "reply_to_id": reply_to_id, "type": msg_type, "timestamp": timestamp.isoformat(),
+            "conversation_id": conv_id,
+        }
+        await self.redis.xadd(WRITE_BEHIND_STREAM, {"op": "insert", "data": json.dumps(row)})
+        return msg_id, timestamp
+
+    async def defer_update(self, op: str, msg_id, value, conv_id: str, sender: str, attempt: int = 0):
+        # UPDATE/DELETE 0 qator topdi: xabar hali navbatda bo‘lishi mumkin, keyinroq qayta urinamiz
+        if not self.enabled:
+            return
+        if attempt >= WRITE_BEHIND_MAX_RETRIES:
+            logger.warning(f"Write-behind: {op} msg_id={msg_id} qo‘llanmadi, xabar topilmadi")
+            return
+        data = {"msg_id": msg_id, "value": value, "conversation_id": conv_id, "sender": sender, "attempt": attempt}
+        await self.redis.xadd(WRITE_BEHIND_STREAM, {"op": op, "data": json.dumps(data)})
+
+    async def _flush_loop(self):
+        # Avval o‘zimizdagi tasdiqlanmagan yozuvlar ("0"), keyin yangilari (">")
+        read_id = "0"
+        loops = 0
+        while True:
+            try:
+                if loops % 100 == 0:
+                    await self._claim_stale()
+                loops += 1
+                response = await self.redis.xreadgroup(
+                    GROUP, self.consumer, {WRITE_BEHIND_STREAM: read_id},
+                    count=WRITE_BEHIND_BATCH_SIZE, block=int(WRITE_BEHIND_FLUSH_INTERVAL * 1000)
+                )
+                entries = response[0][1] if response else []
+                if not entries:
+                    read_id = ">"
+                    continue
+                await self._flush(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Write-behind flush xatosi: {str(e)}")
+                read_id = "0"
+                await asyncio.sleep(1)
+
+    async def _claim_stale(self):
+        # Yiqilgan workerlarning tasdiqlanmagan yozuvlarini o‘zimizga olish
+        _, claimed, *_ = await self.redis.xautoclaim(
+            WRITE_BEHIND_STREAM, GROUP, self.consumer, min_idle_time=CLAIM_IDLE_MS,
+            start_id="0-0", count=WRITE_BEHIND_BATCH_SIZE
+        )
+        if claimed:
+            await self._flush([entry for entry in claimed if entry[1]])
+
+    async def _flush(self, entries):
+        inserts, patches = [], []
+        for entry_id, fields in entries:
+            data = json.loads(fields[b"data"])
+            if fields[b"op"] == b"insert":
+                data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+                inserts.append(data)
+            else:
+                patches.append((fields[b"op"].decode(), data))
+
+        if inserts:
+            try:
+                await crud.insert_messages_batch(inserts)
+            except ROW_ERRORS:
+                # Batch’da yozib bo‘lmaydigan qator bor - bittadan yoziladi, qolganlari to‘xtab qolmaydi
+                for row in inserts:
+                    await self._insert_one(row)
+        # O‘zgarishlar INSERT’lardan keyin, kelgan tartibida
+        for op, data in patches:
+            if "conversation_id" not in data:
+                # Eski versiyadan qolgan, suhbat ko‘rsatilmagan o‘zgarish - qo‘llanmaydi
+                logger.warning(f"Write-behind: {op} msg_id={data['msg_id']} suhbatsiz, tashlandi")
+                continue
+            try:
+                applied = await PATCH_OPS[op](data)
+            except ROW_ERRORS as e:
+                await self._dead_letter(op, data, e)
+                continue
+            if not applied:
+                await self.defer_update(
+                    op, data["msg_id"], data["value"], data["conversation_id"], data["sender"], data["attempt"] + 1
+                )
+
+        ids_done = [entry_id for entry_id, _ in entries]
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xack(WRITE_BEHIND_STREAM, GROUP, *ids_done)
+        pipe.xdel(WRITE_BEHIND_STREAM, *ids_done)
+        await pipe.execute()
+
+
+    async def _insert_one(self, row: dict):
+        try:
+            try:
+                await crud.insert_messages_batch([row])
+            except asyncpg.ForeignKeyViolationError:
+                # reply_to_id hali yozilmagan xabarga ishora qiladi - qayta navbatga
+                row["attempt"] = row.get("attempt", 0) + 1
+                if row["attempt"] < WRITE_BEHIND_MAX_RETRIES:
+                    row["timestamp"] = row["timestamp"].isoformat()
+                    await self.redis.xadd(WRITE_BEHIND_STREAM, {"op": "insert", "data": json.dumps(row)})
+                    return
+                # Javob berilgan xabar o‘chirilgan: ON DELETE SET NULL bilan bir xil natija
+                row["reply_to_id"] = None
+                await crud.insert_messages_batch([row])
+        except ROW_ERRORS as e:
+            await self._dead_letter("insert", row, e)
+
+    async def _dead_letter(self, op: str, data: dict, error: Exception):
+        logger.error(f"Write-behind: {op} msg_id={data.get('msg_id')} yozilmadi, {WRITE_BEHIND_DEAD_STREAM} ga o‘tkazildi: {str(error)}")
+        await self.redis.xadd(
+            WRITE_BEHIND_DEAD_STREAM,
+            {"op": op, "data": json.dumps(data, default=str), "error": str(error)},
+            maxlen=DEAD_STREAM_MAXLEN, approximate=True,
+        )
+
+
+writer = MessageWriter()